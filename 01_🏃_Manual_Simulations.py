@@ -1,11 +1,16 @@
 import streamlit as st
+import matplotlib.pyplot as plt
 import time
-from miscellanious_functions import DepotsAndNodesPairsLists, MDVRPModelInstances, RoutingInfoContainer, SolutionPlot, SolutionMetricsFinder
-from ClarkeAndWrightSavingsAlgorithm import ClarkeAndWrightSavingsAlgorithmWithVehConstraint
-from MDVRP_KMeansFunc import KMeansClusteringBasedNodesSelection
-from MDVRP_HierClustFunc import HierClusteringBasedNodeSelection
+import io
+import pandas as pd
+from miscellanious_functions import MDVRPModelInstances, MDVRPSolve, SolutionPlot, PlotLabelsMaxNodes, RoutingHeuristics
+from MDVRP_Profiling import RecordStageTimings, ProfileRun
+from MDVRP_Runtime import ConfigureRuntime, ThreadingInfo
+from MDVRP_Portfolio import PortfolioSolve
 
 
+ConfigureRuntime()
+
 st.set_page_config(page_title = "Multi-Depot Vehicle Routing Problem Simulator", 
 page_icon="🚚", 
 layout="wide"
@@ -80,42 +85,146 @@ with st.sidebar:
     ('KMeans-Clustering-Based Clarke & Wright Heuristic ', 
     'Hierarchical-Clustering-Based Clarke & Wright Heuristic (Ward Linkage) ',
     'Hierarchical-Clustering-Based Clarke & Wright Heuristic (Complete Linkage) ',
-    'Hierarchical-Clustering-Based Clarke & Wright Heuristic (Average Linkage) '))
+    'Hierarchical-Clustering-Based Clarke & Wright Heuristic (Average Linkage) ',
+    'Nearest-Depot (Voronoi) Clarke & Wright Heuristic ',
+    'Nearest-Depot (Voronoi) Clarke & Wright Heuristic with Capacity Overflow ',
+    'Capacity-Aware Assignment (Transportation Problem) Clarke & Wright Heuristic ',
+    'Portfolio: Best Of All Heuristics (Run In Parallel) '))
+
+    deadline = st.number_input('Portfolio deadline (sec) ⏱️',
+    min_value=0, 
+    max_value=600, 
+    value=0, 
+    step=1, 
+    help="Only used by the portfolio: the heuristics that have not finished after this many seconds are cancelled (0 means no deadline)"
+    )
 
+    routing = st.selectbox(
+    'Choose a Routing Algorithm:',
+    ('Clarke & Wright Savings Algorithm ', 
+    'Sweep Algorithm ', 
+    'Route-First Cluster-Second Algorithm (Prins Split) '),
+    help="The algorithm that builds the routes of every depot. The Sweep Algorithm is the fastest one on large instances")
 
-# Initializing the problem instances
-inst = MDVRPModelInstances(noc, nos, nov, nod, nog, novc, nomd) 
-xx = inst["allxs"]        
-yy = inst["allys"]
-all_ids = inst["allIds"]
+    st.subheader("Profiling")
 
-stime = time.time()
-cpu_stime = time.process_time()
+    trace_memory = st.checkbox('Trace peak memory per stage 🧠', 
+    value=False, 
+    help="Measures the peak memory of each stage with tracemalloc. This slows down the solve"
+    )
 
-# Creating the dictionary with depots-nodes pairs (Selection phase)
-DictOfDepotsAndNodesPairs = None
+    profile_solve = st.checkbox('Profile the solve 🔬', 
+    value=False, 
+    help="Runs the selection and routing phases under cProfile, and shows the report below the routing information"
+    )
 
-if option == "KMeans-Clustering-Based Clarke & Wright Heuristic ":
-    DictOfDepotsAndNodesPairs = KMeansClusteringBasedNodesSelection(inst) 
-elif option == "Hierarchical-Clustering-Based Clarke & Wright Heuristic (Ward Linkage) ":
-    DictOfDepotsAndNodesPairs = HierClusteringBasedNodeSelection(inst, "ward")
-elif option == "Hierarchical-Clustering-Based Clarke & Wright Heuristic (Complete Linkage) ":
-    DictOfDepotsAndNodesPairs = HierClusteringBasedNodeSelection(inst, "complete")
-elif option == "Hierarchical-Clustering-Based Clarke & Wright Heuristic (Average Linkage) ":
-    DictOfDepotsAndNodesPairs = HierClusteringBasedNodeSelection(inst, "average")
+    st.subheader("Plot")
 
-ListsOfPairs = DepotsAndNodesPairsLists(DictOfDepotsAndNodesPairs, inst["allNodes"])
+    nol = st.number_input('Label nodes up to 🏷️',
+    min_value=0, 
+    max_value=1100, 
+    value=PlotLabelsMaxNodes, 
+    step=10, 
+    help="The nodes of the routing plot are labeled with their ids only if there are at most this many nodes"
+    )
+
+
+# The node selection heuristic (see "NodeSelection") of each option of the sidebar
+Heuristics = {"KMeans-Clustering-Based Clarke & Wright Heuristic ": "KMeans", 
+              "Hierarchical-Clustering-Based Clarke & Wright Heuristic (Ward Linkage) ": "Ward", 
+              "Hierarchical-Clustering-Based Clarke & Wright Heuristic (Complete Linkage) ": "Complete", 
+              "Hierarchical-Clustering-Based Clarke & Wright Heuristic (Average Linkage) ": "Average", 
+              "Nearest-Depot (Voronoi) Clarke & Wright Heuristic ": "Voronoi", 
+              "Nearest-Depot (Voronoi) Clarke & Wright Heuristic with Capacity Overflow ": "VoronoiOverflow", 
+              "Capacity-Aware Assignment (Transportation Problem) Clarke & Wright Heuristic ": "Transportation", 
+              "Portfolio: Best Of All Heuristics (Run In Parallel) ": "Portfolio"}
+
+# The routing heuristic (see "RoutingHeuristics") of each option of the sidebar
+Routings = {"Clarke & Wright Savings Algorithm ": "ClarkeAndWright", 
+            "Sweep Algorithm ": "Sweep", 
+            "Route-First Cluster-Second Algorithm (Prins Split) ": "PrinsSplit"}
+
+
+@st.cache_data(show_spinner=False)
+def CachedModelInstances(noc, nos, nov, nod, nog, novc, nomd, trace_memory=False):
+    '''
+    Cached wrapper of "MDVRPModelInstances". The instance only depends on the problem parameters, so changing the heuristic
+    reuses the already generated instance. The timings of the instance build are returned along with the instance.
+    '''
+    with RecordStageTimings(trace_memory) as Timings:
+        inst = MDVRPModelInstances(noc, nos, nov, nod, nog, novc, nomd)
+
+    return inst, Timings.AsDict()
+
+
+@st.cache_data(show_spinner=False)
+def CachedSolution(noc, nos, nov, nod, nog, novc, nomd, option, routing, trace_memory=False, profile_solve=False, deadline=0):
+    '''
+    Cached wrapper of the selection, routing and metrics phases. It is keyed by the problem parameters and the selected
+    heuristics, so a rerun of the page with unchanged inputs reuses the whole solution. The solution is kept in the compact 
+    form of "MDVRPSolution", which is cheap to store in the cache. The portfolio option races all node selection heuristics
+    (see "PortfolioSolve"), and keeps the best solution by total cost, with a round trip for every unserved customer.
+    '''
+    inst, InstanceTimings = CachedModelInstances(noc, nos, nov, nod, nog, novc, nomd, trace_memory)
+
+    stime = time.time()
+    cpu_stime = time.process_time()
+
+    if Heuristics[option] == "Portfolio":
+        Solver, Arguments = PortfolioSolve, (inst, None, "FairCost", deadline or None, Routings[routing])
+    else:
+        Solver, Arguments = MDVRPSolve, (inst, Heuristics[option], RoutingHeuristics[Routings[routing]])
+
+    Profile = None
+    with RecordStageTimings(trace_memory) as Timings:
+        if profile_solve:
+            Result, Profile = ProfileRun(Solver, *Arguments)
+        else:
+            Result = Solver(*Arguments)
 
-NoOfVehicles = inst["NoOfVehicles"]
-Cap = inst["VehicleCap"]
-all_dem = inst["all_dem"]
-try:
-    Container = RoutingInfoContainer(ListsOfPairs, ClarkeAndWrightSavingsAlgorithmWithVehConstraint, NoOfVehicles, Cap, all_dem)
-    Metrics = SolutionMetricsFinder(Container["CostsContainer"], Container["TotalCostsContainer"], all_dem, Container["RoutesContainer"], DictOfDepotsAndNodesPairs)
-    print(Container["RoutesContainer"])  # Returns a list of all routes
     etime = time.time()
     cpu_etime = time.process_time()
 
+    Timings.Merge(InstanceTimings)
+
+    return {"Solution": Result["Solution"], 
+            "Metrics": Result["Metrics"], 
+            "ElapsedTime": round(etime - stime, 3), 
+            "CpuElapsedTime": round(cpu_etime - cpu_stime, 3),
+            "StageTimings": Timings.AsDict(),
+            "Threads": ThreadingInfo(),
+            "Profile": Profile,
+            "Best": Result.get("Best"),
+            "Portfolio": Result.get("Runs")}
+
+
+@st.cache_data(show_spinner=False)
+def CachedSolutionPlot(noc, nos, nov, nod, nog, novc, nomd, option, routing, trace_memory=False, profile_solve=False, deadline=0, nol=None):
+    '''
+    Renders the solution plot into an in-memory PNG buffer, so the figure is drawn once per solution and the download
+    button does not depend on a "plot.jpeg" file shared by all sessions. The timings of the plotting stage are returned 
+    along with the image.
+    '''
+    inst, _ = CachedModelInstances(noc, nos, nov, nod, nog, novc, nomd, trace_memory)
+    Solution = CachedSolution(noc, nos, nov, nod, nog, novc, nomd, option, routing, trace_memory, profile_solve, deadline)
+
+    with RecordStageTimings() as Timings:
+        figure = SolutionPlot(inst["allxs"], inst["allys"], inst["allIds"], Solution["Solution"].ToRoutesContainer(), nog, nol)
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format="png")
+        plt.close(figure)
+
+    return buffer.getvalue(), Timings.AsDict()
+
+
+try:
+    Solution = CachedSolution(noc, nos, nov, nod, nog, novc, nomd, option, routing, trace_memory, profile_solve, deadline)
+    if Solution["Solution"] is None:
+        st.warning("No heuristic of the portfolio finished before the deadline", icon="⚠️")
+        st.stop()
+    RoutesContainer = Solution["Solution"].ToRoutesContainer() # The nested lists of routes are only needed for display
+    Metrics = Solution["Metrics"]
+
 except KeyError:
     st.warning('Warning : Either 1) The number of clients chosen is less than the number of Vehicles multiplied by the Number Of Depots.', icon="⚠️")
     st.warning("Warning : Or 2) The clustering assignment proccess assigned nodes that are less than the number of each depot's vehicles, \n \
@@ -147,33 +256,55 @@ try:
 
     with col1:   
         st.header("Routing Plot")
-        figure = SolutionPlot(xx, yy, all_ids, Container["RoutesContainer"], nog) #     
-        st.pyplot(fig=figure)
-        figure.savefig('plot.jpeg')
+        PlotImage, PlotTimings = CachedSolutionPlot(noc, nos, nov, nod, nog, novc, nomd, option, routing, trace_memory, profile_solve, deadline, nol)
+        st.image(PlotImage)
 
         st.download_button(
         label="Download plot ⬇",
-        data='plot.jpeg',
-        file_name='plot.jpeg',
-        mime = "application/octet-stream"
+        data=PlotImage,
+        file_name='plot.png',
+        mime = "image/png"
 )
 
     with col2:
         st.header("Routing information") 
 
         st.write('You selected:', option)
+        st.write('Routing algorithm:', routing)
+
+        if Solution["Portfolio"] is not None:
+            st.write('Best heuristic:', Solution["Best"])
+            st.dataframe(pd.DataFrame([{"Heuristic": run["Heuristic"], "Status": run["Status"], 
+                                        "FairCost": run.get("Metrics", dict()).get("FairCost"), 
+                                        "TotalCost": run.get("Metrics", dict()).get("TotalCost"), 
+                                        "ElapsedTime": run["ElapsedTime"]} for run in Solution["Portfolio"]]), hide_index=True)
 
         with st.container():
             st.subheader('Solution Routes')
-            for r in Container["RoutesContainer"]:     
+            for r in RoutesContainer:     
                 for i in r:
                     st.write(str(i)) 
 
-        elapsed_time = round(etime - stime, 3)
-        cpu_elapsed_time = round((cpu_etime - cpu_stime)/100, 3)
+        elapsed_time = Solution["ElapsedTime"]
+        cpu_elapsed_time = Solution["CpuElapsedTime"]
         
         st.metric("Execution Time (sec)", elapsed_time, delta=None, delta_color="normal", help="Total Execution time") 
         st.metric("CPU Time (sec)", cpu_elapsed_time, delta=None, delta_color="normal", help="CPU time") 
+        st.metric("Avg. Route Utilisation (%)", Metrics["AvgRouteUtilisation"], delta=None, delta_color="normal", help="Average load of the routes, divided by the vehicle capacity") 
+        st.metric("Route Cost Std. Dev.", Metrics["RouteCostStdDev"], delta=None, delta_color="normal", help="Standard deviation of the costs of all routes") 
+
+        with st.expander("Stage timings"):
+            StageTimings = dict(Solution["StageTimings"])
+            StageTimings.update(PlotTimings)
+            st.dataframe(pd.DataFrame.from_dict(StageTimings, orient="index"))
+            Threads = Solution["Threads"]
+            st.caption("Threads: " + str(Threads["ThreadsLimit"]) + " (" + str(Threads["CpuCount"]) + " cores), thread pools: " + 
+                       (", ".join(k + " " + str(v) for k, v in Threads["ThreadPools"].items()) or "none loaded"))
+
+        if Solution["Profile"] is not None:
+            with st.expander("Profile"):
+                st.download_button(label="Download profile ⬇", data=Solution["Profile"], file_name="profile.txt", mime="text/plain")
+                st.code(Solution["Profile"])
 
 except NameError:
     pass
@@ -1,6 +1,123 @@
-from scipy.spatial import distance_matrix
 import pandas as pd
-import re
+import numpy as np
+from MDVRP_Profiling import Stage
+from MDVRP_Costs import DistanceArray
+from MDVRP_Kernels import SavingsPairs, SavingsOrder, MergeRoutes, RouteCostsValues
+
+
+def SavingsGeometry(DepotNodePair, all_dem):
+    '''
+    This function prepares the parts of the Clarke & Wright Savings Algorithm that only depend on the nodes of a single VRP (their
+    coordinates and demands), and not on the vehicle capacity or the number of vehicles. The nodes are handled by their position
+    in "DepotNodePair" (the depot is at position 0, customers at positions 1, 2, ...), so the input list is never modified. It
+    returns a dictionary with:
+    1) "Ids": the id of the node at each position,
+    2) "DistArray": the distance matrix, indexed by position and rounded to 1 decimal,
+    3) "PairsFirst", "PairsSecond": the positions of the nodes of every customer pair, sorted by descending savings (each pair
+       being [node with the greater id, node with the smaller id]),
+    4) "Demand": the demand of the node at each position (0 for the depot).
+    '''
+    all_ids = list()
+    for node in DepotNodePair:
+        all_ids.append(node[0])
+
+    with Stage("DistanceMatrix"):
+        DistArray = DistanceArray([[node[1], node[2]] for node in DepotNodePair])
+
+    with Stage("Savings"):
+        # The savings of all customer pairs, in the same (row major) order the pairs were previously inserted in the savings 
+        # dictionary, so that pairs with equal savings keep the same order after sorting.
+        first, second, savings = SavingsPairs(DistArray)
+
+        # sort savings by descending
+        order = SavingsOrder(savings)
+
+        # Each pair is [node with the greater id, node with the smaller id]
+        ids = np.array([0] + all_ids[1:])
+        FirstIsGreater = ids[first] > ids[second]
+        PairsFirst = np.where(FirstIsGreater, first, second)[order]
+        PairsSecond = np.where(FirstIsGreater, second, first)[order]
+
+    return {"Ids": all_ids,
+            "DistArray": DistArray,
+            "PairsFirst": PairsFirst,
+            "PairsSecond": PairsSecond,
+            "Demand": NodesDemand(all_ids, all_dem)}
+
+
+def NodesDemand(all_ids, all_dem):
+    '''
+    This function returns the demand of every node of a single VRP by position, where "all_ids" are the ids of the nodes, with
+    the depot (whose demand is 0) at position 0.
+    '''
+    DemandDict = dict()
+    for node_dem_pair in all_dem:
+        DemandDict[node_dem_pair[0]] = node_dem_pair[1]
+    return [0] + [DemandDict.get(i, 0) for i in all_ids[1:]]
+
+
+def FleetTrimming(Routes, DistArray, VehicleCounts):
+    '''
+    This function applies the vehicle number constraint of the heuristic to the routes of the merge loop (lists of positions in
+    "DistArray"), for each number of vehicles of "VehicleCounts": while there are more routes than vehicles, the most expensive
+    route is removed (the first one, if several routes have the same cost). The routes are removed in the same order whatever
+    the number of vehicles, so the costs and the removal order are found once, and every number of vehicles keeps the routes
+    that are not among the first len(Routes) - Vehicles removed ones. It returns one dictionary per number of vehicles, with the
+    remaining "Routes", their costs rounded to 2 decimals ("AllCosts"), and their "TotalCost".
+    '''
+    ListOfRoutesCosts = list()
+    for cost in RouteCostsValues(Routes, DistArray):
+        ListOfRoutesCosts.append(round(cost, 2))
+
+    return CostsFleetTrimming(Routes, ListOfRoutesCosts, VehicleCounts)
+
+
+def CostsFleetTrimming(Routes, ListOfRoutesCosts, VehicleCounts):
+    '''
+    This function applies the vehicle number constraint of "FleetTrimming" to routes whose costs (rounded to 2 decimals) are
+    already known, e.g. routes that were built without a distance matrix. It returns the same dictionaries as "FleetTrimming".
+    '''
+    # Most expensive routes first, and routes of equal cost in their order
+    RemovalOrder = sorted(range(len(Routes)), key=lambda i: (-ListOfRoutesCosts[i], i))
+
+    Results = list()
+    for Vehicles in VehicleCounts:
+        Removed = set(RemovalOrder[:max(len(Routes) - Vehicles, 0)])
+        Kept = [i for i in range(len(Routes)) if i not in Removed]
+
+        ListOfAllRoutesCosts = [ListOfRoutesCosts[i] for i in Kept]
+        TotalCost = 0
+        for c in ListOfAllRoutesCosts:
+            TotalCost = TotalCost + c
+            TotalCost = round(TotalCost, 2)
+
+        Results.append({"Routes": [Routes[i] for i in Kept],
+                        "AllCosts": ListOfAllRoutesCosts,
+                        "TotalCost": TotalCost})
+    return Results
+
+
+
+def RoutingResult(Routes, DistArray, all_ids, Vehicles):
+    '''
+    This function applies the vehicle number constraint to the routes built by a routing heuristic (lists of positions in
+    "DistArray", see "FleetTrimming"), and returns the dictionary that the routing heuristics return: the remaining "Routes" (as
+    lists of node ids), their costs ("AllCosts"), their "TotalCost", and the distance matrix labelled with the nodes' ids
+    ("Distance_Matrix").
+    '''
+    with Stage("FleetTrimming"):
+        Trimmed = FleetTrimming(Routes, DistArray, [Vehicles])[0]
+
+    # Converting the nodes' positions back to their ids
+    Routes = [[all_ids[node] for node in route] for route in Trimmed["Routes"]]
+
+    # The distance matrix, labelled with the nodes' ids
+    mat = pd.DataFrame(DistArray, index=all_ids, columns=all_ids)
+
+    return {"Routes":Routes, 
+            "AllCosts":Trimmed["AllCosts"],
+            "TotalCost":Trimmed["TotalCost"],
+            "Distance_Matrix": mat}
 
 
 def ClarkeAndWrightSavingsAlgorithmWithVehConstraint(DepotNodePair, Cap, all_dem, Vehicles):
@@ -20,228 +137,13 @@ def ClarkeAndWrightSavingsAlgorithmWithVehConstraint(DepotNodePair, Cap, all_dem
     If this number is less than the number of existing vehicles though, it is kept as is, and not all vehicles will be mobilized. 
     This architecture "favors" keeping low total costs, but avoids achieving the serving of all customers.
     '''
-    def DistMatrixCreator(ListOfAllNodes):
-        '''
-        This function gets as input the list with all nodes of the distinct VRP to be solved, and creates a distance matrix.
-        '''
-        data = []
-        ListOfAllIds = []
-        for i in range(0, len(ListOfAllNodes)):
-            pair = []
-            x = ListOfAllNodes[i][1]
-            pair.append(x)
-            y = ListOfAllNodes[i][2]
-            pair.append(y)
-            data.append(pair)
-        
-            global DepotNamePlaceholder
-        
-            if type(ListOfAllNodes[i][0]) == str:
-                DepotNamePlaceholder = ListOfAllNodes[i][0] 
-                ListOfAllNodes[i][0] = 0 # We convert the depot's id datatype to integer so we can use it in the distance matrix
-            ListOfAllIds.append(ListOfAllNodes[i][0])
-    
-        df = pd.DataFrame(data, columns=['x', 'y'], index=ListOfAllIds)
-        DfDistMatrix = round(pd.DataFrame(distance_matrix(df.values, df.values, p = 2), index=df.index, columns=df.index), 1)
-        ArrayDistMatrix = DfDistMatrix.to_numpy()
-    
-        return {"DataFrameOfDistMatrix": DfDistMatrix, 
-                "ArrayOfDistMatrix": ArrayDistMatrix
-                }
-
-    a = DepotNodePair
-    mat = DistMatrixCreator(a)["DataFrameOfDistMatrix"]
-
-    savings = dict()
-
-    for r in mat.index:
-        if r == 0:
-            continue
-        for c in mat.columns:
-            if c == 0:
-                continue
-            if int(c) != int(r):            
-                a = max(int(r), int(c))
-                b = min(int(r), int(c))
-                key = '(' + str(a) + ',' + str(b) + ')'
-                savings[key] = mat[0][int(r)] + mat[0][int(c)] - mat[c][r]
-                list_to_append = [a, b]
-
-    # put savings in a pandas dataframe, and sort by descending
-    sv = pd.DataFrame.from_dict(savings, orient = 'index')
-    sv.rename(columns = {0:'saving'}, inplace = True)
-    sv.sort_values(by = ['saving'], ascending = False, inplace = True)
-
-
-    savings_list = list()
-
-    for i, row in sv.iterrows():        
-        savings_pair = re.findall(r"[\w']+", i) # Removing all non numeric characters
-        savings_sublist = [int(savings_pair[0]), int(savings_pair[1])] # Converting the nodes' ids from strings to integers
-        savings_list.append(savings_sublist)
+    Geometry = SavingsGeometry(DepotNodePair, all_dem)
+    all_ids = Geometry["Ids"]
 
-    all_ids = list()
-    for node in DepotNodePair:
-        all_ids.append(node[0])
-
-    all_ids.pop(0)
-
-    Routes = list()
-
-    for ind in all_ids:
-        initial_route = [0, ind, 0]
-        Routes.append(initial_route)
-
-    def NodesInSameRouteOrNotCondition(node1, node2, routeslist):
-        '''
-        This function gets 2 nodes and a list of the routes as input, and checks whether these 2 nodes are in the same route or not.
-        '''
-        RouteOfFirstNode = None
-        RouteOfSecondNode = None
-        condition = None
-        for route in routeslist:
-            if node1 in route:
-                RouteOfFirstNode = route
-            if node2 in route:
-                RouteOfSecondNode = route
-        if set(RouteOfFirstNode) == set(RouteOfSecondNode):
-            condition = False
-        else:
-            condition = True
-        return condition
-
-    def NodesInEndOrBeginningOfRoute(node1, node2, routeslist):
-        '''
-        This function gets 2 nodes and a list of the routes as input, and checks whether these 2 nodes are locatd in the end or in the
-        beginning of the routes they belong to.
-        '''
-        condition1 = False
-        condition2 = False
-        condition = None #False
-
-        for route in routeslist:
-            if node1 in route:
-                if (node1 == route[1]) or (node1 == route[-2]):
-                    condition1 = True
-            if node2 in route:
-                if (node2 == route[1]) or (node2 == route[-2]):
-                    condition2 = True
-                
-        if (condition1 == True) and (condition2 == True):
-            condition = True
-        else:
-            condition = False
-        return condition 
-
-    def CapacityConstraintChecker(all_dem, r1, r2, cap):
-        '''
-        This function takes as input the list of lists of each customer's demand, the maximum vehicle capacity, and 2 routes that 
-        are about to be merged in the Clarke & Wright Heuristic, and checks whether the merging of these 2 routes will violate 
-        the capacity constraint per vehicle. If the constraint is violated it returns "False", and if not, it returns "True".
-        '''
-        totalcap = 0
-        for node in r1:
-            for node_dem_pair in all_dem:
-                if node == node_dem_pair[0]:
-                    totalcap = totalcap + node_dem_pair[1]
-        for node in r2:
-            for node_dem_pair in all_dem:
-                if node == node_dem_pair[0]:
-                    totalcap = totalcap + node_dem_pair[1]
-
-        cap_constraint = None
-        if totalcap <= cap:
-            cap_constraint = True
-        else:
-            cap_constraint = False
-    
-        return cap_constraint
-
-    for pair in savings_list:
-            item_1 = pair[0] 
-            item_2 = pair[1]
-
-            cond1 = NodesInSameRouteOrNotCondition(item_1, item_2, Routes)
-            cond2 = NodesInEndOrBeginningOfRoute(item_1, item_2, Routes)
-            
-            if (cond1 == True) and (cond2 == True):
-                # Finding the list where item_1, and item_2 are
-                FirstRouteToMerge = list()
-                SecondRouteToMerge = list()
-
-                for route in Routes:
-                    if item_1 in route:
-                        FirstRouteToMerge = route
-                    if item_2 in route:
-                        SecondRouteToMerge = route
-
-                if CapacityConstraintChecker(all_dem, FirstRouteToMerge, SecondRouteToMerge, Cap) == True:
-            
-                    if (FirstRouteToMerge[1] == item_1) and (SecondRouteToMerge[-2] == item_2):
-                        FirstRouteToMerge[1:1] = SecondRouteToMerge[1:len(SecondRouteToMerge) - 1]
-                    elif (FirstRouteToMerge[1] == item_1) and (SecondRouteToMerge[1] == item_2):
-                        FirstRouteToMerge[1:1] = SecondRouteToMerge[len(SecondRouteToMerge) - 2:0:-1]
-                    elif (FirstRouteToMerge[-2] == item_1) and (SecondRouteToMerge[1] == item_2):
-                        FirstRouteToMerge[len(FirstRouteToMerge) - 1:len(FirstRouteToMerge) - 1] = SecondRouteToMerge[1:len(SecondRouteToMerge) - 1]
-                    elif (FirstRouteToMerge[-2] == item_1) and (SecondRouteToMerge[-2] == item_2):
-                        FirstRouteToMerge[len(FirstRouteToMerge) - 1:len(FirstRouteToMerge) - 1] = SecondRouteToMerge[len(SecondRouteToMerge) - 2:0:-1]
-
-                    for route in Routes:
-                        if route == SecondRouteToMerge:
-                            Routes.remove(route)
-                else:
-                    continue
-            
-
-    def Costfinder(Routes, mat):
-        ListOfAllCosts = list()
-        for route in Routes:
-            cost = 0
-        
-            for i in range(0, len(route[:-1])):
-                cost = cost + mat[route[i]][route[i+1]]
-            ListOfAllCosts.append(round(cost, 2))
-        return ListOfAllCosts
-
-
-    ListOfRoutesCosts = Costfinder(Routes, mat)
-
-    TotalCost = 0
-    for c in ListOfRoutesCosts:
-        TotalCost = TotalCost + c
-
-    for route in Routes:
-        for n, i in enumerate(route):
-            if i == 0:
-                route[n] = DepotNamePlaceholder
-
-    for idx in mat.index:
-        if idx == 0:
-            mat.rename(index={idx: DepotNamePlaceholder}, inplace=True)
-
-    for colname in mat.columns:
-        if colname == 0:
-            mat.rename(columns = {colname:DepotNamePlaceholder}, inplace = True)
-
-    if len(Routes) > Vehicles:
-
-        NoOfRoutesToBeRemoved = len(Routes) - Vehicles
-
-        for i in range(0, NoOfRoutesToBeRemoved):
-            RouteToBeRemoved = ListOfRoutesCosts.index(max(ListOfRoutesCosts))
-            del Routes[RouteToBeRemoved]
-            del ListOfRoutesCosts[RouteToBeRemoved]
-
-
-    ListOfAllRoutesCosts = Costfinder(Routes, mat)
-
-    TotalCost = 0
-    for c in ListOfAllRoutesCosts:
-        TotalCost = TotalCost + c
-        TotalCost = round(TotalCost, 2)
-
-    return {"Routes":Routes, 
-            "AllCosts":ListOfAllRoutesCosts,
-            "TotalCost":TotalCost,
-            "Distance_Matrix": mat}
+    with Stage("MergeLoop"):
+        # Starting from one route per customer ([0, customer, 0]), the routes of each pair are merged if the 2 nodes are not in the
+        # same route, they are both at the beginning or the end of their routes, and the merged route does not exceed the vehicle 
+        # capacity (see "MDVRP_Kernels.MergeRoutes").
+        Routes = MergeRoutes(Geometry["PairsFirst"], Geometry["PairsSecond"], Geometry["Demand"], Cap)
 
+    return RoutingResult(Routes, Geometry["DistArray"], all_ids, Vehicles)
@@ -0,0 +1,392 @@
+'''
+Command-line batch runner of the MDVRP solver, which runs without Streamlit (e.g. on headless compute nodes). It has three
+modes:
+
+1) Single: solves one generated instance with one node selection heuristic, and writes its metrics, timings and routes.
+2) Sweep: solves every combination of seed x heuristic x problem parameters (the parameters given as comma separated lists
+   form a grid), in a process pool, and writes one result per job.
+3) Merge: combines the result files of the shards of a sweep into one output.
+
+A sweep can be split into N shards ("--shard i/N", with i from 1 to N) that independent machines run: the jobs are always
+created in the same order, and shard i runs every N-th job starting from the i-th one, so the shards do not overlap and have
+a similar mix of problem sizes. Every shard writes its own JSON file (the output path with ".shard-i-of-N" before its
+extension), and the merge mode checks that all jobs have a result and writes the combined results, by default as the Excel
+workbooks of the batch page.
+
+Every job runs "SingleSimulationRun", i.e. the same functions as the batch page of the app. The settings can also be given in a
+JSON or YAML scenario file, whose keys are the names of the options (e.g. "customers", "from-seed", "heuristics"), and the
+options given on the command line take precedence over it. The results are written as JSON, CSV, or as Excel workbooks with
+the layout of the batch page (one workbook per parameter set). Example:
+
+    python MDVRP_Batch.py --mode single --customers 500 --depots 3 --heuristics Ward --output solution.json
+    python MDVRP_Batch.py --customers 100,200 --depots 2,4 --from-seed 1 --to-seed 20 --workers 4 --output sweep.csv
+    python MDVRP_Batch.py --heuristics KMeans,Voronoi,VoronoiOverflow --customers 1000 --from-seed 1 --to-seed 10
+    python MDVRP_Batch.py --scenario scenario.yaml --format xlsx --output sweep.xlsx
+    python MDVRP_Batch.py --scenario scenario.yaml --shard 2/8 --output sweep.json
+    python MDVRP_Batch.py --mode merge --inputs sweep.shard-*-of-8.json --output sweep.xlsx
+'''
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from MDVRP_Runtime import InitializeWorker
+
+# The problem parameters of a job, in the order of the arguments of "SingleSimulationRun", with the option that sets each one
+JobParameters = [("NoOfCustomers", "customers"), ("NoOfVehicles", "vehicles"), ("NoOfDepots", "depots"), ("Grid", "grid"),
+                 ("VehicleCap", "capacity"), ("MaximumDem", "max_demand")]
+
+OutputFormats = ["json", "csv", "xlsx"]
+
+# The options that define the jobs of a sweep, which must be equal in all the shards of a sweep
+SweepOptions = ["heuristics", "from_seed", "to_seed"] + [option for key, option in JobParameters]
+
+
+def SweepJobs(Heuristics, Seeds, Grid):
+    '''
+    This function returns the jobs of a sweep: one job per combination of problem parameters (the cartesian product of the lists
+    of "Grid", a dictionary with one list per key of "JobParameters"), heuristic and seed, in this order. The order only depends
+    on the arguments, and every job gets its position ("JobId"), so the same sweep always creates the same jobs.
+    '''
+    Jobs = list()
+    for Values in itertools.product(*[Grid[key] for key, option in JobParameters]):
+        for Heuristic in Heuristics:
+            for Seed in Seeds:
+                Job = {"JobId": len(Jobs), "Heuristic": Heuristic, "Seed": Seed}
+                Job.update(zip([key for key, option in JobParameters], Values))
+                Jobs.append(Job)
+    return Jobs
+
+
+def ShardJobs(Jobs, Shard):
+    '''
+    This function returns the jobs of shard i of N ("Shard" being the tuple (i, N), with i from 1 to N): every N-th job,
+    starting from the i-th one. Since the jobs of a sweep are grouped by problem parameters, taking them in turns gives every
+    shard a similar share of each problem size.
+    '''
+    i, N = Shard
+    return Jobs[i-1::N]
+
+
+def ShardOutput(Output, Shard):
+    '''
+    Returns the path of the result file of a shard: the output path with ".shard-i-of-N" before its extension.
+    '''
+    Stem, Extension = os.path.splitext(Output)
+    return Stem + ".shard-" + str(Shard[0]) + "-of-" + str(Shard[1]) + Extension
+
+
+def MergeShards(Paths):
+    '''
+    This function combines the JSON result files of the shards of a sweep. It checks that all files belong to the same sweep and
+    the same split, and that every job of the sweep has a result (a file written without "--shard" counts as shard 1/1). It
+    returns the arguments of the sweep along with the results of all jobs, in the order of the jobs.
+    '''
+    Arguments = None
+    Shards = set()
+    ResultsById = dict()
+    for Path in Paths:
+        with open(Path) as f:
+            Output = json.load(f)
+        Shard = tuple(Output["Arguments"].get("shard") or (1, 1))
+        if Arguments is None:
+            Arguments = Output["Arguments"]
+            NoOfShards = Shard[1]
+        elif any(Output["Arguments"][option] != Arguments[option] for option in SweepOptions):
+            raise SystemExit(Path + " belongs to a different sweep than " + Paths[0])
+        if Shard[1] != NoOfShards:
+            raise SystemExit(Path + " is a shard of a split in " + str(Shard[1]) + ", not " + str(NoOfShards))
+        if Shard in Shards:
+            raise SystemExit("Shard " + str(Shard[0]) + "/" + str(Shard[1]) + " is given twice")
+        Shards.add(Shard)
+        for r in Output["Results"]:
+            ResultsById[r["JobId"]] = r
+
+    if Arguments is None:
+        raise SystemExit("No shard files to merge")
+    MissingShards = sorted(set(range(1, NoOfShards + 1)) - {i for i, N in Shards})
+    if MissingShards:
+        raise SystemExit("Missing shards: " + ", ".join(str(i) + "/" + str(NoOfShards) for i in MissingShards))
+
+    Grid = {key: Arguments[option] for key, option in JobParameters}
+    Jobs = SweepJobs(Arguments["heuristics"], list(range(Arguments["from_seed"], Arguments["to_seed"] + 1)), Grid)
+    Missing = [Job["JobId"] for Job in Jobs if Job["JobId"] not in ResultsById]
+    if Missing:
+        raise SystemExit(str(len(Missing)) + " jobs have no result, e.g. job " + str(Missing[0]))
+
+    return Arguments, [ResultsById[Job["JobId"]] for Job in Jobs]
+
+
+def RunJob(Job, TraceMemory=False, IncludeRoutes=False):
+    '''
+    This function solves one job with "SingleSimulationRun", and returns the job along with its result. A job that raises an
+    error (e.g. when a depot is assigned less customers than vehicles) returns the error instead of the metrics.
+    '''
+    from miscellanious_functions import SingleSimulationRun
+
+    Result = dict(Job)
+    try:
+        Result.update(SingleSimulationRun(Job["Heuristic"], Job["Seed"], *[Job[key] for key, option in JobParameters],
+                                          TraceMemory=TraceMemory, IncludeRoutes=IncludeRoutes))
+        Result["Error"] = None
+    except Exception as e:
+        Result["Error"] = type(e).__name__ + ": " + str(e)
+    return Result
+
+
+def RunJobs(Jobs, Workers=1, TraceMemory=False, IncludeRoutes=False, Verbose=True):
+    '''
+    This function runs the given jobs and returns their results, in the order of the jobs. With one worker, the jobs run in the
+    current process, with all cores available to the clustering. With more workers, they run in a process pool where every
+    worker uses one thread. Either way, the solver is warmed up first (see "MDVRP_Runtime.InitializeWorker"), so the import and
+    compilation times are not added to the time of the first job.
+    '''
+    if Workers <= 1:
+        InitializeWorker(None)
+        Results = list()
+        for Job in Jobs:
+            Results.append(RunJob(Job, TraceMemory, IncludeRoutes))
+            if Verbose:
+                PrintProgress(Results[-1], len(Results), len(Jobs))
+        return Results
+
+    with ProcessPoolExecutor(max_workers=Workers, initializer=InitializeWorker) as executor:
+        Futures = [executor.submit(RunJob, Job, TraceMemory, IncludeRoutes) for Job in Jobs]
+        Results = list()
+        for Future in Futures:
+            Results.append(Future.result())
+            if Verbose:
+                PrintProgress(Results[-1], len(Results), len(Jobs))
+    return Results
+
+
+def PrintProgress(Result, Done, Total):
+    print("[" + str(Done) + "/" + str(Total) + "]", Result["Heuristic"], "seed", Result["Seed"],
+          Result["Error"] or ("cost " + str(Result["TotalCost"]) + " time " + str(Result["ElapsedTime"])),
+          file=sys.stderr, flush=True)
+
+
+def ResultRows(Results):
+    '''
+    This function flattens the results into table rows: the job, the error, the metrics of "BatchMetricsNames", and the wall time
+    of each stage of the pipeline (see "MDVRP_Profiling").
+    '''
+    from miscellanious_functions import BatchMetricsNames
+    from MDVRP_Profiling import PipelineStages
+
+    Columns = (["JobId", "Heuristic", "Seed"] + [key for key, option in JobParameters] + ["Error"] + BatchMetricsNames
+               + [stage + "WallTime" for stage in PipelineStages])
+    Rows = list()
+    for r in Results:
+        Row = {column: r.get(column) for column in Columns}
+        for stage in PipelineStages:
+            Row[stage + "WallTime"] = r.get("StageTimings", dict()).get(stage, dict()).get("WallTime")
+        Rows.append(Row)
+    return Columns, Rows
+
+
+def WriteResults(Results, Format, Output, Arguments):
+    '''
+    This function writes the results in the given format ("json", "csv" or "xlsx") to "Output" ("-" for the standard output,
+    which is not possible for Excel workbooks). The Excel workbooks have the layout of "BatchResultsWorkbook", which holds the
+    seeds of a single parameter set, so a sweep over several parameter sets writes one workbook per set, named after the output
+    path and the parameters (as the files of "BatchTestingExcelWriter"). It returns the paths of the written files.
+    '''
+    if Format == "xlsx":
+        from miscellanious_functions import BatchResultsWorkbook
+
+        Sets = dict()
+        for r in Results:
+            if not r["Error"]:
+                Sets.setdefault(tuple(r[key] for key, option in JobParameters), list()).append(r)
+        Stem, Extension = os.path.splitext(Output)
+        Paths = list()
+        for Values, SetResults in Sets.items():
+            Path = Output if len(Sets) == 1 else Stem + "-" + "-".join(str(v) for v in Values) + (Extension or ".xlsx")
+            with open(Path, "wb") as f:
+                f.write(BatchResultsWorkbook(SetResults, Arguments["from_seed"]))
+            Paths.append(Path)
+        return Paths
+
+    buffer = io.StringIO()
+    if Format == "json":
+        json.dump({"Arguments": Arguments, "Results": Results}, buffer, indent=1)
+    else:
+        Columns, Rows = ResultRows(Results)
+        writer = csv.DictWriter(buffer, fieldnames=Columns, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(Rows)
+
+    if Output == "-":
+        sys.stdout.write(buffer.getvalue())
+        return []
+    with open(Output, "w", newline="") as f:
+        f.write(buffer.getvalue())
+    return [Output]
+
+
+def LoadScenario(Path):
+    '''
+    This function reads a scenario file, in JSON or (if PyYAML is installed) YAML format depending on its extension, and returns
+    its settings as a dictionary.
+    '''
+    with open(Path) as f:
+        if os.path.splitext(Path)[1].lower() in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit("Reading YAML scenario files requires PyYAML (pip install pyyaml)")
+            Scenario = yaml.safe_load(f)
+        else:
+            Scenario = json.load(f)
+    if not isinstance(Scenario, dict):
+        raise SystemExit("The scenario file must contain a mapping of options to values: " + Path)
+    return Scenario
+
+
+def ScenarioDefaults(Scenario, parser):
+    '''
+    This function converts the settings of a scenario file to defaults of the argument parser: the keys are the names of the
+    options (with "-" or "_"), and the values of the list options may be lists, single values, or comma separated strings.
+    '''
+    Actions = {action.dest: action for action in parser._actions}
+    Defaults = dict()
+    for key, value in Scenario.items():
+        dest = key.replace("-", "_")
+        if dest not in Actions or dest == "scenario":
+            raise SystemExit("Unknown option in the scenario file: " + str(key))
+        if Actions[dest].type in (IntList, StrList):
+            if isinstance(value, str):
+                value = Actions[dest].type(value)
+            elif not isinstance(value, list):
+                value = [value]
+        Defaults[dest] = value
+    return Defaults
+
+
+def IntList(text):
+    return [int(x) for x in text.split(",") if x]
+
+
+def StrList(text):
+    return [x for x in text.split(",") if x]
+
+
+def ShardSpec(text):
+    '''
+    Parses a shard given as "i/N", with i from 1 to N.
+    '''
+    try:
+        i, N = (int(x) for x in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("a shard is given as i/N, e.g. 2/8")
+    if not 1 <= i <= N:
+        raise argparse.ArgumentTypeError("the shard index must be between 1 and the number of shards")
+    return (i, N)
+
+
+def ArgumentParser():
+    from miscellanious_functions import BatchHeuristics, SelectionHeuristics
+
+    parser = argparse.ArgumentParser(description="Command-line batch runner of the MDVRP solver")
+    parser.add_argument("--scenario", default=None, help="JSON or YAML file with the settings (the other options take precedence)")
+    parser.add_argument("--mode", choices=["single", "sweep", "merge"], default="sweep")
+    parser.add_argument("--heuristics", type=StrList, default=BatchHeuristics, help="Comma separated node selection heuristics (" + ", ".join(SelectionHeuristics) + ")")
+    parser.add_argument("--from-seed", type=int, default=1, help="First seed")
+    parser.add_argument("--to-seed", type=int, default=None, help="Last seed (the first seed by default)")
+    parser.add_argument("--customers", type=IntList, default=[100], help="Comma separated numbers of customers")
+    parser.add_argument("--vehicles", type=IntList, default=[5], help="Comma separated numbers of vehicles of each depot")
+    parser.add_argument("--depots", type=IntList, default=[2], help="Comma separated numbers of depots")
+    parser.add_argument("--grid", type=IntList, default=[100], help="Comma separated grid sizes")
+    parser.add_argument("--capacity", type=IntList, default=[50], help="Comma separated vehicle capacities")
+    parser.add_argument("--max-demand", type=IntList, default=[3], help="Comma separated maximum customer demands")
+    parser.add_argument("--shard", type=ShardSpec, default=None,
+                        help="Run only shard i of N of the sweep (e.g. 2/8), and write its results to its own JSON file")
+    parser.add_argument("--inputs", nargs="+", default=[], help="Shard result files combined by --mode merge")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of jobs run in parallel, each worker using one thread (1 runs in this process on all cores)")
+    parser.add_argument("--trace-memory", action="store_true", help="Measure the peak memory of each stage with tracemalloc")
+    parser.add_argument("--format", choices=OutputFormats, default=None,
+                        help="Output format (by default, the extension of the output path, or json; xlsx for --mode merge)")
+    parser.add_argument("--output", default=None, help="Path of the output file, '-' for the standard output (default: batch_results.<format>)")
+    parser.add_argument("--quiet", action="store_true", help="Do not print the progress of the jobs")
+    return parser
+
+
+def ParseArguments(argv=None):
+    '''
+    Parses the command line, with the settings of the scenario file (if any) as defaults.
+    '''
+    parser = ArgumentParser()
+    args = parser.parse_args(argv)
+    if args.scenario:
+        parser.set_defaults(**ScenarioDefaults(LoadScenario(args.scenario), parser))
+        args = parser.parse_args(argv)
+
+    from miscellanious_functions import SelectionHeuristics
+    Unknown = [h for h in args.heuristics if h not in SelectionHeuristics]
+    if Unknown:
+        parser.error("unknown node selection heuristics: " + ", ".join(Unknown) + " (choose from " + ", ".join(SelectionHeuristics) + ")")
+    if args.to_seed is None:
+        args.to_seed = args.from_seed
+    if args.to_seed < args.from_seed:
+        parser.error("--to-seed must not be lower than --from-seed")
+    if args.format is None:
+        Extension = os.path.splitext(args.output or "")[1].lstrip(".").lower()
+        args.format = Extension if Extension in OutputFormats else ("xlsx" if args.mode == "merge" else "json")
+    if args.output is None:
+        args.output = "batch_results." + args.format
+    if args.shard is not None:
+        if args.mode != "sweep":
+            parser.error("--shard is only used by --mode sweep")
+        if args.format != "json" or args.output == "-":
+            parser.error("shards write their results to JSON files, which --mode merge combines")
+        args.output = ShardOutput(args.output, args.shard)
+    if args.mode == "merge" and not args.inputs:
+        parser.error("--mode merge needs the shard result files (--inputs)")
+    if args.format == "xlsx" and args.output == "-":
+        parser.error("Excel workbooks can not be written to the standard output")
+    if args.mode == "single" and (len(args.heuristics) > 1 or args.to_seed != args.from_seed
+                                  or any(len(getattr(args, option)) > 1 for key, option in JobParameters)):
+        parser.error("--mode single takes a single heuristic, seed and value of every problem parameter")
+    return args
+
+
+def main(argv=None):
+    args = ParseArguments(argv)
+
+    if args.mode == "merge":
+        Arguments, Results = MergeShards(args.inputs)
+        Arguments = dict(Arguments, shard=None, inputs=args.inputs)
+        Paths = WriteResults(Results, args.format, args.output, Arguments)
+        if not args.quiet:
+            print("Merged", len(Results), "results of", len(args.inputs), "files", file=sys.stderr)
+            for Path in Paths:
+                print("Results written to", Path, file=sys.stderr)
+        return Results
+
+    Grid = {key: getattr(args, option) for key, option in JobParameters}
+    Jobs = SweepJobs(args.heuristics, list(range(args.from_seed, args.to_seed + 1)), Grid)
+    if args.shard is not None:
+        Jobs = ShardJobs(Jobs, args.shard)
+
+    st = time.perf_counter()
+    Results = RunJobs(Jobs, args.workers, args.trace_memory, IncludeRoutes=args.mode == "single", Verbose=not args.quiet)
+    Paths = WriteResults(Results, args.format, args.output, vars(args))
+
+    if not args.quiet:
+        NoOfFailed = sum(1 for r in Results if r["Error"])
+        print(len(Results) - NoOfFailed, "of", len(Results), "jobs solved in", round(time.perf_counter() - st, 3), "sec",
+              "(" + str(NoOfFailed) + " failed)" if NoOfFailed else "", file=sys.stderr)
+        for Path in Paths:
+            print("Results written to", Path, file=sys.stderr)
+
+    return Results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+'''
+Benchmark harness of the MDVRP solver. It has three modes:
+
+1) Scaling: sweeps the number of customers, the number of depots and the node selection heuristics over randomly generated
+   instances ("MDVRPModelInstances"), and records the wall time, CPU time, peak memory and the timings of every stage of the
+   pipeline (see "MDVRP_Profiling") for each case.
+2) Cordeau: solves the Cordeau MDVRP benchmark instances of a directory (loaded with "MDVRP_BenchmarkInstances") with every
+   heuristic, so the solution quality is tracked next to the speed.
+3) Gate: solves the reference cases of "BenchmarkInstances/RegressionReference.json" (deterministic generated instances, and
+   the small Cordeau-format fixture "BenchmarkInstances/mini01", plus any other Cordeau instance file found in the directory), reports the gap to the best-known solutions of
+   "BenchmarkInstances/BestKnownSolutions.json" along with the runtime, and exits with an error code when the objective or the
+   runtime of a case regresses beyond a tolerance. It runs fully offline.
+
+Since the fleet trimming of the routing heuristic may leave customers unserved, quality is compared on the "FairCost": the
+total cost plus a dedicated round trip from its depot for every unserved customer.
+
+Every case runs in a fresh worker process, so the peak resident memory of each case can be measured. The results are written to
+a JSON file, which can be compared against a stored baseline (e.g. the output of an earlier run). Example:
+
+    python MDVRP_Benchmark.py --customers 50,100,200,500,1000 --depots 2,5 --output bench.json --baseline baseline.json
+    python MDVRP_Benchmark.py --mode cordeau --instances-dir BenchmarkInstances --output cordeau.json
+    python MDVRP_Benchmark.py --mode gate
+'''
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from MDVRP_Runtime import InitializeWorker, ThreadingInfo
+
+try:
+    import resource
+except ImportError:  # resource is not available on Windows
+    resource = None
+
+DefaultCustomers = [50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000]
+DefaultDepots = [2, 5, 10]
+
+
+def PeakResidentMemoryMB():
+    '''
+    Returns the peak resident memory of the current process in MB, or None if it can not be measured on this platform.
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return round(peak/2**20 if sys.platform == "darwin" else peak/2**10, 1)
+
+
+def BenchmarkCase(Case, TraceMemory=False):
+    '''
+    This function solves one benchmark case, and returns the case along with the solution metrics, the elapsed and CPU times,
+    the timings of each stage, and the peak resident memory of the worker process. A case is a dictionary with a "Kind"
+    ("Scaling" or "Cordeau"), a "Heuristic", and either the parameters of "MDVRPModelInstances" or the path of a Cordeau
+    instance file. It may also set the "ConnectivityNeighbours" and "ConnectivityMinCustomers" of the hierarchical clustering
+    heuristics (see "HierClusteringBasedNodeSelection"), e.g. to compare the peak memory with and without the connectivity graph.
+    '''
+    import MDVRP_HierClustFunc
+    from miscellanious_functions import MDVRPModelInstances, MDVRP_BenchmarkInstances, MDVRPSolve, UnservedCustomersCost
+    from MDVRP_Profiling import RecordStageTimings
+
+    # Every case runs in a fresh worker process, so the settings do not leak into the other cases
+    for Setting in ("ConnectivityNeighbours", "ConnectivityMinCustomers"):
+        if Case.get(Setting) is not None:
+            setattr(MDVRP_HierClustFunc, Setting, Case[Setting])
+
+    Result = dict(Case)
+    st = time.perf_counter()
+    cpu_st = time.process_time()
+    try:
+        with RecordStageTimings(TraceMemory) as Timings:
+            if Case["Kind"] == "Cordeau":
+                inst = MDVRP_BenchmarkInstances(Case["Instance"], Case["Seed"])
+            else:
+                inst = MDVRPModelInstances(Case["NoOfCustomers"], Case["Seed"], Case["NoOfVehicles"], Case["NoOfDepots"],
+                                           Case["Grid"], Case["VehicleCap"], Case["MaximumDem"])
+            Solution = MDVRPSolve(inst, Case["Heuristic"])
+        Result.update(Solution["Metrics"])
+        # Customers dropped by the fleet trimming are charged a round trip, so objectives are comparable (see "FairCost")
+        Unserved = UnservedCustomersCost(inst, Solution["Selection"], Solution["Solution"])
+        Result["NoOfUnservedCustomers"] = len(Unserved["UnservedCustomers"])
+        Result["UnservedCost"] = Unserved["UnservedCost"]
+        Result["FairCost"] = round(Result["TotalCost"] + Unserved["UnservedCost"], 2)
+        Result["Error"] = None
+    except Exception as e:
+        Result["Error"] = type(e).__name__ + ": " + str(e)
+
+    Result["ElapsedTime"] = round(time.perf_counter() - st, 4)
+    Result["CpuElapsedTime"] = round(time.process_time() - cpu_st, 4)
+    Result["StageTimings"] = Timings.AsDict()
+    Result["PeakRSSMB"] = PeakResidentMemoryMB()
+    Result["Threads"] = ThreadingInfo()
+
+    return Result
+
+
+def CaseKey(Result):
+    '''
+    The key that identifies a case in a results file, used to match the results of two runs. A scaling case is identified by all
+    the parameters of its instance, so cases of runs with e.g. a different fleet or grid are never compared.
+    '''
+    if Result["Kind"] == "Cordeau":
+        return ("Cordeau", os.path.basename(Result["Instance"]), Result["Heuristic"])
+    return ("Scaling", Result["NoOfCustomers"], Result["NoOfDepots"], Result["Heuristic"], Result["Seed"],
+            Result.get("NoOfVehicles"), Result.get("Grid"), Result.get("VehicleCap"), Result.get("MaximumDem"))
+
+
+def ScalingCases(Customers, Depots, Heuristics, Seeds, NoOfVehicles, Grid, VehicleCap, MaximumDem):
+    '''
+    Returns the list of cases of the scaling sweep, ordered by increasing number of customers.
+    '''
+    return [{"Kind": "Scaling", "Heuristic": h, "NoOfCustomers": noc, "NoOfDepots": nod, "Seed": seed,
+             "NoOfVehicles": NoOfVehicles, "Grid": Grid, "VehicleCap": VehicleCap, "MaximumDem": MaximumDem}
+            for noc in sorted(Customers) for nod in Depots for h in Heuristics for seed in Seeds]
+
+
+def CordeauCases(InstancesDir, Heuristics):
+    '''
+    Returns the list of cases of the Cordeau benchmark: one case per instance file of the directory and per heuristic. Files
+    with an extension (e.g. ".json" reference files) are ignored, since the Cordeau instances are named "p01", "p02", etc.
+    '''
+    Files = sorted(f for f in os.listdir(InstancesDir) if "." not in f)
+    return [{"Kind": "Cordeau", "Heuristic": h, "Instance": os.path.join(InstancesDir, f), "Seed": 1}
+            for f in Files for h in Heuristics]
+
+
+def RunBenchmark(Cases, TraceMemory=False, MaxSecondsPerCase=None, Workers=1, Verbose=True, Repeats=1, Threads=1):
+    '''
+    This function runs the given cases, each one in a fresh worker process, and returns the list of results. If
+    "MaxSecondsPerCase" is given, once a scaling case exceeds it, the larger cases of the same depots and heuristic are skipped,
+    so the sweep does not get stuck on sizes that do not scale. With "Repeats" above 1, every case is solved that many times
+    and the fastest run is kept, which makes the timings less noisy. "Threads" is the number of threads of each worker process
+    (see "MDVRP_Runtime.ConfigureRuntime"), None for all cores.
+    '''
+    Results = list()
+    TooSlow = set()
+    with ProcessPoolExecutor(max_workers=Workers, max_tasks_per_child=1, initializer=InitializeWorker,
+                             initargs=(Threads,)) as executor:
+        for Case in Cases:
+            Group = (Case["Kind"], Case.get("NoOfDepots"), Case["Heuristic"])
+            if Case["Kind"] == "Scaling" and Group in TooSlow:
+                Result = dict(Case)
+                Result["Error"] = "Skipped: a smaller case exceeded " + str(MaxSecondsPerCase) + " sec"
+                Results.append(Result)
+                continue
+
+            Runs = [executor.submit(BenchmarkCase, Case, TraceMemory) for i in range(Repeats)]
+            Result = min((run.result() for run in Runs), key=lambda r: r["ElapsedTime"])
+            Results.append(Result)
+
+            if MaxSecondsPerCase is not None and Result["ElapsedTime"] > MaxSecondsPerCase:
+                TooSlow.add(Group)
+            if Verbose:
+                print(CaseKey(Result), "error: " + Result["Error"] if Result["Error"] else "",
+                      Result["ElapsedTime"], "sec", Result["PeakRSSMB"], "MB", Result.get("TotalCost"), flush=True)
+
+    return Results
+
+
+def CompareWithBaseline(Results, Baseline):
+    '''
+    This function matches every result with the result of the same case in the baseline, and returns one comparison per
+    matched case, with the ratio of the elapsed times (current/baseline, so a value above 1 is a slowdown), the ratio of the
+    wall time of each stage, and the difference of the total cost.
+    '''
+    BaselineResults = {CaseKey(r): r for r in Baseline["Results"] if not r.get("Error")}
+    Comparisons = list()
+    for r in Results:
+        if r.get("Error") or CaseKey(r) not in BaselineResults:
+            continue
+        b = BaselineResults[CaseKey(r)]
+        Comparison = {"Case": CaseKey(r),
+                      "ElapsedTime": r["ElapsedTime"],
+                      "BaselineElapsedTime": b["ElapsedTime"],
+                      "TimeRatio": round(r["ElapsedTime"]/b["ElapsedTime"], 3) if b["ElapsedTime"] > 0 else None,
+                      "TotalCost": r["TotalCost"],
+                      "BaselineTotalCost": b["TotalCost"],
+                      "CostDifference": round(r["TotalCost"] - b["TotalCost"], 2),
+                      "StageTimeRatios": dict()}
+        for stage, measures in r["StageTimings"].items():
+            BaselineStage = b["StageTimings"].get(stage)
+            if BaselineStage and BaselineStage["WallTime"] > 0:
+                Comparison["StageTimeRatios"][stage] = round(measures["WallTime"]/BaselineStage["WallTime"], 3)
+        Comparisons.append(Comparison)
+
+    return Comparisons
+
+
+def GateCases(Reference, InstancesDir, Heuristics):
+    '''
+    Returns the cases of the regression gate: the cases stored in the reference file (or a default set of small generated
+    instances, when there is no reference yet), plus the Cordeau cases of the instance files found in the directory.
+    '''
+    from miscellanious_functions import BatchHeuristics
+
+    Cases = [dict(entry["Case"]) for entry in Reference.get("Cases", list())]
+    if not Cases:
+        Cases = ScalingCases([50, 100, 200], [2, 4], BatchHeuristics, [1, 2], NoOfVehicles=5, Grid=100, VehicleCap=60, MaximumDem=5)
+    Keys = {CaseKey(c) for c in Cases}
+    if os.path.isdir(InstancesDir):
+        Cases.extend(c for c in CordeauCases(InstancesDir, Heuristics) if CaseKey(c) not in Keys)
+    return Cases
+
+
+def QualityGate(Results, Reference, BestKnown, CostTolerance, TimeTolerance, TimeSlack=0.1):
+    '''
+    This function compares every result with the reference of its case, and returns a tuple with one report row per result and
+    the list of failures. A case fails when its "FairCost" is more than "CostTolerance" (relative, e.g. 0.01 for 1%) above the
+    reference, when its elapsed time is more than "TimeTolerance" times the reference time (and more than "TimeSlack" seconds
+    above it, so the timer noise of very small cases is ignored), or when it raises an error. The gap to the best-known
+    solution is reported for the Cordeau instances.
+    '''
+    ReferenceCases = {CaseKey(entry["Case"]): entry for entry in Reference.get("Cases", list())}
+    Rows = list()
+    Failures = list()
+    for r in Results:
+        Key = CaseKey(r)
+        Row = {"Case": Key, "FairCost": r.get("FairCost"), "ElapsedTime": r.get("ElapsedTime"),
+               "PctOfCustomersVisited": r.get("PctOfCustomersVisited"), "GapToBestKnownPct": None,
+               "ReferenceFairCost": None, "ReferenceElapsedTime": None, "Status": "OK"}
+        if r["Kind"] == "Cordeau" and not r.get("Error"):
+            bks = BestKnown.get(os.path.basename(r["Instance"]))
+            if bks:
+                Row["GapToBestKnownPct"] = round((r["FairCost"] - bks)/bks*100, 2)
+
+        if r.get("Error"):
+            Row["Status"] = "FAIL: " + r["Error"]
+        elif Key not in ReferenceCases:
+            Row["Status"] = "NEW"
+        else:
+            ref = ReferenceCases[Key]
+            Row["ReferenceFairCost"] = ref["FairCost"]
+            Row["ReferenceElapsedTime"] = ref["ElapsedTime"]
+            Problems = list()
+            if r["FairCost"] > ref["FairCost"]*(1 + CostTolerance):
+                Problems.append("cost regressed")
+            if r["ElapsedTime"] > ref["ElapsedTime"]*TimeTolerance and r["ElapsedTime"] - ref["ElapsedTime"] > TimeSlack:
+                Problems.append("runtime regressed")
+            if Problems:
+                Row["Status"] = "FAIL: " + ", ".join(Problems)
+
+        if Row["Status"].startswith("FAIL"):
+            Failures.append(Row)
+        Rows.append(Row)
+
+    return Rows, Failures
+
+
+def ReferenceFromResults(Results):
+    '''
+    Creates the content of a reference file from the results of a gate run.
+    '''
+    GateKeys = ["Kind", "Heuristic", "Seed", "Instance", "NoOfCustomers", "NoOfDepots", "NoOfVehicles", "Grid", "VehicleCap", "MaximumDem"]
+    return {"Environment": EnvironmentInfo(),
+            "Cases": [{"Case": {k: r[k] for k in GateKeys if k in r},
+                       "FairCost": r["FairCost"],
+                       "TotalCost": r["TotalCost"],
+                       "PctOfCustomersVisited": r["PctOfCustomersVisited"],
+                       "ElapsedTime": r["ElapsedTime"]} for r in Results if not r.get("Error")]}
+
+
+def EnvironmentInfo():
+    '''
+    Returns the information of the machine and the library versions, stored in the results file so runs can be compared.
+    '''
+    import numpy, pandas, sklearn, scipy
+    return {"Python": platform.python_version(),
+            "Platform": platform.platform(),
+            "Processor": platform.processor(),
+            "CpuCount": os.cpu_count(),
+            "numpy": numpy.__version__,
+            "pandas": pandas.__version__,
+            "scikit-learn": sklearn.__version__,
+            "scipy": scipy.__version__,
+            "Date": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def IntList(text):
+    return [int(x) for x in text.split(",") if x]
+
+
+def StrList(text):
+    return [x for x in text.split(",") if x]
+
+
+def ArgumentParser():
+    from miscellanious_functions import BatchHeuristics
+
+    parser = argparse.ArgumentParser(description="Benchmark harness of the MDVRP solver")
+    parser.add_argument("--mode", choices=["scaling", "cordeau", "gate"], default="scaling")
+    parser.add_argument("--customers", type=IntList, default=DefaultCustomers, help="Comma separated numbers of customers")
+    parser.add_argument("--depots", type=IntList, default=DefaultDepots, help="Comma separated numbers of depots")
+    parser.add_argument("--heuristics", type=StrList, default=BatchHeuristics, help="Comma separated node selection heuristics")
+    parser.add_argument("--seeds", type=IntList, default=[1], help="Comma separated seeds")
+    parser.add_argument("--vehicles", type=int, default=20, help="Number of vehicles of each depot")
+    parser.add_argument("--grid", type=int, default=1000, help="Grid size")
+    parser.add_argument("--capacity", type=int, default=100, help="Vehicle capacity")
+    parser.add_argument("--max-demand", type=int, default=3, help="Maximum customer demand")
+    parser.add_argument("--instances-dir", default="BenchmarkInstances", help="Directory with the Cordeau instances")
+    parser.add_argument("--trace-memory", action="store_true", help="Measure the peak memory of each stage with tracemalloc")
+    parser.add_argument("--connectivity-neighbours", type=int, default=None,
+                        help="Neighbours of every customer in the connectivity graph of Ward/Complete/Average (0 for no graph)")
+    parser.add_argument("--connectivity-min-customers", type=int, default=None,
+                        help="Number of customers from which Ward/Complete/Average use the connectivity graph")
+    parser.add_argument("--max-seconds-per-case", type=float, default=120,
+                        help="Skip the larger cases of a (depots, heuristic) pair once a case exceeds this time")
+    parser.add_argument("--workers", type=int, default=1, help="Number of cases run in parallel (1 gives the most accurate timings)")
+    parser.add_argument("--threads", type=int, default=1, help="Number of threads of each worker process (0 for all cores)")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file the results are written to")
+    parser.add_argument("--baseline", default=None, help="JSON results file of an earlier run to compare against")
+    parser.add_argument("--repeats", type=int, default=1, help="Solve every case this many times and keep the fastest run")
+    parser.add_argument("--reference", default=os.path.join("BenchmarkInstances", "RegressionReference.json"),
+                        help="Reference file of the regression gate")
+    parser.add_argument("--best-known", default=os.path.join("BenchmarkInstances", "BestKnownSolutions.json"),
+                        help="JSON file with the best-known objective of each Cordeau instance")
+    parser.add_argument("--cost-tolerance", type=float, default=0.005,
+                        help="Relative increase of the objective over the reference above which the gate fails")
+    parser.add_argument("--time-tolerance", type=float, default=2.0,
+                        help="Ratio of the runtime over the reference runtime above which the gate fails")
+    parser.add_argument("--time-slack", type=float, default=0.1,
+                        help="Runtime increase in seconds below which the gate never fails, so timer noise is ignored")
+    parser.add_argument("--update-reference", action="store_true", help="Write the results of the gate run as the new reference")
+    return parser
+
+
+def Gate(args):
+    '''
+    Runs the regression gate, prints its report, and exits with code 1 if any case failed.
+    '''
+    Reference = dict()
+    if os.path.exists(args.reference):
+        with open(args.reference) as f:
+            Reference = json.load(f)
+    BestKnown = dict()
+    if os.path.exists(args.best_known):
+        with open(args.best_known) as f:
+            BestKnown = json.load(f)["BestKnownSolutions"]
+
+    Cases = GateCases(Reference, args.instances_dir, args.heuristics)
+    Results = RunBenchmark(Cases, Workers=args.workers, Verbose=False, Repeats=args.repeats, Threads=args.threads or None)
+
+    if args.update_reference:
+        with open(args.reference, "w") as f:
+            json.dump(ReferenceFromResults(Results), f, indent=1)
+        print("Reference written to", args.reference)
+        return {"Results": Results}
+
+    Rows, Failures = QualityGate(Results, Reference, BestKnown, args.cost_tolerance, args.time_tolerance, args.time_slack)
+    for Row in Rows:
+        print(Row["Case"], "cost", Row["FairCost"], "(ref", str(Row["ReferenceFairCost"]) + ")",
+              "gap", str(Row["GapToBestKnownPct"]) + "%", "time", Row["ElapsedTime"], "(ref", str(Row["ReferenceElapsedTime"]) + ")",
+              Row["Status"])
+
+    with open(args.output, "w") as f:
+        json.dump({"Environment": EnvironmentInfo(), "Arguments": vars(args), "Results": Results, "Gate": Rows}, f, indent=1)
+
+    print(len(Rows) - len(Failures), "of", len(Rows), "cases passed")
+    if Failures:
+        sys.exit(1)
+    return {"Results": Results, "Gate": Rows}
+
+
+def main(argv=None):
+    args = ArgumentParser().parse_args(argv)
+
+    if args.mode == "gate":
+        return Gate(args)
+
+    if args.mode == "cordeau":
+        Cases = CordeauCases(args.instances_dir, args.heuristics)
+    else:
+        Cases = ScalingCases(args.customers, args.depots, args.heuristics, args.seeds, args.vehicles, args.grid,
+                             args.capacity, args.max_demand)
+    for Case in Cases:
+        Case.update(ConnectivityNeighbours=args.connectivity_neighbours, ConnectivityMinCustomers=args.connectivity_min_customers)
+
+    Results = RunBenchmark(Cases, args.trace_memory, args.max_seconds_per_case, args.workers, Repeats=args.repeats,
+                           Threads=args.threads or None)
+    Output = {"Environment": EnvironmentInfo(), "Arguments": vars(args), "Results": Results}
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            Baseline = json.load(f)
+        Output["Comparisons"] = CompareWithBaseline(Results, Baseline)
+        for c in Output["Comparisons"]:
+            print(c["Case"], "time x" + str(c["TimeRatio"]), "cost " + "%+.2f" % c["CostDifference"])
+
+    with open(args.output, "w") as f:
+        json.dump(Output, f, indent=1)
+
+    return Output
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import numpy as np
+from scipy.spatial import distance_matrix, minkowski_distance
+
+
+def DistanceArray(Points):
+    '''
+    This function gets as input an array with the x and y coordinates of some nodes (one row per node), and returns the array of
+    the euclidean distances between all of them, rounded to 1 decimal (as in the distance matrix of the Clarke & Wright heuristic).
+    '''
+    Points = np.asarray(Points, dtype=float)
+    return np.round(distance_matrix(Points, Points, p = 2), 1)
+
+
+def EdgeLengths(Points):
+    '''
+    This function gets as input the x and y coordinates of the nodes of a route, in the order they are visited, and returns the
+    distances between consecutive nodes, rounded to 1 decimal. They are equal to the corresponding entries of "DistanceArray",
+    without creating the whole array.
+    '''
+    Points = np.asarray(Points, dtype=float)
+    return np.round(minkowski_distance(Points[:-1], Points[1:], 2), 1)
+
+
+def RouteCost(Route, D):
+    '''
+    This function returns the cost of a single route, given as the positions of its nodes in the distance array "D" (including
+    the depot at the start and the end of the route).
+    '''
+    Route = np.asarray(Route, dtype=np.int64)
+    return D[Route[:-1], Route[1:]].sum()
+
+
+def FlatRoutesCosts(Nodes, Offsets, D):
+    '''
+    This function returns the costs of many routes at once. The routes are given as one flat array "Nodes" with the positions of
+    the nodes of all routes (each route including its depot at the start and the end), one route after the other, and an array
+    "Offsets" where route i is Nodes[Offsets[i]:Offsets[i+1]]. All edges are looked up in "D" with one fancy indexing operation,
+    and the edges between the last node of a route and the first node of the next one are left out.
+    '''
+    Nodes = np.asarray(Nodes, dtype=np.int64)
+    Offsets = np.asarray(Offsets, dtype=np.int64)
+    NoOfRoutes = len(Offsets) - 1
+    if len(Nodes) < 2:
+        return np.zeros(NoOfRoutes)
+
+    Edges = D[Nodes[:-1], Nodes[1:]]
+    RouteOfEdge = np.repeat(np.arange(NoOfRoutes), np.diff(Offsets))[:-1]
+    Boundaries = Offsets[1:-1] - 1
+    SameRoute = np.ones(len(Edges), dtype=bool)
+    SameRoute[Boundaries[(Boundaries >= 0) & (Boundaries < len(Edges))]] = False
+
+    return np.bincount(RouteOfEdge[SameRoute], weights=Edges[SameRoute], minlength=NoOfRoutes)
+
+
+def RoutesCosts(Routes, D):
+    '''
+    Same as "FlatRoutesCosts", for a list of routes (each route being a list of positions in "D").
+    '''
+    Lengths = [len(route) for route in Routes]
+    Offsets = np.concatenate(([0], np.cumsum(Lengths, dtype=np.int64)))
+    Nodes = np.fromiter((node for route in Routes for node in route), dtype=np.int64, count=int(Offsets[-1]))
+    return FlatRoutesCosts(Nodes, Offsets, D)
+
+
+def RouteSetsCosts(Nodes, Offsets, SetOffsets, D):
+    '''
+    This function returns the total cost of many candidate route sets (e.g. the solutions compared by a local search or a
+    parametric sweep) at once. The routes of all sets are given as in "FlatRoutesCosts", and the routes of set j are the routes
+    SetOffsets[j] to SetOffsets[j+1] - 1. It returns the cost of each set, along with the cost of each route.
+    '''
+    Costs = FlatRoutesCosts(Nodes, Offsets, D)
+    SetOffsets = np.asarray(SetOffsets, dtype=np.int64)
+    SetOfRoute = np.repeat(np.arange(len(SetOffsets) - 1), np.diff(SetOffsets))
+    return {"SetCosts": np.bincount(SetOfRoute, weights=Costs, minlength=len(SetOffsets) - 1),
+            "RouteCosts": Costs}
+
+
+def SolutionRoutesCosts(Solution, D, Positions):
+    '''
+    This function evaluates all routes of an "MDVRPSolution" at once. "Positions" is a dictionary with the position of every node
+    id (customers and depots) in the distance array "D". It returns the cost of each route, in the order of the solution.
+    '''
+    Lengths = np.diff(Solution.Offsets)
+    Offsets = np.concatenate(([0], np.cumsum(Lengths + 2)))
+    Nodes = np.empty(Offsets[-1], dtype=np.int64)
+
+    DepotPositions = np.array([Positions[depot] for depot in Solution.DepotIds], dtype=np.int64)[Solution.RouteDepots]
+    Nodes[Offsets[:-1]] = DepotPositions
+    Nodes[Offsets[1:] - 1] = DepotPositions
+    IsCustomer = np.ones(len(Nodes), dtype=bool)
+    IsCustomer[Offsets[:-1]] = False
+    IsCustomer[Offsets[1:] - 1] = False
+    Nodes[IsCustomer] = [Positions[node] for node in Solution.Tour.tolist()]
+
+    return FlatRoutesCosts(Nodes, Offsets, D)
@@ -0,0 +1,260 @@
+'''
+Spatial decomposition of very large instances (e.g. 100k customers), for which the quadratic stages of the pipeline (the
+silhouette sweeps, the hierarchical clustering, and the distance matrix and savings of the Clarke & Wright heuristic) do not fit
+in time or memory. The plane is split into tiles of at most "MaxTileCustomers" customers, every tile is solved as a small
+instance with the usual node selection and routing heuristics, and the routes of each depot are then merged across the tile
+borders. For example:
+
+    from MDVRP_Decomposition import DecomposedSolve
+    Result = DecomposedSolve(inst, "KMeans", Routing="ClarkeAndWright", MaxTileCustomers=2000, Workers=4)
+    Result["Metrics"], Result["Tiles"], Result["BorderMerges"]
+
+Every tile costs the same bounded time and memory, so the whole solve grows about linearly with the number of customers (the
+tiling itself takes O(n log n) time). With "Workers" > 1, the tiles are solved in a process pool, and the customers are
+published once as shared arrays (see "MDVRP_SharedMemory").
+'''
+import math
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from MDVRP_Profiling import Stage
+from MDVRP_Runtime import InitializeWorker
+from MDVRP_SharedMemory import SharedBlocks, Attach
+from MDVRP_Solution import MDVRPSolution
+from MDVRP_Kernels import MergeRoutes, SavingsOrder
+from MDVRP_Costs import EdgeLengths
+from ClarkeAndWrightSavingsAlgorithm import CostsFleetTrimming
+
+# The number of nearest route ends that every route end of a depot is paired with when the routes are merged across tile borders
+BorderNeighbours = 8
+
+
+def KDTiles(Points, MaxTileCustomers):
+    '''
+    This function splits the points in two halves at the median of their longest side, recursively, until every part has at
+    most "MaxTileCustomers" points (a k-d split), so all tiles have between MaxTileCustomers/2 and MaxTileCustomers points,
+    whatever the density of the points. It returns the positions of the points of every tile.
+    '''
+    Tiles = list()
+    Parts = [np.arange(len(Points))]
+    while Parts:
+        Part = Parts.pop()
+        if len(Part) <= MaxTileCustomers:
+            Tiles.append(Part)
+            continue
+        Coords = Points[Part]
+        Axis = int(np.argmax(Coords.max(axis=0) - Coords.min(axis=0)))
+        Half = len(Part)//2
+        Order = np.argpartition(Coords[:, Axis], Half)
+        Parts.append(Part[Order[Half:]])
+        Parts.append(Part[Order[:Half]])
+    return Tiles
+
+
+def GridTiles(Points, MaxTileCustomers):
+    '''
+    This function splits the bounding box of the points into a square grid of equal cells, with about n/MaxTileCustomers cells
+    for n points, and returns the positions of the points of every non-empty cell. The cells only have about
+    "MaxTileCustomers" points when the points are spread evenly (see "KDTiles" otherwise).
+    '''
+    Side = max(1, math.ceil(math.sqrt(len(Points)/MaxTileCustomers)))
+    Low = Points.min(axis=0)
+    Size = np.maximum(Points.max(axis=0) - Low, 1e-9)
+    Cells = np.minimum(((Points - Low)/Size*Side).astype(np.int64), Side - 1)
+    Cell = Cells[:, 1]*Side + Cells[:, 0]
+
+    Order = np.argsort(Cell, kind="stable")
+    Bounds = np.cumsum(np.bincount(Cell, minlength=Side*Side))
+    return [Tile for Tile in np.split(Order, Bounds[:-1]) if len(Tile)]
+
+
+TilingMethods = {"kd": KDTiles, "grid": GridTiles}
+
+
+def SolveTile(Descriptor, Tile, Heuristic, Routing):
+    '''
+    The task of a tile of "DecomposedSolve": it attaches the shared customers, builds the instance of the tile (all depots and
+    the customers of the tile, with the share of the fleet of every depot that matches the share of the demand of the tile),
+    applies the node selection heuristic with the given name (see "NodeSelection"), and solves the VRP of every depot with the
+    routing heuristic with the given name (see "RoutingHeuristics"), without the vehicle number constraint, which is applied
+    once the routes of all tiles are merged. It returns the depots-nodes pairs of the tile ("Selection"), and the routes of
+    every depot as lists of customer ids, without the depot ("Routes").
+    '''
+    from miscellanious_functions import NodeSelection, RoutingHeuristics
+
+    Arrays = Attach(Descriptor["Blocks"])
+    Parameters = Descriptor["Parameters"]
+    Rows = Arrays["Order"][Arrays["Offsets"][Tile]:Arrays["Offsets"][Tile+1]]
+    Ids = Arrays["CustIds"][Rows].tolist()
+    Coords = Arrays["CustCoords"][Rows].tolist()
+    Demands = Arrays["Demands"][Rows].tolist()
+
+    AllDepots = [list(depot) for depot in Descriptor["AllDepots"]]
+    Customers = [[i, xy[0], xy[1]] for i, xy in zip(Ids, Coords)]
+    Nodes = AllDepots + Customers
+    Instances = {"allCustomers": Customers,
+                 "allNodes": Nodes,
+                 "allIds": [node[0] for node in Nodes],
+                 "allxs": [node[1] for node in Nodes],
+                 "allys": [node[2] for node in Nodes],
+                 "NoOfCusts": len(Customers),
+                 "AllDepots": AllDepots,
+                 "NoOfVehicles": max(1, math.ceil(Parameters["NoOfVehicles"]*sum(Demands)/Parameters["TotalDemand"])),
+                 "all_dem": [[i, dem] for i, dem in zip(Ids, Demands)],
+                 "VehicleCap": Parameters["VehicleCap"],
+                 "Seed": Parameters["Seed"]}
+
+    # The clustering heuristics need more customers than depots (clusters), so tiny tiles go to their nearest depots
+    Selection = NodeSelection(Instances, Heuristic if len(Customers) > len(AllDepots) else "Voronoi")
+
+    Routes = dict()
+    for depot in AllDepots:
+        if depot[0] not in Selection:
+            continue
+        Selected = set(Selection[depot[0]])
+        DepotNodePair = [depot] + [cust for cust in Customers if cust[0] in Selected]
+        Solution = RoutingHeuristics[Routing](DepotNodePair, Instances["VehicleCap"], Instances["all_dem"], len(DepotNodePair) - 1)
+        Routes[depot[0]] = [route[1:-1] for route in Solution["Routes"]]
+
+    return {"Selection": Selection, "Routes": Routes}
+
+
+def CoordinateRoutesCosts(Routes, Points):
+    '''
+    This function returns the cost of each route (lists of positions in "Points", the coordinates of the nodes, including the
+    depot at the start and the end of every route), rounded to 2 decimals. The edges are rounded to 1 decimal, as the entries of
+    "DistanceArray", without creating the distance matrix.
+    '''
+    Lengths = [len(route) for route in Routes]
+    Offsets = np.concatenate(([0], np.cumsum(Lengths, dtype=np.int64)))
+    Nodes = np.fromiter((node for route in Routes for node in route), dtype=np.int64, count=int(Offsets[-1]))
+    # The edge between the end of a route and the start of the next one is the depot to itself, whose length is 0
+    Edges = np.append(EdgeLengths(Points[Nodes]), 0)
+    return [round(cost, 2) for cost in np.add.reduceat(Edges, Offsets[:-1]).tolist()]
+
+
+def BorderRepair(Depot, Routes, RouteTiles, Points, Demand, Cap, Neighbours):
+    '''
+    This function merges the routes of a depot that were built in different tiles, with the merge loop of the Clarke & Wright
+    Savings Algorithm (see "MergeRoutes") started from these routes: only the ends of the routes can be joined, so the pairs
+    are the "Neighbours" nearest route ends of every route end (found with a KD-tree) that belong to routes of another tile,
+    sorted by descending savings. The routes are given as lists of positions that start and end with the depot (position 0),
+    "Points" holds the coordinates of every position (with "Depot", the coordinates of the depot, at position 0), and "Demand"
+    its demand. It returns the merged routes as lists of positions.
+    '''
+    from scipy.spatial import cKDTree
+
+    Ends = np.array(sorted(set(node for route in Routes for node in (route[1], route[-2]))), dtype=np.int64)
+    if len(Ends) < 2:
+        return Routes
+
+    TileOf = np.zeros(len(Points), dtype=np.int64)
+    for route, tile in zip(Routes, RouteTiles):
+        TileOf[route[1:-1]] = tile
+
+    k = min(Neighbours + 1, len(Ends))
+    Nearest = cKDTree(Points[Ends]).query(Points[Ends], k=k)[1].reshape(len(Ends), k)
+    First = np.repeat(Ends, k)
+    Second = Ends[Nearest.ravel()]
+    Border = TileOf[First] != TileOf[Second]
+    # Every pair once, as [node with the smaller position, node with the greater position]
+    Pairs = np.unique(np.stack((np.minimum(First, Second), np.maximum(First, Second)), axis=1)[Border], axis=0).reshape(-1, 2)
+
+    ToDepot = np.round(np.hypot(*(Points - Depot).T), 1)
+    Savings = ToDepot[Pairs[:, 0]] + ToDepot[Pairs[:, 1]] - np.round(np.hypot(*(Points[Pairs[:, 0]] - Points[Pairs[:, 1]]).T), 1)
+    Pairs = Pairs[Savings > 0]
+    Order = SavingsOrder(Savings[Savings > 0])
+
+    return MergeRoutes(Pairs[Order, 0], Pairs[Order, 1], Demand, Cap, Routes=Routes)
+
+
+def DecomposedSolve(Instances, Heuristic, Routing="ClarkeAndWright", MaxTileCustomers=2000, Method="kd", Workers=1, Neighbours=None):
+    '''
+    This function solves very large problem instances by spatial decomposition (see the module's description):
+    1) the customers are split into tiles of at most "MaxTileCustomers" customers, with a k-d split ("kd", see "KDTiles") or a
+       uniform grid ("grid", see "GridTiles"),
+    2) every tile is solved with the node selection heuristic and the routing heuristic with the given names (see "SolveTile"),
+       in "Workers" worker processes (in the current process if "Workers" is 1),
+    3) for every depot, the routes of the different tiles are merged across the tile borders (see "BorderRepair", with
+       "Neighbours" route ends per route end, "BorderNeighbours" by default), and the vehicle number constraint is applied to
+       the merged routes (see "FleetTrimming").
+    It returns a dictionary with the depots-nodes pairs ("Selection"), the solution as an "MDVRPSolution" ("Solution"), the
+    metrics of "SolutionMetrics" ("Metrics"), the number of "Tiles", and the number of routes merged across tile borders
+    ("BorderMerges"), like "MDVRPSolve".
+    '''
+    from miscellanious_functions import SolutionMetrics
+
+    if Method not in TilingMethods:
+        raise ValueError("Unknown tiling method: " + str(Method))
+    if Neighbours is None:
+        Neighbours = BorderNeighbours
+
+    AllDepots = Instances["AllDepots"]
+    Cap = Instances["VehicleCap"]
+    all_dem = Instances["all_dem"]
+
+    CustIds = np.array([cust[0] for cust in Instances["allCustomers"]], dtype=np.int64)
+    CustCoords = np.array([[cust[1], cust[2]] for cust in Instances["allCustomers"]], dtype=float).reshape(-1, 2)
+    Demands = dict((pair[0], pair[1]) for pair in all_dem)
+    CustDemands = np.array([Demands[i] for i in CustIds.tolist()], dtype=float)
+
+    with Stage("Tiling"):
+        Tiles = TilingMethods[Method](CustCoords, MaxTileCustomers)
+
+    Arrays = {"CustIds": CustIds, "CustCoords": CustCoords, "Demands": CustDemands,
+              "Order": np.concatenate(Tiles),
+              "Offsets": np.concatenate(([0], np.cumsum([len(Tile) for Tile in Tiles], dtype=np.int64)))}
+
+    with SharedBlocks() as Blocks:
+        Descriptor = {"Blocks": Blocks.Publish(Arrays),
+                      "AllDepots": AllDepots,
+                      "Parameters": {"NoOfVehicles": Instances["NoOfVehicles"], "VehicleCap": Cap,
+                                     "Seed": Instances["Seed"], "TotalDemand": float(CustDemands.sum())}}
+        if Workers > 1:
+            with ProcessPoolExecutor(max_workers=Workers, initializer=InitializeWorker) as executor:
+                Futures = [executor.submit(SolveTile, Descriptor, t, Heuristic, Routing) for t in range(len(Tiles))]
+                TileResults = [Future.result() for Future in Futures]
+        else:
+            TileResults = [SolveTile(Descriptor, t, Heuristic, Routing) for t in range(len(Tiles))]
+
+    Row = dict(zip(CustIds.tolist(), range(len(CustIds))))
+    Selection = dict()
+    Results = list()
+    BorderMerges = 0
+    for depot in AllDepots:
+        DepotTiles = [(t, Result) for t, Result in enumerate(TileResults) if depot[0] in Result["Selection"]]
+        if not DepotTiles:
+            continue
+        Selection[depot[0]] = [node for t, Result in DepotTiles for node in Result["Selection"][depot[0]]]
+
+        # The routes of all tiles, as positions in the list of the depot's nodes (the depot is at position 0)
+        Ids = [depot[0]]
+        Routes = list()
+        RouteTiles = list()
+        for t, Result in DepotTiles:
+            for route in Result["Routes"][depot[0]]:
+                Routes.append([0] + list(range(len(Ids), len(Ids) + len(route))) + [0])
+                RouteTiles.append(t)
+                Ids.extend(route)
+        Rows = [Row[i] for i in Ids[1:]]
+        Points = np.vstack(([depot[1], depot[2]], CustCoords[Rows]))
+        Demand = [0] + CustDemands[Rows].tolist()
+
+        with Stage("BorderRepair"):
+            Merged = BorderRepair(Points[0], Routes, RouteTiles, Points, Demand, Cap, Neighbours)
+            BorderMerges = BorderMerges + len(Routes) - len(Merged)
+
+        with Stage("FleetTrimming"):
+            Trimmed = CostsFleetTrimming(Merged, CoordinateRoutesCosts(Merged, Points), [Instances["NoOfVehicles"]])[0]
+
+        Results.append({"Routes": [[Ids[node] for node in route] for route in Trimmed["Routes"]],
+                        "AllCosts": Trimmed["AllCosts"],
+                        "TotalCost": Trimmed["TotalCost"]})
+
+    Solution = MDVRPSolution.FromRoutingResults(list(Selection.keys()), Results, all_dem)
+    Metrics = SolutionMetrics(Solution, all_dem, Selection, Cap)
+
+    return {"Selection": Selection,
+            "Solution": Solution,
+            "Metrics": Metrics,
+            "Tiles": len(Tiles),
+            "BorderMerges": BorderMerges}
@@ -0,0 +1,131 @@
+from concurrent.futures import ProcessPoolExecutor
+from MDVRP_Profiling import Stage
+from MDVRP_Runtime import InitializeWorker
+from MDVRP_SharedMemory import SharedBlocks, PublishGeometry, AttachGeometry
+from MDVRP_Solution import MDVRPSolution
+from MDVRP_Kernels import MergeRoutes
+from ClarkeAndWrightSavingsAlgorithm import SavingsGeometry, FleetTrimming
+from miscellanious_functions import NodeSelection, DepotsAndNodesPairsLists, SolutionMetrics
+
+
+def CapacityFleetSweep(Geometry, Cap, VehicleCounts):
+    '''
+    This function runs the merge loop of the Clarke & Wright Savings Algorithm for a single vehicle capacity, on the geometry
+    of a VRP (see "SavingsGeometry"), and evaluates every number of vehicles from its routes (see "FleetTrimming"). It returns
+    a list with the "Routes", "AllCosts" and "TotalCost" of each number of vehicles.
+    '''
+    all_ids = Geometry["Ids"]
+    with Stage("MergeLoop"):
+        Routes = MergeRoutes(Geometry["PairsFirst"], Geometry["PairsSecond"], Geometry["Demand"], Cap)
+
+    with Stage("FleetTrimming"):
+        Trimmed = FleetTrimming(Routes, Geometry["DistArray"], VehicleCounts)
+
+    return [{"Routes": [[all_ids[node] for node in route] for route in Result["Routes"]],
+             "AllCosts": Result["AllCosts"],
+             "TotalCost": Result["TotalCost"]} for Result in Trimmed]
+
+
+def SharedCapacityFleetSweep(GeometryDescriptor, Cap, VehicleCounts):
+    '''
+    Worker function of "FleetSweep": "CapacityFleetSweep" on a geometry published with "PublishGeometry".
+    '''
+    return CapacityFleetSweep(AttachGeometry(GeometryDescriptor), Cap, VehicleCounts)
+
+
+def DepotFleetSweep(DepotNodePair, all_dem, Capacities, VehicleCounts):
+    '''
+    This function solves the VRP of a single depot with the Clarke & Wright Savings Algorithm for every combination of vehicle
+    capacity and number of vehicles, with the same results as "ClarkeAndWrightSavingsAlgorithmWithVehConstraint". The distance
+    matrix and the sorted savings only depend on the nodes, so they are built once (see "SavingsGeometry"). Only the merge loop
+    depends on the capacity, so it runs once per capacity, and the number of vehicles only matters for the fleet trimming that
+    follows it, so all numbers of vehicles are evaluated from the routes of a single merge loop (see "CapacityFleetSweep"). It
+    returns a dictionary with the "Routes", "AllCosts" and "TotalCost" of each (capacity, number of vehicles) pair.
+    '''
+    Geometry = SavingsGeometry(DepotNodePair, all_dem)
+
+    Results = dict()
+    for Cap in Capacities:
+        Results.update(zip([(Cap, Vehicles) for Vehicles in VehicleCounts], CapacityFleetSweep(Geometry, Cap, VehicleCounts)))
+    return Results
+
+
+def ParallelDepotFleetSweeps(ListsOfPairs, all_dem, Capacities, VehicleCounts, Workers):
+    '''
+    This function returns the results of "DepotFleetSweep" for every depot, with the merge loops of all (depot, capacity) pairs
+    spread over "Workers" worker processes. The geometry of each depot is built once, in this process, and published as shared
+    arrays (see "MDVRP_SharedMemory"), so the workers read the distance matrices and savings without copying them, and the
+    arrays are removed when the sweep ends, also if a worker fails.
+    '''
+    with SharedBlocks() as Blocks, ProcessPoolExecutor(max_workers=Workers, initializer=InitializeWorker) as executor:
+        Futures = list()
+        for pair in ListsOfPairs:
+            Descriptor = PublishGeometry(Blocks, SavingsGeometry(pair, all_dem))
+            Futures.append([executor.submit(SharedCapacityFleetSweep, Descriptor, Cap, VehicleCounts) for Cap in Capacities])
+
+        DepotResults = list()
+        for DepotFutures in Futures:
+            Results = dict()
+            for Cap, Future in zip(Capacities, DepotFutures):
+                Results.update(zip([(Cap, Vehicles) for Vehicles in VehicleCounts], Future.result()))
+            DepotResults.append(Results)
+    return DepotResults
+
+
+# The node selection heuristics that use the fleet capacity of the depots (number of vehicles x vehicle capacity), whose
+# selection "FleetSweep" applies again for every (capacity, number of vehicles) pair
+FleetDependentHeuristics = ["VoronoiOverflow", "Transportation"]
+
+
+def SelectionFleetSweep(DictOfDepotsAndNodesPairs, Instances, Capacities, VehicleCounts, Workers=1):
+    '''
+    This function sweeps the VRP of every depot of a node selection (see "DepotFleetSweep") for every combination of vehicle
+    capacity and number of vehicles, and returns one result per combination, as in "FleetSweep".
+    '''
+    ListsOfPairs = DepotsAndNodesPairsLists(DictOfDepotsAndNodesPairs, Instances["allNodes"])
+    all_dem = Instances["all_dem"]
+
+    if Workers > 1:
+        DepotResults = ParallelDepotFleetSweeps(ListsOfPairs, all_dem, Capacities, VehicleCounts, Workers)
+    else:
+        DepotResults = [DepotFleetSweep(pair, all_dem, Capacities, VehicleCounts) for pair in ListsOfPairs]
+    DepotIds = [pair[0][0] for pair in ListsOfPairs]
+
+    Results = list()
+    for Cap in Capacities:
+        for Vehicles in VehicleCounts:
+            Solution = MDVRPSolution.FromRoutingResults(DepotIds, [r[(Cap, Vehicles)] for r in DepotResults], all_dem)
+            Results.append({"VehicleCap": Cap,
+                            "NoOfVehicles": Vehicles,
+                            "Selection": DictOfDepotsAndNodesPairs,
+                            "Solution": Solution,
+                            "Metrics": SolutionMetrics(Solution, all_dem, DictOfDepotsAndNodesPairs, Cap)})
+    return Results
+
+
+def FleetSweep(Instances, Heuristic, Capacities, VehicleCounts, Workers=1):
+    '''
+    This function solves the given problem instances for every combination of vehicle capacity ("Capacities") and number of
+    vehicles per depot ("VehicleCounts"), e.g. for fleet sizing studies, with the same results as "MDVRPSolve" for each
+    combination. The clustering heuristics do not depend on the fleet, so the heuristic with the given name (see
+    "NodeSelection") is applied once, and the VRP of every depot is swept with "DepotFleetSweep", so a grid of C capacities and
+    V numbers of vehicles costs C merge loops per depot instead of C x V full solves. The heuristics of
+    "FleetDependentHeuristics" assign the customers within the fleet capacity of every depot, so they are applied again for
+    every combination, and the VRP of every depot is solved once per combination. With more than 1 "Workers", the merge loops
+    run in parallel (see "ParallelDepotFleetSweeps"). It returns a dictionary with the depots-nodes pairs ("Selection", None
+    for the heuristics of "FleetDependentHeuristics"), and one result per combination ("Results"), with the "VehicleCap", the
+    "NoOfVehicles", its depots-nodes pairs ("Selection"), the "Solution" (an "MDVRPSolution") and the "Metrics" of
+    "SolutionMetrics".
+    '''
+    if Heuristic in FleetDependentHeuristics:
+        Results = list()
+        for Cap in Capacities:
+            for Vehicles in VehicleCounts:
+                Selection = NodeSelection(dict(Instances, VehicleCap=Cap, NoOfVehicles=Vehicles), Heuristic)
+                Results.extend(SelectionFleetSweep(Selection, Instances, [Cap], [Vehicles], Workers))
+        return {"Selection": None,
+                "Results": Results}
+
+    DictOfDepotsAndNodesPairs = NodeSelection(Instances, Heuristic)
+    return {"Selection": DictOfDepotsAndNodesPairs,
+            "Results": SelectionFleetSweep(DictOfDepotsAndNodesPairs, Instances, Capacities, VehicleCounts, Workers)}
@@ -1,16 +1,71 @@
-from sklearn.cluster import AgglomerativeClustering
-from sklearn.metrics import silhouette_score
 import pandas as pd
 import numpy as np
 import math
-import warnings
 import copy
-warnings.filterwarnings(action='ignore', category=UserWarning)
-import os
-os.environ["OMP_NUM_THREADS"] = '1'
+from MDVRP_Profiling import Stage, TimedStage
+from MDVRP_Silhouette import SilhouetteScores
 
+# The number of nearest neighbours of every customer in the connectivity graph of "ConnectivityTree"
+ConnectivityNeighbours = 10
+# Below this number of customers, "HierClusteringBasedNodeSelection" builds the unconstrained tree of "LinkageTree", whose
+# condensed distance matrix takes 4n(n - 1) bytes (1.6 GB for 20k customers)
+ConnectivityMinCustomers = 5000
 
-def HierClusteringBasedNodeSelection(Instances, Linkage):
+
+def LinkageTree(Points, Linkage):
+    '''
+    This function returns the hierarchical clustering tree of the points (the linkage matrix of scipy, where row m holds the two
+    clusters merged at step m), built from the condensed matrix of their euclidean distances, which is computed once. It is
+    the same tree that "AgglomerativeClustering" builds on every fit (without connectivity constraints), so all numbers of
+    clusters can be cut from a single tree instead of fitting the clustering once per number of clusters.
+    '''
+    from scipy.cluster.hierarchy import linkage
+    from scipy.spatial.distance import pdist
+
+    return linkage(pdist(np.asarray(Points, dtype=float)), method=Linkage)
+
+
+def ConnectivityTree(Points, Linkage, Neighbours):
+    '''
+    This function returns the hierarchical clustering tree of the points (in the format of "LinkageTree", of which only the two
+    merged clusters of every row are used) when only clusters that are connected in the sparse graph of the "Neighbours"
+    nearest neighbours of every point can be merged, i.e. the tree that "AgglomerativeClustering" builds with this graph as its
+    connectivity matrix. The graph has n x Neighbours edges, so it takes O(n) memory instead of the O(n^2) of the unconstrained
+    tree. If the graph is not connected, scikit-learn connects its components with their closest pairs of points.
+    '''
+    from sklearn.cluster import AgglomerativeClustering
+    from sklearn.neighbors import kneighbors_graph
+
+    Points = np.asarray(Points, dtype=float)
+    Graph = kneighbors_graph(Points, n_neighbors=min(Neighbours, len(Points) - 1), include_self=False)
+    Clustering = AgglomerativeClustering(n_clusters=1, linkage=Linkage, connectivity=Graph, compute_full_tree=True).fit(Points)
+    return Clustering.children_
+
+
+def HierarchyCut(Tree, NoOfClusters):
+    '''
+    This function returns the cluster label of every point when the tree of "LinkageTree" is cut into "NoOfClusters" clusters,
+    i.e. when only its first n - NoOfClusters merges are applied (the clusters of "AgglomerativeClustering" with "n_clusters").
+    '''
+    n = len(Tree) + 1
+    if not 1 <= NoOfClusters <= n:
+        raise ValueError("Cannot extract more clusters than samples: %s clusters were given for a tree with %s leaves." % (NoOfClusters, n))
+
+    Parent = np.arange(2*n - 1)
+    Merges = n - NoOfClusters
+    Parent[Tree[:Merges, 0].astype(np.int64)] = n + np.arange(Merges)
+    Parent[Tree[:Merges, 1].astype(np.int64)] = n + np.arange(Merges)
+    # Following the parents up to the root of every cluster, doubling the distance on every iteration
+    while True:
+        Grandparent = Parent[Parent]
+        if np.array_equal(Grandparent, Parent):
+            break
+        Parent = Grandparent
+
+    return np.unique(Parent[:n], return_inverse=True)[1]
+
+
+def HierClusteringBasedNodeSelection(Instances, Linkage, Neighbours=None, MinCustomers=None):
 
     '''
     This function gets as inputs the problem instances the user selects, and implements a Hierarchical Clustering algorithm. More specifically, the algorithtm 
@@ -20,7 +75,11 @@ def HierClusteringBasedNodeSelection(Instances, Linkage):
     the centroid that was just selected, with each depot left is updated to a very large number, so it will never get selected again.At last, each depot will serve
     the nodes that belong to the cluster whose centroid was assigned to the depot. It must be noted that as the assignment gets done iteratively, it is not 
     always guaranteed that each depot will be assigned to its closest centroid. Linkage, which is the way of calculating the distance between cluster centroids in
-    each iteration, can either be equal to "ward", or "complete", or "average".
+    each iteration, can either be equal to "ward", or "complete", or "average". From "MinCustomers" customers on (by default 
+    "ConnectivityMinCustomers"), only clusters that are neighbours in the graph of the "Neighbours" nearest neighbours of every 
+    customer (by default "ConnectivityNeighbours", 0 to never use the graph) are merged (see "ConnectivityTree"), so the 
+    clustering takes linear memory instead of quadratic. The tree is built in the "LinkageTree" stage without the graph and in 
+    the "ConnectivityTree" stage with it, so the peak memory of the two modes can be compared in the stage timings.
     Inputs:
     1) AllCustomers: a list of lists, where the length of the list is equal to the number of customers, and each sublist corresponds to a customer and has
        the following format: [id, x-coord, y-coord]
@@ -34,31 +93,54 @@ def HierClusteringBasedNodeSelection(Instances, Linkage):
        clients 1, 2, 3, and 4 will be served by depot "01".        
     '''
 
-
     X  = pd.DataFrame(list(Instances["allCustomers"]),
                columns =['id', 'x', 'y'])
 
     SilhouetteScoresDict = dict() # Here we will store each possible pair of number of clusters and it's silhouette score
 
-    for n_clusters in range(2, len(Instances["AllDepots"])+1):
-        clusterer = AgglomerativeClustering(n_clusters=n_clusters, linkage=Linkage)
-        preds = clusterer.fit_predict(X[["x", "y"]])
-        
+    with Stage("SilhouetteSweep"):
+        # The clustering tree is built once and cut for every candidate number of clusters. The tree uses the condensed
+        # distance matrix (or the kNN graph), while the silhouette scores compute the distances again, chunk by chunk
+        Points = X[["x", "y"]].to_numpy(dtype=float)
+        if Neighbours is None:
+            Neighbours = ConnectivityNeighbours
+        if MinCustomers is None:
+            MinCustomers = ConnectivityMinCustomers
+
+        if Neighbours > 0 and len(Points) >= MinCustomers:
+            with Stage("ConnectivityTree"):
+                Tree = ConnectivityTree(Points, Linkage, Neighbours)
+        else:
+            with Stage("LinkageTree"):
+                Tree = LinkageTree(Points, Linkage)
 
-        score = silhouette_score(X[["x", "y"]], preds)
-        
-        SilhouetteScoresDict[n_clusters] = score
+        Candidates = list(range(2, len(Instances["AllDepots"])+1))
+        Labelings = [HierarchyCut(Tree, n_clusters) for n_clusters in Candidates]
+
+        for n_clusters, score in zip(Candidates, SilhouetteScores(Points, Labelings)):
+            SilhouetteScoresDict[n_clusters] = score
 
     # Finding the number of clusters with the highest silhouette score
     NoOfClusters = max(SilhouetteScoresDict, key=SilhouetteScoresDict.get)
     
-    # Hierarchical Clustering algorithm will be fitted with the afforementioned number of clusters.
-    HierClust = AgglomerativeClustering(n_clusters=NoOfClusters, linkage=Linkage)
+    with Stage("FinalClustering"):
+        # The clusters of the afforementioned number of clusters are cut from the same tree.
+        HierClustLabels = Labelings[Candidates.index(NoOfClusters)]
+
+    return ClustersToDepots(Instances, HierClustLabels)
+
 
-    HierClust.fit(X[["x", "y"]])
+@TimedStage("DepotAssignment")
+def ClustersToDepots(Instances, HierClustLabels):
+    '''
+    This function assigns every cluster to a depot by its centroid (see "HierClusteringBasedNodeSelection"), where
+    "HierClustLabels" are the cluster labels of the customers, in the order of Instances["allCustomers"]. Then, while a depot
+    serves less than 80% of an equal share of the customers, the customers of the busiest depot that are closest to the least
+    busy depot are moved to it. It returns the dictionary of the customers served by every depot.
+    '''
 
     # Cell in which all cluster centers are found (AllClusterCentersList)
-    unique_labels_list = list(HierClust.labels_) # Converting numpy array to list
+    unique_labels_list = list(HierClustLabels) # Converting numpy array to list
 
     Labels_Dict = {} 
 
@@ -75,15 +157,12 @@ def HierClusteringBasedNodeSelection(Instances, Linkage):
                 Labels_Dict[k].append(cust[0])
 
     # Labels dict has as keys the cluster label and as values a list with cust's
-    # id's that belong to the corresponding cluster label
-    ListWithCustCoordsPerCluster = list()
-    for k, v in Labels_Dict.items():
-        ListWithCustCoordsOfSpecificCluster = list()
-        for cust in Instances["allCustomers"]:    
-            for idx in v:
-                if idx == cust[0]:
-                    ListWithCustCoordsOfSpecificCluster.append([cust[1], cust[2]])
-        ListWithCustCoordsPerCluster.append(ListWithCustCoordsOfSpecificCluster)
+    # id's that belong to the corresponding cluster label. The coordinates of the customers of every cluster are
+    # collected in one pass over the customers, in the same order.
+    CustCoordsPerLabel = {k: list() for k in Labels_Dict}
+    for cust, label in zip(Instances["allCustomers"], unique_labels_list):
+        CustCoordsPerLabel[label].append([cust[1], cust[2]])
+    ListWithCustCoordsPerCluster = list(CustCoordsPerLabel.values())
 
 
     AllClusterCentersList = list()
@@ -137,27 +216,30 @@ def HierClusteringBasedNodeSelection(Instances, Linkage):
             FinalSelectionsDict[key] = value
 
 
-    ListOfIds = Instances["allIds"]
-
     NoOfDepots = len(Instances["AllDepots"])
 
 
-    ListOfCustIds = []  # List with only customers' Ids 
-    for i in range(NoOfDepots, len(ListOfIds)):
-        ListOfCustIds.append(ListOfIds[i])
+    # The customers' Ids, in the order of the rows that were clustered (and of the labels). The depots are not always at
+    # the start of "allIds" (e.g. they are at the end in "MDVRP_BenchmarkInstances").
+    ListOfCustIds = [cust[0] for cust in Instances["allCustomers"]]
     
-    CentroidsList = list(HierClust.labels_)
+    CentroidsList = list(HierClustLabels)
+
+    # The position of the first customer of every cluster (as "CentroidsList.index"), found once
+    FirstPositions = dict()
+    for position, label in enumerate(CentroidsList):
+        FirstPositions.setdefault(label, position)
 
     ClusterCentroidSelectionDict = {}
     PositionCounter = 0
-    for i in list(HierClust.labels_):
-        index = CentroidsList.index(i)
+    for i in CentroidsList:
+        index = FirstPositions[i]
         PositionCounter += 1
     
         if index in ClusterCentroidSelectionDict:
-            ClusterCentroidSelectionDict[index].append(PositionCounter)
+            ClusterCentroidSelectionDict[index].append(ListOfCustIds[PositionCounter - 1])
         else:
-            ClusterCentroidSelectionDict[index] = [PositionCounter]
+            ClusterCentroidSelectionDict[index] = [ListOfCustIds[PositionCounter - 1]]
 
     ClientAllocationToDepots = {}
 
@@ -165,14 +247,6 @@ def HierClusteringBasedNodeSelection(Instances, Linkage):
     for i,(k,v) in enumerate(FinalSelectionsDict.items()):
         ClientAllocationToDepots[k] = values[i]
 
-    # A dictionary containing the pairing between depots and clients will be returned.
-    #return ClientAllocationToDepots
-
-
-
-################
-################
-################
 
     CustAmountPerDepot = dict() # This dictionary includes the percentage of customers each depot will serve
     
@@ -193,11 +267,11 @@ def HierClusteringBasedNodeSelection(Instances, Linkage):
     DictOfDists = dict() # This dictionary will include the customer id of every customer that belongs to the busy depot as key, and the distance
     # between this customer and the least busy depot's x and y coordinates
 
+    CustomersById = {customer[0]: customer for customer in Instances["allCustomers"]}
     for cust in ClientAllocationToDepots[DepotThatServesMostCusts]:
-        for customer in Instances["allCustomers"]:
-            if cust == customer[0]:
-                dist = round(math.sqrt((customer[1] - DepWithLeastCustsXCoords)**2 + (customer[2] - DepWithLeastCustsYCoords)**2), 3)
-                DictOfDists[customer[0]] = dist
+        customer = CustomersById[cust]
+        dist = round(math.sqrt((customer[1] - DepWithLeastCustsXCoords)**2 + (customer[2] - DepWithLeastCustsYCoords)**2), 3)
+        DictOfDists[customer[0]] = dist
     
 
     ClientAllocationToDepots_Copy = copy.deepcopy(ClientAllocationToDepots)
@@ -217,17 +291,26 @@ def HierClusteringBasedNodeSelection(Instances, Linkage):
         else:
             return False
 
+    # The customers are moved closest first (customers at the same distance in their order), so the distances are sorted
+    # once instead of searching their minimum for every move, and the moved customers are removed from the busy depot at
+    # the end, in one pass
+    ClosestNodes = iter(sorted(DictOfDists, key=DictOfDists.get))
+    MovedNodes = set()
     while has_value(CustAmountPerDepot, ((100/NoOfDepots)/100)*0.8) == True and CustAmountPerDepot[DepotThatServesMostCusts] >= ((100/NoOfDepots)/100):
-        ClosestNode = min(DictOfDists, key=DictOfDists.get)
+        ClosestNode = next(ClosestNodes)
         
-        if ClosestNode in DictOfDists.keys():
-            del DictOfDists[ClosestNode]
+        MovedNodes.add(ClosestNode)
         ClientAllocationToDepots_Copy[DepotThatServesLeastCusts].append(ClosestNode)
-        ClientAllocationToDepots_Copy[DepotThatServesMostCusts].remove(ClosestNode)
 
         CustAmountPerDepot = dict()
         for k, v in ClientAllocationToDepots_Copy.items():
             CustAmountPerDepot[k] = (len(v) /  int(len(Instances["allCustomers"]))) 
+        CustAmountPerDepot[DepotThatServesMostCusts] = ((len(ClientAllocationToDepots_Copy[DepotThatServesMostCusts]) - len(MovedNodes)) 
+                                                        / int(len(Instances["allCustomers"])))
+
+    if MovedNodes:
+        ClientAllocationToDepots_Copy[DepotThatServesMostCusts] = [node for node in ClientAllocationToDepots_Copy[DepotThatServesMostCusts]
+                                                                   if node not in MovedNodes]
 
     are_equal = ClientAllocationToDepots_Copy == ClientAllocationToDepots
 
@@ -0,0 +1,267 @@
+import numpy as np
+from scipy.spatial import minkowski_distance
+from MDVRP_Profiling import Stage
+from MDVRP_Costs import EdgeLengths
+from miscellanious_functions import MDVRPSolve, SolutionMetrics
+
+
+DeltaTypes = ["AddCustomer", "RemoveCustomer", "MoveCustomer", "ChangeDemand", "ChangeCapacity"]
+
+
+def ApplyDelta(Instances, Delta):
+    '''
+    This function gets as inputs the problem instances and a change ("Delta"), and returns a copy of the instances with the change
+    applied. The instances given as input are not modified. "Delta" is a dictionary with a "Type" key, which is one of:
+    1) {"Type": "AddCustomer", "x": x, "y": y, "Demand": d} (an "Id" can also be given, otherwise the next free id is used),
+    2) {"Type": "RemoveCustomer", "Id": id},
+    3) {"Type": "MoveCustomer", "Id": id, "x": x, "y": y},
+    4) {"Type": "ChangeDemand", "Id": id, "Demand": d},
+    5) {"Type": "ChangeCapacity", "VehicleCap": cap}.
+    '''
+    if Delta["Type"] not in DeltaTypes:
+        raise ValueError("Unknown delta type: " + str(Delta["Type"]))
+
+    inst = dict(Instances)
+    Customers = [list(cust) for cust in Instances["allCustomers"]]
+    all_dem = [list(pair) for pair in Instances["all_dem"]]
+    CustomerIds = [cust[0] for cust in Customers]
+
+    if Delta["Type"] == "ChangeCapacity":
+        inst["VehicleCap"] = Delta["VehicleCap"]
+        return inst
+
+    if Delta["Type"] == "AddCustomer":
+        Id = Delta.get("Id", max(CustomerIds, default=0) + 1)
+        if Id in CustomerIds:
+            raise ValueError("Customer " + str(Id) + " already exists")
+        Customers.append([Id, Delta["x"], Delta["y"]])
+        all_dem.append([Id, Delta["Demand"]])
+    else:
+        if Delta["Id"] not in CustomerIds:
+            raise ValueError("Unknown customer: " + str(Delta["Id"]))
+        i = CustomerIds.index(Delta["Id"])
+        if Delta["Type"] == "RemoveCustomer":
+            del Customers[i]
+            all_dem = [pair for pair in all_dem if pair[0] != Delta["Id"]]
+        elif Delta["Type"] == "MoveCustomer":
+            Customers[i] = [Delta["Id"], Delta["x"], Delta["y"]]
+        elif Delta["Type"] == "ChangeDemand":
+            for pair in all_dem:
+                if pair[0] == Delta["Id"]:
+                    pair[1] = Delta["Demand"]
+
+    Depots = [list(depot) for depot in Instances["AllDepots"]]
+    inst["allCustomers"] = Customers
+    inst["AllDepots"] = Depots
+    inst["allNodes"] = Depots + Customers
+    inst["allIds"] = [node[0] for node in inst["allNodes"]]
+    inst["allxs"] = [node[1] for node in inst["allNodes"]]
+    inst["allys"] = [node[2] for node in inst["allNodes"]]
+    inst["NoOfCusts"] = len(Customers)
+    inst["all_dem"] = all_dem
+
+    return inst
+
+
+def CoordsRouteCost(Route, Coords):
+    '''
+    This function calculates the cost of a route (a list of node ids that starts and ends with the depot) the same way as the
+    Clarke & Wright Savings Algorithm: the sum of the distances between consecutive nodes, each rounded to 1 decimal. Unlike
+    "MDVRP_Costs.RouteCost", it takes the coordinates of the nodes by id ("Coords") instead of a distance array.
+    '''
+    cost = 0
+    for d in EdgeLengths([Coords[node] for node in Route]):
+        cost = cost + d
+    return round(cost, 2)
+
+
+def CheapestInsertion(Customer, Depot, Routes, Loads, Coords, Demand, Cap, NoOfVehicles):
+    '''
+    This function inserts a customer in the routes of a depot (lists of node ids that start and end with the depot) at the position
+    that increases the cost the least, without violating the vehicle capacity. If the depot still has an unused vehicle, a new
+    route that only serves the customer is considered as well. The routes and their loads are updated in place, and the index
+    of the route the customer was inserted in is returned (or None, if the customer could not be inserted anywhere).
+    '''
+    x = np.array(Coords[Customer], dtype=float)
+    BestRoute = None
+    BestPosition = None
+    BestIncrease = np.inf
+
+    for r, route in enumerate(Routes):
+        if Loads[r] + Demand > Cap:
+            continue
+        points = np.array([Coords[node] for node in route], dtype=float)
+        ToCustomer = np.round(minkowski_distance(points, x, 2), 1)
+        Edges = EdgeLengths(points)
+        Increase = ToCustomer[:-1] + ToCustomer[1:] - Edges
+        k = int(np.argmin(Increase))
+        if Increase[k] < BestIncrease:
+            BestRoute, BestPosition, BestIncrease = r, k + 1, Increase[k]
+
+    if len(Routes) < NoOfVehicles and Demand <= Cap:
+        NewRouteCost = 2*np.round(minkowski_distance(np.array(Coords[Depot], dtype=float), x, 2), 1)
+        if NewRouteCost < BestIncrease:
+            BestRoute, BestPosition = len(Routes), None
+
+    if BestRoute is None:
+        return None
+
+    if BestPosition is None:
+        Routes.append([Depot, Customer, Depot])
+        Loads.append(Demand)
+    else:
+        Routes[BestRoute].insert(BestPosition, Customer)
+        Loads[BestRoute] = Loads[BestRoute] + Demand
+
+    return BestRoute
+
+
+def RemovalRepair(Customer, Routes):
+    '''
+    This function removes a customer from the routes of a depot, by connecting its predecessor directly to its successor. A route
+    that is left without customers is dropped. The routes are updated in place, and the function returns True if the customer 
+    was found in a route.
+    '''
+    for r, route in enumerate(Routes):
+        if Customer in route[1:-1]:
+            route.remove(Customer)
+            if len(route) == 2:
+                del Routes[r]
+            return True
+    return False
+
+
+def LocalDepotSelection(Customer, Instances, Selection, Coords, Demand):
+    '''
+    This function assigns a (new or moved) customer to a depot without clustering all customers again: the customer is assigned to
+    the depot whose assigned customers have the closest centroid (the depot itself, if it has no customers), among the depots
+    whose fleet (number of vehicles times the vehicle capacity) can still carry the customer's demand. If no depot can, the
+    closest centroid is used.
+    '''
+    dem = {pair[0]: pair[1] for pair in Instances["all_dem"]}
+    FleetCap = Instances["NoOfVehicles"]*Instances["VehicleCap"]
+    x = np.array(Coords[Customer], dtype=float)
+
+    Distances = list()
+    for depot, customers in Selection.items():
+        others = [c for c in customers if c != Customer]
+        if others:
+            centroid = np.array([Coords[c] for c in others], dtype=float).mean(axis=0)
+        else:
+            centroid = np.array(Coords[depot], dtype=float)
+        Spare = FleetCap - sum(dem[c] for c in others)
+        Distances.append((Spare < Demand, float(minkowski_distance(centroid, x, 2)), depot))
+
+    return min(Distances)[2]
+
+
+def DepotRepair(depot, Solution, Instances, Selection, Coords, Removed=(), Inserted=(), RepairCapacity=False, InsertUnserved=False):
+    '''
+    This function re-routes a single depot of the solution: the customers in "Removed" are taken out of their routes, and the
+    customers in "Inserted" are added with cheapest insertion. If "RepairCapacity" is True, the customers of overloaded routes are
+    removed (the ones whose removal saves the most first) until the routes are feasible, and then they are inserted again. If
+    "InsertUnserved" is True, the customers of the depot that are not served by any route (e.g. because of the fleet trimming of
+    the routing heuristic) are inserted as well. It returns the new solution and the number of customers that changed route.
+    '''
+    DepotId = Solution.DepotIds[depot]
+    Cap = Instances["VehicleCap"]
+    NoOfVehicles = Instances["NoOfVehicles"]
+    dem = {pair[0]: pair[1] for pair in Instances["all_dem"]}
+
+    Routes = Solution.DepotRoutesLists(depot)
+    Changed = 0
+
+    for customer in Removed:
+        if RemovalRepair(customer, Routes):
+            Changed = Changed + 1
+
+    Loads = [sum(dem[c] for c in route[1:-1]) for route in Routes]
+
+    ToInsert = list(Inserted)
+    if RepairCapacity:
+        for r, route in enumerate(Routes):
+            while Loads[r] > Cap:
+                Savings = [CoordsRouteCost(route, Coords) - CoordsRouteCost(route[:k] + route[k+1:], Coords) for k in range(1, len(route) - 1)]
+                customer = route[1 + int(np.argmax(Savings))]
+                route.remove(customer)
+                Loads[r] = Loads[r] - dem[customer]
+                ToInsert.append(customer)
+        Loads = [load for route, load in zip(Routes, Loads) if len(route) > 2]
+        Routes = [route for route in Routes if len(route) > 2]
+    if InsertUnserved:
+        Served = set(c for route in Routes for c in route[1:-1])
+        ToInsert.extend(c for c in Selection[DepotId] if c not in Served and c not in ToInsert)
+
+    for customer in ToInsert:
+        CheapestInsertion(customer, DepotId, Routes, Loads, Coords, dem[customer], Cap, NoOfVehicles)
+        Changed = Changed + 1
+
+    RouteCosts = [CoordsRouteCost(route, Coords) for route in Routes]
+    DepotCost = 0
+    for c in RouteCosts:
+        DepotCost = DepotCost + c
+        DepotCost = round(DepotCost, 2)
+
+    return Solution.WithDepotRoutes(depot, Routes, RouteCosts, DepotCost, Instances["all_dem"]), Changed
+
+
+def IncrementalResolve(Instances, Result, Delta, Heuristic="KMeans", MaxDrift=0.1):
+    '''
+    This function updates an existing MDVRP solution after a single change, instead of solving the whole problem again. It gets
+    as inputs: 1) the problem instances the solution was created for, 2) the dictionary returned by "MDVRPSolve" (or by this
+    function), 3) the change (see "ApplyDelta"), 4) the node selection heuristic used for a full solve, and 5) the maximum drift.
+    The customer that changed is assigned to a depot locally (see "LocalDepotSelection"), and only the routes of the affected
+    depots are repaired, with removal repair and cheapest insertion (a capacity change repairs every depot). The drift is the
+    share of the customers that changed route since the last full solve. When it exceeds "MaxDrift", the repaired solution is
+    discarded and the whole problem is solved again with "MDVRPSolve". The function returns the dictionary of "MDVRPSolve",
+    along with the updated instances ("Instances"), the drift ("Drift"), and whether a full solve was made ("FullSolve").
+    '''
+    NewInstances = ApplyDelta(Instances, Delta)
+    Solution = Result["Solution"]
+    Selection = {depot: list(customers) for depot, customers in Result["Selection"].items()}
+    Coords = {node[0]: (node[1], node[2]) for node in NewInstances["allNodes"]}
+    Demands = {pair[0]: pair[1] for pair in NewInstances["all_dem"]}
+    DepotPosition = {depot: i for i, depot in enumerate(Solution.DepotIds)}
+
+    with Stage("IncrementalRepair"):
+        Changed = 0
+        if Delta["Type"] == "ChangeCapacity":
+            for depot in range(len(Solution.DepotIds)):
+                Solution, n = DepotRepair(depot, Solution, NewInstances, Selection, Coords, RepairCapacity=True, InsertUnserved=True)
+                Changed = Changed + n
+        else:
+            Customer = NewInstances["allCustomers"][-1][0] if Delta["Type"] == "AddCustomer" else Delta["Id"]
+            OldDepot = None
+            for depot, customers in Selection.items():
+                if Customer in customers:
+                    OldDepot = depot
+
+            if Delta["Type"] == "ChangeDemand":
+                # An unserved customer is inserted again, since it may now fit in a route
+                Unserved = [] if Customer in Solution.Tour else [Customer]
+                Solution, Changed = DepotRepair(DepotPosition[OldDepot], Solution, NewInstances, Selection, Coords, Inserted=Unserved, RepairCapacity=True)
+            else:
+                if OldDepot is not None:
+                    Selection[OldDepot].remove(Customer)
+                    Solution, Changed = DepotRepair(DepotPosition[OldDepot], Solution, NewInstances, Selection, Coords, Removed=[Customer])
+                if Delta["Type"] in ("AddCustomer", "MoveCustomer"):
+                    NewDepot = LocalDepotSelection(Customer, NewInstances, Selection, Coords, Demands[Customer])
+                    Selection[NewDepot].append(Customer)
+                    Solution, n = DepotRepair(DepotPosition[NewDepot], Solution, NewInstances, Selection, Coords, Inserted=[Customer])
+                    Changed = max(Changed, n)
+
+    Drift = Result.get("Drift", 0) + Changed/max(NewInstances["NoOfCusts"], 1)
+
+    if Drift > MaxDrift:
+        NewResult = MDVRPSolve(NewInstances, Heuristic)
+        NewResult.update({"Instances": NewInstances, "Drift": 0, "FullSolve": True})
+        return NewResult
+
+    Metrics = SolutionMetrics(Solution, NewInstances["all_dem"], Selection, NewInstances["VehicleCap"])
+
+    return {"Selection": Selection,
+            "Solution": Solution,
+            "Metrics": Metrics,
+            "Instances": NewInstances,
+            "Drift": Drift,
+            "FullSolve": False}
@@ -1,12 +1,8 @@
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
 import pandas as pd
 import numpy as np
 import math
-import warnings
-warnings.filterwarnings(action='ignore', category=UserWarning)
-import os
-os.environ["OMP_NUM_THREADS"] = '1'
+from MDVRP_Profiling import Stage, TimedStage
+from MDVRP_Silhouette import SilhouetteScores
 
 
 def KMeansClusteringBasedNodesSelection(Instances):
@@ -33,19 +29,25 @@ def KMeansClusteringBasedNodesSelection(Instances):
        clients 1, 2, 3, and 4 will be served by depot "01".        
     '''
 
+    # scikit-learn is only imported when a selection is made, so importing the solver stays fast
+    from sklearn.cluster import KMeans
+
     X = pd.DataFrame(list(Instances["allCustomers"]),
                columns =['id', 'x', 'y'])
 
     SilhouetteScoresDict = dict() # Here we will store each possible pair of number of clusters and it's silhouette score
 
-    for n_clusters in range(2, len(Instances["AllDepots"])+1):
-        clusterer = KMeans(n_clusters=n_clusters, random_state=int(Instances["Seed"]))
-        preds = clusterer.fit_predict(X[["x", "y"]])
-        #centers = clusterer.cluster_centers_
+    with Stage("SilhouetteSweep"):
+        Candidates = list(range(2, len(Instances["AllDepots"])+1))
+        Labelings = list()
+        for n_clusters in Candidates:
+            clusterer = KMeans(n_clusters=n_clusters, random_state=int(Instances["Seed"]))
+            preds = clusterer.fit_predict(X[["x", "y"]])
+            Labelings.append(preds)
 
-        score = silhouette_score(X[["x", "y"]], preds)
-        
-        SilhouetteScoresDict[n_clusters] = score
+        # All numbers of clusters are scored in one pass over the customers' distances (see "SilhouetteScores")
+        for n_clusters, score in zip(Candidates, SilhouetteScores(X[["x", "y"]].to_numpy(dtype=float), Labelings)):
+            SilhouetteScoresDict[n_clusters] = score
 
     # Finding the number of clusters with the highest silhouette score
     NoOfClusters = max(SilhouetteScoresDict, key=SilhouetteScoresDict.get)
@@ -53,9 +55,21 @@ def KMeansClusteringBasedNodesSelection(Instances):
     # Kmeans algorithm will be fitted with the afforementioned number of clusters.
     Kmean = KMeans(n_clusters=NoOfClusters, random_state=int(Instances["Seed"]))
 
-    Kmean.fit(X[["x", "y"]])
+    with Stage("FinalClustering"):
+        Kmean.fit(X[["x", "y"]])
 
     AllClusterCenters = Kmean.cluster_centers_ # Array
+
+    return ClustersToDepots(Instances, AllClusterCenters, Kmean.labels_)
+
+
+@TimedStage("DepotAssignment")
+def ClustersToDepots(Instances, AllClusterCenters, Labels):
+    '''
+    This function assigns every cluster center to a depot (see "KMeansClusteringBasedNodesSelection"), and returns the dictionary
+    of the customers served by every depot, where "Labels" are the cluster labels of the customers, in the order of
+    Instances["allCustomers"].
+    '''
     AllClusterCentersList = []
     for j in AllClusterCenters:
         j = list(j)
@@ -106,27 +120,22 @@ def KMeansClusteringBasedNodesSelection(Instances):
             FinalSelectionsDict[key] = value
 
 
-    ListOfIds = Instances["allIds"]
-
-    NoOfDepots = len(Instances["AllDepots"])
-
-
-    ListOfCustIds = []  # List with only customers' Ids 
-    for i in range(NoOfDepots, len(ListOfIds)):
-        ListOfCustIds.append(ListOfIds[i])
+    # The customers' Ids, in the order of the rows that were clustered (and of the labels). The depots are not always at
+    # the start of "allIds" (e.g. they are at the end in "MDVRP_BenchmarkInstances").
+    ListOfCustIds = [cust[0] for cust in Instances["allCustomers"]]
 
-    CentroidsList = list(Kmean.labels_)
+    CentroidsList = list(Labels)
 
     ClusterCentroidSelectionDict = {}
     PositionCounter = 0
-    for i in list(Kmean.labels_):
+    for i in list(Labels):
         index = CentroidsList.index(i)
         PositionCounter += 1
     
         if index in ClusterCentroidSelectionDict:
-            ClusterCentroidSelectionDict[index].append(PositionCounter)
+            ClusterCentroidSelectionDict[index].append(ListOfCustIds[PositionCounter - 1])
         else:
-            ClusterCentroidSelectionDict[index] = [PositionCounter]
+            ClusterCentroidSelectionDict[index] = [ListOfCustIds[PositionCounter - 1]]
 
     ClientAllocationToDepots = {}
 
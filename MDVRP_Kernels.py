@@ -0,0 +1,265 @@
+import importlib.util
+import numpy as np
+from MDVRP_Costs import FlatRoutesCosts
+
+# The kernels below are compiled with Numba when it is installed. Otherwise, the same functions run as plain Python on lists
+# (which are faster to index than NumPy arrays in pure Python), and the savings and route costs use the NumPy versions.
+# Numba itself is only imported when the first kernel is compiled (see "Compiled").
+NumbaAvailable = importlib.util.find_spec("numba") is not None
+
+UseNumba = NumbaAvailable
+
+CompiledKernels = dict()
+
+
+def SetNumbaEnabled(Enabled):
+    '''
+    This function selects whether the compiled kernels are used (if Numba is installed), e.g. to compare both paths. It returns
+    whether they will be used.
+    '''
+    global UseNumba
+    UseNumba = bool(Enabled) and NumbaAvailable
+    return UseNumba
+
+
+def SavingsKernel(D, first, second, savings):
+    k = 0
+    for i in range(1, D.shape[0]):
+        for j in range(i + 1, D.shape[0]):
+            first[k] = i
+            second[k] = j
+            savings[k] = D[i, 0] + D[j, 0] - D[i, j]
+            k = k + 1
+
+
+def MergeKernel(PairsFirst, PairsSecond, Cap, RouteOf, Head, Tail, Load, Next, Prev):
+    '''
+    The merge loop of the Clarke & Wright Savings Algorithm, on node positions (1, 2, ..., n for the customers). Route r starts as
+    [0, r, 0] (or as the initial route whose first customer is r, see "MergeRoutes"), and each route is kept as a doubly linked list ("Next", "Prev", where 0 is the depot) with its first and last
+    customer ("Head", "Tail") and its load ("Load", initialized with the demands). "RouteOf" is the route of every customer. A
+    merged route keeps the index of the route of the pair's first node, so the routes are found in the same order as the list
+    of routes of the original loop.
+    '''
+    for k in range(len(PairsFirst)):
+        a = PairsFirst[k]
+        b = PairsSecond[k]
+        ra = RouteOf[a]
+        rb = RouteOf[b]
+        if ra == rb:
+            continue
+        if not ((Head[ra] == a or Tail[ra] == a) and (Head[rb] == b or Tail[rb] == b)):
+            continue
+        if Load[ra] + Load[rb] > Cap:
+            continue
+
+        if Head[ra] == a:
+            if Head[rb] == b and Tail[rb] != b:
+                # Reversing the second route, so that "b" is its last customer
+                node = Head[rb]
+                while node != 0:
+                    following = Next[node]
+                    Next[node] = Prev[node]
+                    Prev[node] = following
+                    node = following
+                Head[rb], Tail[rb] = Tail[rb], Head[rb]
+            # second route + first route
+            Next[Tail[rb]] = Head[ra]
+            Prev[Head[ra]] = Tail[rb]
+            Head[ra] = Head[rb]
+        else:
+            if Tail[rb] == b and Head[rb] != b:
+                # Reversing the second route, so that "b" is its first customer
+                node = Head[rb]
+                while node != 0:
+                    following = Next[node]
+                    Next[node] = Prev[node]
+                    Prev[node] = following
+                    node = following
+                Head[rb], Tail[rb] = Tail[rb], Head[rb]
+            # first route + second route
+            Next[Tail[ra]] = Head[rb]
+            Prev[Head[rb]] = Tail[ra]
+            Tail[ra] = Tail[rb]
+
+        node = Head[rb]
+        while node != 0:
+            RouteOf[node] = ra
+            node = Next[node]
+        Load[ra] = Load[ra] + Load[rb]
+        Head[rb] = 0
+        Tail[rb] = 0
+        Load[rb] = 0
+
+
+def RouteCostsKernel(Nodes, Offsets, D, Costs):
+    for r in range(len(Offsets) - 1):
+        cost = 0.0
+        for k in range(Offsets[r], Offsets[r+1] - 1):
+            cost = cost + D[Nodes[k], Nodes[k+1]]
+        Costs[r] = cost
+
+
+def SplitKernel(Tour, Demand, D, Cap, Best, Pred):
+    '''
+    The split dynamic program of the route-first cluster-second heuristic (Prins): "Tour" holds the customer positions of a giant
+    tour, and "Best[j]" is the lowest cost of serving its first j customers with routes that each serve a consecutive part of the
+    tour within the vehicle capacity (a customer whose demand exceeds the capacity gets a route of its own), with "Pred[j]" the
+    start of the last of these routes. The routes that start at each customer stop growing at the capacity, so it takes O(n L)
+    time, where L is the largest number of customers in a route.
+    '''
+    n = len(Tour)
+    for i in range(n):
+        load = 0.0
+        cost = 0.0
+        for j in range(i + 1, n + 1):
+            node = Tour[j-1]
+            load = load + Demand[node]
+            if j == i + 1:
+                cost = D[0, node] + D[node, 0]
+            else:
+                if load > Cap:
+                    break
+                previous = Tour[j-2]
+                cost = cost - D[previous, 0] + D[previous, node] + D[node, 0]
+            if Best[i] + cost < Best[j]:
+                Best[j] = Best[i] + cost
+                Pred[j] = i
+
+
+def Compiled(Kernel):
+    '''
+    This function returns the Numba version of a kernel. It is compiled (or loaded from Numba's cache) the first time it is needed.
+    '''
+    if Kernel.__name__ not in CompiledKernels:
+        from numba import njit
+        CompiledKernels[Kernel.__name__] = njit(cache=True)(Kernel)
+    return CompiledKernels[Kernel.__name__]
+
+
+def SavingsPairs(D):
+    '''
+    This function returns all customer pairs (first[k], second[k]) with first[k] < second[k], in row major order, along with their
+    savings D[i, 0] + D[j, 0] - D[i, j], where the depot is at position 0 of the distance array "D".
+    '''
+    if UseNumba:
+        m = (D.shape[0] - 1)*(D.shape[0] - 2)//2
+        first = np.empty(m, dtype=np.int64)
+        second = np.empty(m, dtype=np.int64)
+        savings = np.empty(m)
+        Compiled(SavingsKernel)(D, first, second, savings)
+        return first, second, savings
+    first, second = np.triu_indices(D.shape[0] - 1, 1)
+    first = first + 1
+    second = second + 1
+    return first, second, D[first, 0] + D[second, 0] - D[first, second]
+
+
+def SavingsOrder(savings):
+    '''
+    This function returns the order of the savings by descending value. Pairs with equal savings are ordered exactly as by
+    pandas' "sort_values(ascending=False)", which the heuristic used before (a quicksort of the reversed array, reversed back),
+    without the overhead of creating a Series.
+    '''
+    Reversed = np.arange(len(savings))[::-1]
+    return Reversed[savings[::-1].argsort(kind="quicksort")][::-1]
+
+
+def MergeRoutes(PairsFirst, PairsSecond, Demand, Cap, Routes=None):
+    '''
+    This function runs the merge loop of the Clarke & Wright Savings Algorithm over the sorted customer pairs, where the nodes
+    are positions (the depot is 0, and "Demand" is indexed by position). Instead of scanning all routes for every pair, the route
+    of every customer and the ends of every route are indexed (see "MergeKernel"). The loop starts from one route per customer,
+    or from the given "Routes" (lists of positions that start and end with the depot, e.g. to merge routes that were built
+    separately). It returns the routes as lists of positions that start and end with the depot, in the same order as the
+    original merge loop (by the position of the first customer of each initial route).
+    '''
+    n = len(Demand)
+    RouteOf = list(range(n))
+    Head = list(range(n))
+    Tail = list(range(n))
+    Load = list(Demand)
+    Next = [0]*n
+    Prev = [0]*n
+    if Routes is not None:
+        # Every route is identified by its first customer, and its customers are linked in visiting order
+        Head = [0]*n
+        Tail = [0]*n
+        Load = [0]*n
+        for route in Routes:
+            customers = route[1:-1]
+            r = customers[0]
+            Head[r] = customers[0]
+            Tail[r] = customers[-1]
+            Load[r] = sum(Demand[c] for c in customers)
+            for a, b in zip(customers[:-1], customers[1:]):
+                Next[a] = b
+                Prev[b] = a
+            for c in customers:
+                RouteOf[c] = r
+
+    if UseNumba:
+        RouteOf = np.array(RouteOf, dtype=np.int64)
+        Head = np.array(Head, dtype=np.int64)
+        Tail = np.array(Tail, dtype=np.int64)
+        Load = np.array(Load, dtype=np.float64)
+        Next = np.array(Next, dtype=np.int64)
+        Prev = np.array(Prev, dtype=np.int64)
+        Compiled(MergeKernel)(np.asarray(PairsFirst, dtype=np.int64), np.asarray(PairsSecond, dtype=np.int64),
+                              float(Cap), RouteOf, Head, Tail, Load, Next, Prev)
+        Head = Head.tolist()
+        Next = Next.tolist()
+    else:
+        MergeKernel(np.asarray(PairsFirst).tolist(), np.asarray(PairsSecond).tolist(), Cap, RouteOf, Head, Tail, Load, Next, Prev)
+
+    Routes = list()
+    for r in range(1, n):
+        if Head[r] != 0:
+            route = [0]
+            node = Head[r]
+            while node != 0:
+                route.append(node)
+                node = Next[node]
+            route.append(0)
+            Routes.append(route)
+    return Routes
+
+
+def RouteCostsValues(Routes, D):
+    '''
+    This function returns the cost of each route (lists of positions in "D"), summing the edges of every route in visiting order.
+    '''
+    Lengths = [len(route) for route in Routes]
+    Offsets = np.concatenate(([0], np.cumsum(Lengths, dtype=np.int64)))
+    Nodes = np.fromiter((node for route in Routes for node in route), dtype=np.int64, count=int(Offsets[-1]))
+    if UseNumba:
+        Costs = np.empty(len(Routes))
+        Compiled(RouteCostsKernel)(Nodes, Offsets, D, Costs)
+        return Costs
+    return FlatRoutesCosts(Nodes, Offsets, D)
+
+
+def SplitTour(Tour, Demand, D, Cap):
+    '''
+    This function splits a giant tour (a list of customer positions in the distance array "D", where the depot is at position 0)
+    into the routes of lowest total cost that visit the customers in the order of the tour, without exceeding the vehicle
+    capacity "Cap" (see "SplitKernel"). It returns the routes as lists of positions that start and end with the depot, in the
+    order of the tour.
+    '''
+    n = len(Tour)
+    Best = [0.0] + [float("inf")]*n
+    Pred = [0]*(n + 1)
+    if UseNumba:
+        Best = np.array(Best)
+        Pred = np.array(Pred, dtype=np.int64)
+        Compiled(SplitKernel)(np.asarray(Tour, dtype=np.int64), np.asarray(Demand, dtype=np.float64), D, float(Cap), Best, Pred)
+        Pred = Pred.tolist()
+    else:
+        SplitKernel(list(Tour), list(Demand), D, Cap, Best, Pred)
+
+    Routes = list()
+    j = n
+    while j > 0:
+        Routes.append([0] + list(Tour[Pred[j]:j]) + [0])
+        j = Pred[j]
+    Routes.reverse()
+    return Routes
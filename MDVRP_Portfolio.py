@@ -0,0 +1,131 @@
+'''
+Portfolio solves: all node selection heuristics race on the same instance, each in its own process, and the best solution by a
+configurable objective is kept, so finding the best heuristic for an instance costs about the latency of the slowest heuristic
+instead of the sum of all of them. For example:
+
+    from MDVRP_Portfolio import PortfolioSolve
+    Portfolio = PortfolioSolve(inst, Objective="FairCost", Deadline=10)
+    Portfolio["Best"], Portfolio["Metrics"], [(run["Heuristic"], run["Status"]) for run in Portfolio["Runs"]]
+
+The instance is published once as shared arrays (see "MDVRP_SharedMemory"), so the processes read it without copying it. With a
+"Deadline" (in seconds), the runs that have not finished by then are cancelled (their processes are terminated), and the best of
+the finished runs is kept.
+'''
+import multiprocessing
+import queue
+import time
+from MDVRP_Runtime import ConfigureRuntime, WarmUp
+from MDVRP_SharedMemory import SharedBlocks, PublishInstances, AttachInstances
+
+# The metrics of every run that "PortfolioSolve" can use as its objective by name (see "SolutionMetrics" and "PortfolioRun")
+ObjectiveNames = ["TotalCost", "AvgRouteCost", "MedianRouteCost", "AvgDepotCost", "MedianDepotCost", "PctOfTotalDemandSatisfied",
+                  "DemandSatisfied", "TotalDemand", "PctOfCustomersVisited", "AvgRouteLoad", "RouteCostStdDev", "RouteCostRange",
+                  "AvgRouteUtilisation", "MinRouteUtilisation", "MaxRouteUtilisation", "UnservedCost", "FairCost"]
+
+# The objectives of "PortfolioSolve" that are maximised (all other metrics are minimised)
+MaximizedObjectives = ["PctOfTotalDemandSatisfied", "PctOfCustomersVisited"]
+
+
+def PortfolioRun(Descriptor, Heuristic, Routing, Threads, Results):
+    '''
+    The process of one heuristic of "PortfolioSolve": it attaches the shared instance, solves it with the heuristic and the
+    routing heuristic with the given names (see "MDVRPSolve" and "RoutingHeuristics"), and puts the result (or the error) in
+    the "Results" queue.
+    '''
+    ConfigureRuntime(Threads)
+    st = time.perf_counter()
+    try:
+        from miscellanious_functions import MDVRPSolve, RoutingHeuristics, UnservedCustomersCost
+
+        Instances = AttachInstances(Descriptor)
+        Solution = MDVRPSolve(Instances, Heuristic, RoutingHeuristics[Routing])
+        Unserved = UnservedCustomersCost(Instances, Solution["Selection"], Solution["Solution"])
+        Metrics = dict(Solution["Metrics"], UnservedCost=Unserved["UnservedCost"],
+                       FairCost=round(Solution["Metrics"]["TotalCost"] + Unserved["UnservedCost"], 2))
+        Results.put({"Heuristic": Heuristic, "Status": "Finished", "Selection": Solution["Selection"],
+                     "Solution": Solution["Solution"], "Metrics": Metrics, "ElapsedTime": round(time.perf_counter() - st, 4)})
+    except Exception as e:
+        Results.put({"Heuristic": Heuristic, "Status": "Failed", "Error": type(e).__name__ + ": " + str(e),
+                     "ElapsedTime": round(time.perf_counter() - st, 4)})
+
+
+def ObjectiveValue(Run, Objective):
+    '''
+    Returns the value of a finished run for the given objective, as a number to minimise: the objective is either the name of
+    a metric of the run (one of "ObjectiveNames": the metrics of "SolutionMetrics", plus "UnservedCost" and "FairCost", the total
+    cost with a round trip for every customer left unserved), which is maximised if it is one of "MaximizedObjectives", or a
+    function of the metrics.
+    '''
+    if callable(Objective):
+        return Objective(Run["Metrics"])
+    if Objective not in Run["Metrics"]:
+        raise ValueError("Unknown objective: " + str(Objective))
+    if Objective in MaximizedObjectives:
+        return -Run["Metrics"][Objective]
+    return Run["Metrics"][Objective]
+
+
+def PortfolioSolve(Instances, Heuristics=None, Objective="FairCost", Deadline=None, Routing="ClarkeAndWright", Threads=1):
+    '''
+    This function solves the given problem instances with every node selection heuristic of "Heuristics" (by default all of
+    "SelectionHeuristics") at the same time, each in its own process using "Threads" threads, and returns the best solution by
+    the given objective (see "ObjectiveValue"), the total cost with a round trip for every unserved customer ("FairCost") by
+    default. Runs with the same objective value are ranked in the order of "Heuristics". If "Deadline" is given, the runs that
+    have not finished after "Deadline" seconds are cancelled. It returns a dictionary with the name of the best heuristic
+    ("Best", None if no run finished), its "Selection", "Solution" and "Metrics", the total "ElapsedTime", and one entry per
+    heuristic ("Runs"), with its "Status" ("Finished", "Failed" or "Cancelled"), its "Metrics" or "Error", and its
+    "ElapsedTime". An objective name that is not one of "ObjectiveNames" raises a ValueError before any run is started.
+    '''
+    if not callable(Objective) and Objective not in ObjectiveNames:
+        raise ValueError("Unknown objective: " + str(Objective))
+    if Heuristics is None:
+        from miscellanious_functions import SelectionHeuristics
+        Heuristics = SelectionHeuristics
+    Heuristics = list(Heuristics)
+
+    # Where processes are forked, they inherit the imported libraries and compiled kernels instead of loading them once each
+    WarmUp()
+
+    st = time.perf_counter()
+    Runs = dict()
+    with SharedBlocks() as Blocks:
+        Descriptor = PublishInstances(Blocks, Instances)
+        Results = multiprocessing.Queue()
+        Processes = {h: multiprocessing.Process(target=PortfolioRun, args=(Descriptor, h, Routing, Threads, Results), daemon=True)
+                     for h in Heuristics}
+        for Process in Processes.values():
+            Process.start()
+
+        try:
+            while len(Runs) < len(Heuristics):
+                Timeout = None if Deadline is None else Deadline - (time.perf_counter() - st)
+                if Timeout is not None and Timeout <= 0:
+                    break
+                try:
+                    Run = Results.get(timeout=1 if Timeout is None else min(Timeout, 1))
+                except queue.Empty:
+                    # A process that ended without a result was killed (e.g. by the out-of-memory killer)
+                    for h, Process in Processes.items():
+                        if h not in Runs and not Process.is_alive() and Results.empty():
+                            Runs[h] = {"Heuristic": h, "Status": "Failed", "Error": "The process exited with code " + str(Process.exitcode),
+                                       "ElapsedTime": round(time.perf_counter() - st, 4)}
+                    continue
+                Runs[Run["Heuristic"]] = Run
+        finally:
+            for h, Process in Processes.items():
+                if Process.is_alive():
+                    Process.terminate()
+                Process.join()
+                if h not in Runs:
+                    Runs[h] = {"Heuristic": h, "Status": "Cancelled", "ElapsedTime": round(time.perf_counter() - st, 4)}
+            Results.close()
+
+    Finished = [Runs[h] for h in Heuristics if Runs[h]["Status"] == "Finished"]
+    Best = min(Finished, key=lambda run: ObjectiveValue(run, Objective)) if Finished else None
+
+    return {"Best": Best["Heuristic"] if Best else None,
+            "Selection": Best["Selection"] if Best else None,
+            "Solution": Best["Solution"] if Best else None,
+            "Metrics": Best["Metrics"] if Best else None,
+            "ElapsedTime": round(time.perf_counter() - st, 4),
+            "Runs": [{k: v for k, v in Runs[h].items() if k not in ("Selection", "Solution")} for h in Heuristics]}
@@ -0,0 +1,199 @@
+import time
+import tracemalloc
+import contextvars
+import contextlib
+import functools
+import cProfile
+import pstats
+import io
+
+
+# The "StageTimings" object that collects the measurements of the current solve. It is a context variable, so concurrent
+# Streamlit sessions (which run in separate threads) do not write in each other's timings.
+ActiveStageTimings = contextvars.ContextVar("ActiveStageTimings", default=None)
+
+PipelineStages = ["InstanceBuild", "LinkageTree", "ConnectivityTree", "SilhouetteSweep", "FinalClustering", "DepotAssignment",
+                  "DistanceMatrix", "Savings", "MergeLoop", "RouteConstruction", "FleetTrimming", "Metrics", "Plotting"]
+
+
+class StageTimings:
+    '''
+    This class stores, for every stage of the solve pipeline, the total wall time, the total CPU time, the number of calls, and
+    (when memory tracing is enabled) the peak memory allocated while the stage was running, in MB.
+    '''
+    def __init__(self, TraceMemory=False):
+        self.TraceMemory = TraceMemory
+        self.Stages = dict()
+        self.OpenStages = list()
+
+    def Record(self, Name, WallTime, CpuTime, PeakMemory):
+        if Name not in self.Stages:
+            self.Stages[Name] = {"WallTime": 0.0, "CpuTime": 0.0, "Calls": 0, "PeakMemoryMB": None}
+        stage = self.Stages[Name]
+        stage["WallTime"] = stage["WallTime"] + WallTime
+        stage["CpuTime"] = stage["CpuTime"] + CpuTime
+        stage["Calls"] = stage["Calls"] + 1
+        if PeakMemory is not None:
+            stage["PeakMemoryMB"] = max(stage["PeakMemoryMB"] or 0, round(PeakMemory/2**20, 3))
+
+    def Merge(self, Other):
+        '''
+        Adds the measurements of another "StageTimings" object (or of its "AsDict" output) to this one.
+        '''
+        Stages = Other.Stages if isinstance(Other, StageTimings) else Other
+        for Name, stage in Stages.items():
+            if Name not in self.Stages:
+                self.Stages[Name] = {"WallTime": 0.0, "CpuTime": 0.0, "Calls": 0, "PeakMemoryMB": None}
+            own = self.Stages[Name]
+            own["WallTime"] = own["WallTime"] + stage["WallTime"]
+            own["CpuTime"] = own["CpuTime"] + stage["CpuTime"]
+            own["Calls"] = own["Calls"] + stage["Calls"]
+            if stage["PeakMemoryMB"] is not None:
+                own["PeakMemoryMB"] = max(own["PeakMemoryMB"] or 0, stage["PeakMemoryMB"])
+
+    def AsDict(self):
+        '''
+        Returns the measurements as a plain (picklable) dictionary, with the stages in pipeline order and the times rounded.
+        '''
+        Order = PipelineStages + sorted(k for k in self.Stages if k not in PipelineStages)
+        return {Name: {"WallTime": round(self.Stages[Name]["WallTime"], 4),
+                       "CpuTime": round(self.Stages[Name]["CpuTime"], 4),
+                       "Calls": self.Stages[Name]["Calls"],
+                       "PeakMemoryMB": self.Stages[Name]["PeakMemoryMB"]}
+                for Name in Order if Name in self.Stages}
+
+    def AsRows(self):
+        '''
+        Returns the measurements as a list of rows ([Stage, WallTime, CpuTime, Calls, PeakMemoryMB]), e.g. for a dataframe.
+        '''
+        return [[Name] + list(v.values()) for Name, v in self.AsDict().items()]
+
+
+@contextlib.contextmanager
+def RecordStageTimings(TraceMemory=False):
+    '''
+    Context manager that collects the timings of all stages executed inside it, e.g.:
+
+        with RecordStageTimings() as Timings:
+            Container = RoutingInfoContainer(...)
+        print(Timings.AsDict())
+
+    If "TraceMemory" is True, the peak memory of each stage is measured with "tracemalloc", which slows down the solve.
+    '''
+    Timings = StageTimings(TraceMemory)
+    token = ActiveStageTimings.set(Timings)
+    StartedTracing = False
+    if TraceMemory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        StartedTracing = True
+    try:
+        yield Timings
+    finally:
+        if StartedTracing:
+            tracemalloc.stop()
+        ActiveStageTimings.reset(token)
+
+
+@contextlib.contextmanager
+def Stage(Name):
+    '''
+    Context manager that measures one stage of the solve pipeline. When no "RecordStageTimings" block is active, it does nothing,
+    so the solver functions can always be instrumented.
+    '''
+    Timings = ActiveStageTimings.get()
+    if Timings is None:
+        yield
+        return
+
+    Tracing = Timings.TraceMemory and tracemalloc.is_tracing()
+    if Tracing:
+        # Stages can be nested, so the peak so far is passed to the open stages before resetting it for the new stage.
+        peak = tracemalloc.get_traced_memory()[1]
+        for frame in Timings.OpenStages:
+            frame["Peak"] = max(frame["Peak"], peak)
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        frame = {"Start": current, "Peak": current}
+        Timings.OpenStages.append(frame)
+
+    st = time.perf_counter()
+    cpu_st = time.process_time()
+    try:
+        yield
+    finally:
+        et = time.perf_counter()
+        cpu_et = time.process_time()
+        PeakMemory = None
+        if Tracing:
+            peak = tracemalloc.get_traced_memory()[1]
+            for f in Timings.OpenStages:
+                f["Peak"] = max(f["Peak"], peak)
+            Timings.OpenStages.pop()
+            PeakMemory = frame["Peak"] - frame["Start"]
+        Timings.Record(Name, et - st, cpu_et - cpu_st, PeakMemory)
+
+
+def TimedStage(Name):
+    '''
+    Decorator version of "Stage", for functions that are a whole stage of the pipeline.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Stage(Name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def ProfileRun(func, *args, Profiler="cprofile", **kwargs):
+    '''
+    This function calls "func" with the given arguments under a profiler, and returns a tuple with the result of the function and
+    a text report. "Profiler" can either be equal to "cprofile" (standard library), or "pyinstrument" (if it is installed).
+    '''
+    if Profiler == "pyinstrument":
+        from pyinstrument import Profiler as PyinstrumentProfiler
+        profiler = PyinstrumentProfiler()
+        profiler.start()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            profiler.stop()
+        return result, profiler.output_text()
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        profiler.disable()
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(40)
+    return result, stream.getvalue()
+
+
+def ProfileDump(func, *args, Path, Profiler="cprofile", **kwargs):
+    '''
+    Same as "ProfileRun", but the profile is written to "Path": a ".prof" file readable by pstats/snakeviz for "cprofile", or an
+    ".html" report for "pyinstrument". The result of the function is returned.
+    '''
+    if Profiler == "pyinstrument":
+        from pyinstrument import Profiler as PyinstrumentProfiler
+        profiler = PyinstrumentProfiler()
+        profiler.start()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            profiler.stop()
+        with open(Path, "w") as f:
+            f.write(profiler.output_html())
+        return result
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        profiler.disable()
+    profiler.dump_stats(Path)
+    return result
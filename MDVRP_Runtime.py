@@ -0,0 +1,91 @@
+import os
+import warnings
+from contextlib import nullcontext
+
+# The number of threads the native thread pools (OpenMP, BLAS) may use while the solver runs. None lets them use all cores.
+# It is set by "ConfigureRuntime", and applied around the clustering of every solve (see "ThreadLimits").
+ThreadsLimit = None
+
+# The thread limit applied by "ConfigureRuntime", and the value of OMP_NUM_THREADS before it, so the limit can be removed again
+RuntimeLimiter = None
+PreviousOmpThreads = None
+
+
+def ConfigureRuntime(Threads=None, IgnoreWarnings=True):
+    '''
+    This function applies the runtime settings of the solver, which used to be applied as a side effect of importing the clustering
+    modules. It is called explicitly by the entry points (the app pages, the benchmark, and the worker processes of their process
+    pools), before any clustering runs:
+    1) "Threads": the threading policy, i.e. the number of threads of the native thread pools used by scikit-learn and NumPy
+       (OpenMP, BLAS). None uses all cores, which is best for an interactive single solve. Worker processes of a process pool use
+       1 thread each (see "InitializeWorker"), so that the workers do not oversubscribe the cores. The limit is applied with
+       threadpoolctl, so it also works after the libraries are loaded, and it can be changed between solves: every call first
+       removes the limit of the previous call (restoring the thread pools and OMP_NUM_THREADS), so None gives all cores back.
+    2) "IgnoreWarnings": whether UserWarnings are ignored (e.g. the KMeans memory leak warning of scikit-learn on Windows with MKL).
+    '''
+    global ThreadsLimit, RuntimeLimiter, PreviousOmpThreads
+    if RuntimeLimiter is not None:
+        RuntimeLimiter.restore_original_limits()
+        RuntimeLimiter = None
+        if PreviousOmpThreads is None:
+            os.environ.pop("OMP_NUM_THREADS", None)
+        else:
+            os.environ["OMP_NUM_THREADS"] = PreviousOmpThreads
+    ThreadsLimit = Threads
+    if Threads is not None:
+        # Thread pools that are started later (e.g. OpenMP, at the first clustering) read their size from the environment
+        PreviousOmpThreads = os.environ.get("OMP_NUM_THREADS")
+        os.environ["OMP_NUM_THREADS"] = str(Threads)
+        from threadpoolctl import threadpool_limits
+        RuntimeLimiter = threadpool_limits(limits=Threads)
+    if IgnoreWarnings:
+        warnings.filterwarnings(action='ignore', category=UserWarning)
+
+
+def ThreadLimits():
+    '''
+    This function returns a context manager that limits the native thread pools to the configured number of threads (see
+    "ConfigureRuntime") while the solver runs, or does nothing if they may use all cores.
+    '''
+    if ThreadsLimit is None:
+        return nullcontext()
+    from threadpoolctl import threadpool_limits
+    return threadpool_limits(limits=ThreadsLimit)
+
+
+def ThreadingInfo():
+    '''
+    This function returns the active threading setting, reported along with the stage timings: the configured policy
+    ("ThreadsLimit", "all cores" if there is no limit), the number of cores, and the number of threads of every native thread pool
+    that is currently loaded (e.g. {"openmp": 1, "blas": 1}).
+    '''
+    from threadpoolctl import threadpool_info
+
+    Pools = dict()
+    for pool in threadpool_info():
+        Pools[pool["user_api"]] = max(Pools.get(pool["user_api"], 0), pool["num_threads"])
+    return {"ThreadsLimit": "all cores" if ThreadsLimit is None else ThreadsLimit,
+            "CpuCount": os.cpu_count(),
+            "ThreadPools": Pools}
+
+
+def WarmUp():
+    '''
+    This function imports the libraries that the solver only loads when they are first needed (scikit-learn, and Numba if it is
+    installed), and runs the routing kernels once on a tiny problem, so that they are compiled (or loaded from Numba's cache).
+    Worker processes call it when they start, so the import and compilation times are not added to the time of their first solve.
+    '''
+    import sklearn.cluster
+    import sklearn.metrics
+    from ClarkeAndWrightSavingsAlgorithm import ClarkeAndWrightSavingsAlgorithmWithVehConstraint
+
+    ClarkeAndWrightSavingsAlgorithmWithVehConstraint([["01", 0, 0], [1, 1, 2], [2, 3, 1], [3, 2, 4]], 10, [[1, 1], [2, 1], [3, 1]], 1)
+
+
+def InitializeWorker(Threads=1):
+    '''
+    Initializer of the worker processes of the process pools: applies the runtime settings (see "ConfigureRuntime"), with 1
+    thread per worker by default, and then warms up the solver (see "WarmUp"), so the libraries are imported under these settings.
+    '''
+    ConfigureRuntime(Threads)
+    WarmUp()
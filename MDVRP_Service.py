@@ -0,0 +1,337 @@
+'''
+Local solve service of the MDVRP solver, for tools that need solutions on demand without embedding the Streamlit app. It is
+an asyncio HTTP server (standard library only) with a process pool backend, which solves every request with "MDVRPSolve", i.e.
+the existing node selection heuristics followed by "ClarkeAndWrightSavingsAlgorithmWithVehConstraint":
+
+1) POST /solve: solves the instance of a JSON payload (see "NormalizedPayload") and returns its routes and metrics.
+2) GET /stats: returns the counters of the service (requests, cache hits, coalesced requests, solves, rejections).
+
+Requests are keyed by the hash of their normalized payload (the instance and the heuristic). A request whose key is being
+solved waits for that solve instead of starting a new one, and solved keys are answered from an LRU cache. At most "Workers"
+solves run at once and at most "MaxQueued" requests wait for a worker; further requests are rejected with 503 (and a
+Retry-After header), so the callers back off instead of piling up work. The server listens on 127.0.0.1 by default. Example:
+
+    python MDVRP_Service.py --port 8765 --workers 2
+    curl -X POST localhost:8765/solve -d '{"Heuristic": "Ward", "Generate": {"NoOfCustomers": 200, "NoOfDepots": 3}}'
+'''
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from MDVRP_Runtime import InitializeWorker
+from miscellanious_functions import SelectionHeuristics
+
+# The parameters of "MDVRPModelInstances" taken by a "Generate" payload, with their defaults
+GenerateDefaults = {"NoOfCustomers": 100, "Seed": 1, "NoOfVehicles": 5, "NoOfDepots": 2, "Grid": 100, "VehicleCap": 50,
+                    "MaximumDem": 3}
+
+Reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 422: "Unprocessable Entity",
+           503: "Service Unavailable"}
+
+
+class ServiceBusy(Exception):
+    '''
+    Raised when a request can not wait for a worker because "MaxQueued" requests are already waiting.
+    '''
+
+
+def NormalizedPayload(Payload):
+    '''
+    This function validates a request payload and returns it in a canonical form, from which its hash is calculated. A payload
+    has a "Heuristic" ("KMeans" by default) and either:
+    1) "Generate": the parameters of "MDVRPModelInstances" (see "GenerateDefaults"), for a generated instance, or
+    2) "Depots" (a list of [id, x, y]), "Customers" (a list of [id, x, y, demand], with distinct integer ids), "NoOfVehicles"
+       (per depot) and "VehicleCap", for a given instance, plus an optional "Seed" (1 by default) for the random state of the
+       KMeans clustering. The depot ids can be any strings or numbers: they are converted to strings, and the solver works
+       with the ids of the generated instances instead (see "PayloadInstances").
+    It raises a ValueError if the payload is not valid.
+    '''
+    if not isinstance(Payload, dict):
+        raise ValueError("The payload must be a JSON object")
+    Heuristic = Payload.get("Heuristic", "KMeans")
+    if Heuristic not in SelectionHeuristics:
+        raise ValueError("Unknown node selection heuristic: " + str(Heuristic))
+
+    try:
+        if "Generate" in Payload:
+            Unknown = set(Payload["Generate"]) - set(GenerateDefaults)
+            if Unknown:
+                raise ValueError("Unknown parameters of \"Generate\": " + ", ".join(sorted(Unknown)))
+            Generate = dict(GenerateDefaults)
+            Generate.update({k: int(v) for k, v in Payload["Generate"].items()})
+            return {"Heuristic": Heuristic, "Generate": Generate}
+
+        Depots = [[str(d[0]), float(d[1]), float(d[2])] for d in Payload["Depots"]]
+        Customers = [[int(c[0]), float(c[1]), float(c[2]), int(c[3])] for c in Payload["Customers"]]
+        NoOfVehicles = int(Payload["NoOfVehicles"])
+        VehicleCap = int(Payload["VehicleCap"])
+        Seed = int(Payload.get("Seed", 1))
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError("Invalid payload: " + type(e).__name__ + " " + str(e))
+
+    if len(Depots) < 2 or not Customers:
+        raise ValueError("An instance needs at least 2 depots and 1 customer")
+    if len({d[0] for d in Depots}) < len(Depots) or len({c[0] for c in Customers}) < len(Customers):
+        raise ValueError("The depot ids and the customer ids must be distinct")
+    if min(c[0] for c in Customers) < 1:
+        raise ValueError("The customer ids must be positive integers")
+    return {"Heuristic": Heuristic, "Depots": Depots, "Customers": Customers, "NoOfVehicles": NoOfVehicles, "VehicleCap": VehicleCap,
+            "Seed": Seed}
+
+
+def PayloadKey(Normalized):
+    '''
+    Returns the hash that identifies a normalized payload, used to coalesce and cache the requests.
+    '''
+    return hashlib.sha256(json.dumps(Normalized, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def PayloadInstances(Normalized):
+    '''
+    This function creates the problem instances of a normalized payload, in the format of "MDVRPModelInstances". The clustering
+    heuristics identify the depots by their position, with the ids of the generated instances ("01", "02", ...), so the
+    depots of a given instance are relabelled with these ids, in their order in the payload (see "PayloadDepotIds").
+    '''
+    from miscellanious_functions import MDVRPModelInstances
+
+    if "Generate" in Normalized:
+        g = Normalized["Generate"]
+        return MDVRPModelInstances(g["NoOfCustomers"], g["Seed"], g["NoOfVehicles"], g["NoOfDepots"], g["Grid"],
+                                   g["VehicleCap"], g["MaximumDem"])
+
+    Depots = [[Internal] + list(d[1:]) for Internal, d in zip(PayloadDepotIds(Normalized), Normalized["Depots"])]
+    Customers = [c[:3] for c in Normalized["Customers"]]
+    Nodes = Depots + Customers
+    return {"allCustomers": Customers,
+            "allNodes": Nodes,
+            "allIds": [node[0] for node in Nodes],
+            "allxs": [node[1] for node in Nodes],
+            "allys": [node[2] for node in Nodes],
+            "NoOfCusts": len(Customers),
+            "AllDepots": Depots,
+            "NoOfVehicles": Normalized["NoOfVehicles"],
+            "all_dem": [[c[0], c[3]] for c in Normalized["Customers"]],
+            "VehicleCap": Normalized["VehicleCap"],
+            "Seed": Normalized["Seed"]}
+
+
+def PayloadDepotIds(Normalized):
+    '''
+    Returns the ids of the depots of a normalized payload in the instances of "PayloadInstances", in the order of the payload.
+    '''
+    return ["0" + str(i + 1) for i in range(len(Normalized.get("Depots", list())))]
+
+
+def SolvePayload(Normalized):
+    '''
+    This function solves a normalized payload with "MDVRPSolve" (it runs in the worker processes), and returns the routes of
+    every depot (lists that start and end with the depot's id, as given in the payload), the cost of every route, the metrics, and the solve time.
+    '''
+    from miscellanious_functions import MDVRPSolve
+
+    st = time.perf_counter()
+    Instances = PayloadInstances(Normalized)
+    Result = MDVRPSolve(Instances, Normalized["Heuristic"])
+    Solution = Result["Solution"]
+
+    # The depots of a given instance get their ids of the payload back
+    DepotIds = dict(zip(PayloadDepotIds(Normalized), [d[0] for d in Normalized.get("Depots", list())]))
+    Routes = [[[DepotIds.get(node, node) if i in (0, len(route) - 1) else node for i, node in enumerate(route)] for route in routes]
+              for routes in Solution.ToRoutesContainer()]
+
+    return {"Heuristic": Normalized["Heuristic"],
+            "Routes": Routes,
+            "RouteCosts": [[float(cost) for cost in costs] for costs in Solution.CostsContainer()],
+            "DepotCosts": [float(cost) for cost in Solution.TotalCostsContainer()],
+            "Metrics": {k: v.item() if hasattr(v, "item") else v for k, v in Result["Metrics"].items()},
+            "SolveTime": round(time.perf_counter() - st, 4)}
+
+
+class SolveService:
+    '''
+    This class solves payloads asynchronously in a process pool (see the module's description). It can be used directly by
+    asyncio code, or through the HTTP server of "Serve":
+
+        async with SolveService(Workers=2) as Service:
+            Result = await Service.Solve(Payload)
+    '''
+
+    def __init__(self, Workers=1, MaxQueued=16, CacheSize=256):
+        self.Workers = Workers
+        self.MaxQueued = MaxQueued
+        self.CacheSize = CacheSize
+        self.Executor = ProcessPoolExecutor(max_workers=Workers, initializer=InitializeWorker)
+        self.Slots = asyncio.Semaphore(Workers)
+        self.Queued = 0
+        self.InFlight = dict()
+        self.Cache = OrderedDict()
+        self.Stats = {"Requests": 0, "CacheHits": 0, "Coalesced": 0, "Solves": 0, "Failures": 0, "Rejected": 0}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.Close()
+
+    def Close(self):
+        self.Executor.shutdown(cancel_futures=True)
+
+    async def Solve(self, Payload):
+        '''
+        Solves a payload, and returns the result of "SolvePayload" along with the key of the payload. Identical requests that
+        arrive while the payload is being solved share its solve, and solved payloads are answered from the cache. It raises a
+        ValueError for an invalid payload, "ServiceBusy" when too many requests are waiting, and the error of a failed solve.
+        '''
+        Normalized = NormalizedPayload(Payload)
+        Key = PayloadKey(Normalized)
+        self.Stats["Requests"] += 1
+
+        if Key in self.Cache:
+            self.Stats["CacheHits"] += 1
+            self.Cache.move_to_end(Key)
+            return self.Cache[Key]
+        if Key not in self.InFlight:
+            if self.Queued >= self.MaxQueued:
+                self.Stats["Rejected"] += 1
+                raise ServiceBusy(str(self.Queued) + " requests are waiting for a worker")
+            # The solve runs as its own task, so it is not cancelled when the request that started it goes away
+            self.Queued += 1
+            Task = asyncio.ensure_future(self.Run(Key, Normalized))
+            Task.add_done_callback(lambda task: task.cancelled() or task.exception())
+            self.InFlight[Key] = Task
+        else:
+            self.Stats["Coalesced"] += 1
+        return await asyncio.shield(self.InFlight[Key])
+
+    async def Run(self, Key, Normalized):
+        '''
+        Waits for a free worker (the request being counted as queued meanwhile), solves the payload in the process pool, and
+        caches its result.
+        '''
+        try:
+            try:
+                await self.Slots.acquire()
+            finally:
+                self.Queued -= 1
+            try:
+                self.Stats["Solves"] += 1
+                Result = await asyncio.get_running_loop().run_in_executor(self.Executor, SolvePayload, Normalized)
+            except Exception:
+                self.Stats["Failures"] += 1
+                raise
+            finally:
+                self.Slots.release()
+            Result["Key"] = Key
+            self.Cache[Key] = Result
+            if len(self.Cache) > self.CacheSize:
+                self.Cache.popitem(last=False)
+            return Result
+        finally:
+            del self.InFlight[Key]
+
+    def Status(self):
+        return dict(self.Stats, InFlight=len(self.InFlight), Queued=self.Queued, Cached=len(self.Cache), Workers=self.Workers)
+
+    async def Respond(self, Method, Path, Body):
+        '''
+        Handles one HTTP request, and returns its status code, its JSON response, and its extra headers.
+        '''
+        if Method == "GET" and Path == "/stats":
+            return 200, self.Status(), dict()
+        if Path != "/solve":
+            return 404, {"Error": "Unknown path: " + Path}, dict()
+        if Method != "POST":
+            return 404, {"Error": "Use POST " + Path}, dict()
+        try:
+            return 200, await self.Solve(json.loads(Body or b"null")), dict()
+        except ValueError as e:  # including json.JSONDecodeError
+            return 400, {"Error": str(e)}, dict()
+        except ServiceBusy as e:
+            return 503, {"Error": "Service busy: " + str(e)}, {"Retry-After": "1"}
+        except Exception as e:
+            return 422, {"Error": type(e).__name__ + ": " + str(e)}, dict()
+
+    async def HandleConnection(self, reader, writer, MaxBodyBytes=64*2**20):
+        '''
+        Reads one HTTP/1.1 request from a connection, and writes its JSON response before closing the connection.
+        '''
+        try:
+            Method, Path, Version = (await reader.readline()).decode("latin-1").split(" ", 2)
+            Headers = dict()
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, value = line.decode("latin-1").split(":", 1)
+                Headers[name.strip().lower()] = value.strip()
+            Length = int(Headers.get("content-length", 0))
+            if Length > MaxBodyBytes:
+                Status, Response, Extra = 413, {"Error": "The payload exceeds " + str(MaxBodyBytes) + " bytes"}, dict()
+            else:
+                Status, Response, Extra = await self.Respond(Method, Path.split("?")[0], await reader.readexactly(Length))
+        except (ValueError, asyncio.IncompleteReadError):
+            Status, Response, Extra = 400, {"Error": "Malformed HTTP request"}, dict()
+
+        Body = json.dumps(Response).encode()
+        Head = ["HTTP/1.1 " + str(Status) + " " + Reasons[Status], "Content-Type: application/json",
+                "Content-Length: " + str(len(Body)), "Connection: close"] + [k + ": " + v for k, v in Extra.items()]
+        writer.write(("\r\n".join(Head) + "\r\n\r\n").encode("latin-1") + Body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+async def Serve(Host="127.0.0.1", Port=8765, Workers=1, MaxQueued=16, CacheSize=256, Started=None):
+    '''
+    Runs the HTTP server of a "SolveService" until it is cancelled. "Started" can be an asyncio.Event, which is set once the
+    server listens (e.g. for tests that start the server in the same event loop).
+    '''
+    async with SolveService(Workers, MaxQueued, CacheSize) as Service:
+        Server = await asyncio.start_server(Service.HandleConnection, Host, Port)
+        async with Server:
+            if Started is not None:
+                Started.set()
+            await Server.serve_forever()
+
+
+def RequestSolve(Payload, Url="http://127.0.0.1:8765", Timeout=600):
+    '''
+    Client helper: posts a payload to a running service, and returns the decoded response. Errors of the service are raised as
+    a RuntimeError with the status code and the error message.
+    '''
+    Request = urllib.request.Request(Url.rstrip("/") + "/solve", data=json.dumps(Payload).encode(),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(Request, timeout=Timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(str(e.code) + ": " + json.loads(e.read()).get("Error", ""))
+
+
+def ArgumentParser():
+    parser = argparse.ArgumentParser(description="Local solve service of the MDVRP solver")
+    parser.add_argument("--host", default="127.0.0.1", help="Address the server listens on")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="Number of solves run in parallel, each worker using one thread")
+    parser.add_argument("--max-queued", type=int, default=16, help="Number of requests that may wait for a worker before 503 is returned")
+    parser.add_argument("--cache-size", type=int, default=256, help="Number of solved payloads kept in the cache")
+    return parser
+
+
+def main(argv=None):
+    args = ArgumentParser().parse_args(argv)
+    print("Serving on http://" + args.host + ":" + str(args.port), flush=True)
+    try:
+        asyncio.run(Serve(args.host, args.port, args.workers, args.max_queued, args.cache_size))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+'''
+Shared arrays for the worker processes of the process pools. Instead of pickling a large instance or distance matrix into
+every task, the parent process publishes the arrays once as memory-mapped files (in /dev/shm when it exists, so they stay in
+memory), and every task only carries a small descriptor with their paths. Workers attach the arrays read-only and zero-copy:
+all processes read the same pages. For example:
+
+    with SharedBlocks() as Blocks, ProcessPoolExecutor(initializer=InitializeWorker) as executor:
+        Descriptor = PublishGeometry(Blocks, SavingsGeometry(DepotNodePair, all_dem))
+        Futures = [executor.submit(Task, Descriptor, ...) for ...]
+
+and the task calls "AttachGeometry(Descriptor)". Only the publishing process owns the files:
+1) workers never write or remove them, so a crashed worker leaves nothing behind (the pool is broken, the "with" block of the
+   parent exits with the error, and the files are removed),
+2) the files are removed when the "with" block exits, or at the latest when the publishing process exits normally,
+3) the directories of a publishing process that was killed are removed by the next "SharedBlocks" created on the machine.
+'''
+import atexit
+import os
+import shutil
+import tempfile
+import uuid
+from collections import OrderedDict
+import numpy as np
+
+BlocksPrefix = "mdvrp-blocks-"
+
+# The arrays attached by the current process, by path (least recently used first), so tasks that share a descriptor map the
+# files once. At most "MaxAttachedBlocks" are kept, so long-lived workers release the arrays of finished jobs.
+AttachedBlocks = OrderedDict()
+MaxAttachedBlocks = 64
+
+
+def BlocksRoot():
+    '''
+    Returns the directory where the shared arrays are written: /dev/shm (memory) if it exists, the temporary directory otherwise.
+    '''
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def RemoveStaleBlocks(Root):
+    '''
+    This function removes the directories of shared arrays whose publishing process no longer runs (e.g. it was killed before
+    it could remove them). The process id is part of the directory name. It is only done on POSIX systems.
+    '''
+    if os.name != "posix":
+        return
+    for Name in os.listdir(Root):
+        if not Name.startswith(BlocksPrefix):
+            continue
+        try:
+            os.kill(int(Name[len(BlocksPrefix):].split("-")[0]), 0)
+        except ProcessLookupError:
+            shutil.rmtree(os.path.join(Root, Name), ignore_errors=True)
+        except (ValueError, OSError):  # not a process id, or a process of another user
+            pass
+
+
+class SharedBlocks:
+    '''
+    This class publishes arrays for the worker processes (see the module's description). It is used as a context manager,
+    which removes the published arrays when it exits.
+    '''
+
+    def __init__(self, Root=None):
+        Root = Root or BlocksRoot()
+        RemoveStaleBlocks(Root)
+        self.Directory = tempfile.mkdtemp(prefix=BlocksPrefix + str(os.getpid()) + "-", dir=Root)
+        atexit.register(self.Close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
+
+    def Publish(self, Arrays):
+        '''
+        Writes the arrays of a dictionary (name: array), and returns the descriptor that workers pass to "Attach".
+        '''
+        Descriptor = dict()
+        for Name, Array in Arrays.items():
+            Path = os.path.join(self.Directory, uuid.uuid4().hex + ".npy")
+            np.save(Path, np.ascontiguousarray(Array))
+            Descriptor[Name] = Path
+        return Descriptor
+
+    def Close(self):
+        shutil.rmtree(self.Directory, ignore_errors=True)
+        atexit.unregister(self.Close)
+
+
+def Attach(Descriptor):
+    '''
+    This function returns the arrays of a descriptor of "SharedBlocks.Publish" as read-only arrays backed by the shared files,
+    without copying them.
+    '''
+    Arrays = dict()
+    for Name, Path in Descriptor.items():
+        if Path not in AttachedBlocks:
+            AttachedBlocks[Path] = np.asarray(np.load(Path, mmap_mode="r"))
+            if len(AttachedBlocks) > MaxAttachedBlocks:
+                AttachedBlocks.popitem(last=False)
+        AttachedBlocks.move_to_end(Path)
+        Arrays[Name] = AttachedBlocks[Path]
+    return Arrays
+
+
+def PublishInstances(Blocks, Instances):
+    '''
+    This function publishes problem instances (as created by "MDVRPModelInstances" or "MDVRP_BenchmarkInstances"): the
+    coordinates and ids of all nodes, the demands, and the order of the nodes in each of the lists of the instances. The depot
+    ids (strings) and the scalar parameters are kept in the descriptor.
+    '''
+    Nodes = Instances["allNodes"]
+    Row = {node[0]: i for i, node in enumerate(Nodes)}
+    Depots = set(node[0] for node in Instances["AllDepots"])
+
+    Arrays = {"NodeCoords": np.array([[node[1], node[2]] for node in Nodes]),
+              "NodeIds": np.array([-1 if node[0] in Depots else node[0] for node in Nodes], dtype=np.int64),
+              "DepotRows": np.array([Row[depot[0]] for depot in Instances["AllDepots"]], dtype=np.int64),
+              "IdsRows": np.array([Row[i] for i in Instances["allIds"]], dtype=np.int64),
+              "CustomerRows": np.array([Row[cust[0]] for cust in Instances["allCustomers"]], dtype=np.int64),
+              "DemandIds": np.array([pair[0] for pair in Instances["all_dem"]], dtype=np.int64),
+              "Demands": np.array([pair[1] for pair in Instances["all_dem"]])}
+
+    return {"Blocks": Blocks.Publish(Arrays),
+            "DepotIds": [node[0] for node in Nodes if node[0] in Depots],
+            "Parameters": {k: v for k, v in Instances.items() if k in ("NoOfCusts", "NoOfVehicles", "VehicleCap", "Seed")}}
+
+
+def AttachInstances(Descriptor):
+    '''
+    This function attaches the arrays of "PublishInstances", and returns the problem instances in their usual format.
+    '''
+    Arrays = Attach(Descriptor["Blocks"])
+    Coords = Arrays["NodeCoords"].tolist()
+    Ids = Arrays["NodeIds"].tolist()
+    DepotIds = iter(Descriptor["DepotIds"])
+    Nodes = [[next(DepotIds) if i == -1 else i, xy[0], xy[1]] for i, xy in zip(Ids, Coords)]
+
+    Instances = {"allNodes": Nodes,
+                 "AllDepots": [Nodes[row] for row in Arrays["DepotRows"].tolist()],
+                 "allCustomers": [Nodes[row] for row in Arrays["CustomerRows"].tolist()],
+                 "allIds": [Nodes[row][0] for row in Arrays["IdsRows"].tolist()],
+                 "allxs": [Nodes[row][1] for row in Arrays["IdsRows"].tolist()],
+                 "allys": [Nodes[row][2] for row in Arrays["IdsRows"].tolist()],
+                 "all_dem": [list(pair) for pair in zip(Arrays["DemandIds"].tolist(), Arrays["Demands"].tolist())]}
+    Instances.update(Descriptor["Parameters"])
+    return Instances
+
+
+def PublishGeometry(Blocks, Geometry):
+    '''
+    This function publishes the geometry of a single VRP (see "SavingsGeometry"): its distance matrix, sorted savings pairs and
+    demands, which are the largest arrays of the Clarke & Wright heuristic.
+    '''
+    return {"Blocks": Blocks.Publish({"DistArray": Geometry["DistArray"],
+                                      "PairsFirst": Geometry["PairsFirst"],
+                                      "PairsSecond": Geometry["PairsSecond"],
+                                      "Demand": np.array(Geometry["Demand"])}),
+            "Ids": Geometry["Ids"]}
+
+
+def AttachGeometry(Descriptor):
+    '''
+    This function attaches the arrays of "PublishGeometry", and returns the geometry in the format of "SavingsGeometry".
+    '''
+    Geometry = Attach(Descriptor["Blocks"])
+    Geometry["Demand"] = Geometry["Demand"].tolist()
+    Geometry["Ids"] = Descriptor["Ids"]
+    return Geometry
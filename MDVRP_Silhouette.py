@@ -0,0 +1,55 @@
+import numpy as np
+from scipy.spatial.distance import cdist
+
+# Upper bound of the memory used by one block of rows of the distance matrix in "SilhouetteScores"
+SilhouetteChunkBytes = 64*2**20
+
+
+def SilhouetteScores(Points, Labelings, ChunkBytes=None):
+    '''
+    This function returns the mean silhouette coefficient (as "sklearn.metrics.silhouette_score" with the euclidean metric) of
+    every labeling of the same points, e.g. of every number of clusters of the silhouette sweep of the node selection heuristics.
+    Instead of computing all pairwise distances once per labeling, the distance matrix is computed once, in blocks of rows that
+    take at most "ChunkBytes" bytes, and every block is scored against all labelings at once: the sum of the distances of every
+    point to the points of each cluster of every labeling is one matrix product of the block with the cluster indicators.
+    Like scikit-learn, it raises a ValueError if a labeling has less than 2 or more than n - 1 clusters, and gives a score of 0 to
+    the points of single point clusters.
+    '''
+    Points = np.asarray(Points, dtype=float)
+    n = len(Points)
+    if ChunkBytes is None:
+        ChunkBytes = SilhouetteChunkBytes
+
+    Labels = list()
+    Counts = list()
+    for labels in Labelings:
+        Clusters, labels = np.unique(np.asarray(labels), return_inverse=True)
+        if not 2 <= len(Clusters) <= n - 1:
+            raise ValueError("Number of labels is %d. Valid values are 2 to n_samples - 1 (inclusive)" % len(Clusters))
+        Labels.append(labels)
+        Counts.append(np.bincount(labels).astype(float))
+
+    # The indicator columns of the clusters of all labelings, side by side
+    Offsets = np.concatenate(([0], np.cumsum([len(c) for c in Counts])))
+    Indicators = np.zeros((n, Offsets[-1]))
+    for j, labels in enumerate(Labels):
+        Indicators[np.arange(n), Offsets[j] + labels] = 1
+
+    Totals = np.zeros(len(Labels))
+    Rows = max(1, int(ChunkBytes // (8*max(n, 1))))
+    for start in range(0, n, Rows):
+        end = min(start + Rows, n)
+        ClusterDistances = cdist(Points[start:end], Points) @ Indicators
+        Block = np.arange(end - start)
+        for j, labels in enumerate(Labels):
+            Sums = ClusterDistances[:, Offsets[j]:Offsets[j+1]]
+            Own = labels[start:end]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                Intra = Sums[Block, Own]/(Counts[j][Own] - 1)
+                Means = Sums/Counts[j]
+                Means[Block, Own] = np.inf
+                Inter = Means.min(axis=1)
+                Scores = (Inter - Intra)/np.maximum(Intra, Inter)
+            Totals[j] += np.nan_to_num(Scores).sum()
+
+    return (Totals/n).tolist()
@@ -0,0 +1,154 @@
+import numpy as np
+
+
+def DemandArray(all_dem):
+    '''
+    This function converts the list of lists with each customer's demand to an array indexed by the customer's id, so the demand
+    of many customers can be looked up at once.
+    '''
+    dem = np.zeros(max(pair[0] for pair in all_dem) + 1)
+    for pair in all_dem:
+        dem[pair[0]] = pair[1]
+    return dem
+
+
+class MDVRPSolution:
+    '''
+    This class stores an MDVRP solution in a compact, flat form, which is passed between the stages of the pipeline (routing,
+    metrics, plotting, benchmarks) instead of the nested lists of "RoutingInfoContainer":
+    1) "DepotIds": the ids of the depots, one per distinct VRP, in the order the VRP's were solved,
+    2) "Tour": an integer array with the ids of the visited customers, route after route (a "giant tour" without the depots),
+    3) "Offsets": the start of each route in "Tour" (route i is Tour[Offsets[i]:Offsets[i+1]]),
+    4) "RouteDepots": for each route, the position of its depot in "DepotIds",
+    5) "RouteCosts", "RouteLoads": the cost and the load of each route, as calculated once by the routing heuristic,
+    6) "DepotCosts": the total cost of the routes of each depot.
+    The nested lists of routes (with the depot ids at the start and the end of each route) are only built by "ToRoutesContainer",
+    e.g. to display the routes in the app. The object only holds a few arrays, so it is cheap to pickle between processes.
+    '''
+    __slots__ = ("DepotIds", "Tour", "Offsets", "RouteDepots", "RouteCosts", "RouteLoads", "DepotCosts")
+
+    def __init__(self, DepotIds, Tour, Offsets, RouteDepots, RouteCosts, RouteLoads, DepotCosts):
+        self.DepotIds = tuple(DepotIds)
+        self.Tour = np.asarray(Tour, dtype=np.int32)
+        self.Offsets = np.asarray(Offsets, dtype=np.int64)
+        self.RouteDepots = np.asarray(RouteDepots, dtype=np.int32)
+        self.RouteCosts = np.asarray(RouteCosts, dtype=float)
+        self.RouteLoads = np.asarray(RouteLoads, dtype=np.int64)
+        self.DepotCosts = np.asarray(DepotCosts, dtype=float)
+
+    @classmethod
+    def FromRoutingResults(cls, DepotIds, Results, all_dem):
+        '''
+        Creates the solution from the dictionaries returned by the routing heuristic (one per depot, in the order of "DepotIds"),
+        i.e. from their "Routes", "AllCosts" and "TotalCost" values.
+        '''
+        return cls.FromRoutes(DepotIds, [r["Routes"] for r in Results], [r["AllCosts"] for r in Results],
+                              [r["TotalCost"] for r in Results], all_dem)
+
+    @classmethod
+    def FromRoutes(cls, DepotIds, RoutesContainer, CostsContainer, TotalCostsContainer, all_dem):
+        '''
+        Creates the solution from the nested lists of "RoutingInfoContainer" (routes, route costs, and depot costs per depot).
+        '''
+        Tour = list()
+        Offsets = [0]
+        RouteDepots = list()
+        for depot, routes in enumerate(RoutesContainer):
+            for route in routes:
+                Tour.extend(route[1:-1])
+                Offsets.append(len(Tour))
+                RouteDepots.append(depot)
+
+        Tour = np.array(Tour, dtype=np.int32)
+        dem = DemandArray(all_dem)
+        RouteOfNode = np.repeat(np.arange(len(RouteDepots)), np.diff(Offsets))
+        RouteLoads = np.bincount(RouteOfNode, weights=dem[Tour], minlength=len(RouteDepots))
+
+        RouteCosts = [cost for costs in CostsContainer for cost in costs]
+
+        return cls(DepotIds, Tour, Offsets, RouteDepots, RouteCosts, RouteLoads, TotalCostsContainer)
+
+    def __repr__(self):
+        return "MDVRPSolution(Depots=%d, Routes=%d, Customers=%d, TotalCost=%s)" % (len(self.DepotIds), self.NoOfRoutes,
+                                                                                    len(self.Tour), self.TotalCost)
+
+    @property
+    def NoOfRoutes(self):
+        return len(self.RouteDepots)
+
+    @property
+    def TotalCost(self):
+        return round(sum(self.TotalCostsContainer()), 2)
+
+    def Route(self, i):
+        '''
+        Returns the ids of the customers of route i (without the depot).
+        '''
+        return self.Tour[self.Offsets[i]:self.Offsets[i+1]]
+
+    def RouteDepotId(self, i):
+        return self.DepotIds[self.RouteDepots[i]]
+
+    def DepotRoutes(self, depot):
+        '''
+        Returns the indices of the routes of the depot at position "depot" of "DepotIds".
+        '''
+        return np.flatnonzero(self.RouteDepots == depot)
+
+    def DepotRoutesLists(self, depot):
+        '''
+        Returns the routes of the depot at position "depot" of "DepotIds" as lists that start and end with the depot's id.
+        '''
+        DepotId = self.DepotIds[depot]
+        return [[DepotId] + self.Route(i).tolist() + [DepotId] for i in self.DepotRoutes(depot)]
+
+    def WithDepotRoutes(self, depot, Routes, RouteCosts, DepotCost, all_dem):
+        '''
+        Returns a new solution where the routes of the depot at position "depot" of "DepotIds" are replaced by "Routes" (lists
+        that start and end with the depot's id), with the given route costs and depot cost. The arrays of the other depots are
+        copied as they are, so only the new routes are converted.
+        '''
+        start, end = np.searchsorted(self.RouteDepots, [depot, depot + 1])
+        Customers = [node for route in Routes for node in route[1:-1]]
+        Lengths = [len(route) - 2 for route in Routes]
+
+        Tour = np.concatenate((self.Tour[:self.Offsets[start]], np.array(Customers, dtype=np.int32), self.Tour[self.Offsets[end]:]))
+        Offsets = np.concatenate((self.Offsets[:start+1], self.Offsets[start] + np.cumsum(Lengths, dtype=np.int64),
+                                  self.Offsets[end+1:] - self.Offsets[end] + self.Offsets[start] + sum(Lengths)))
+        RouteDepots = np.concatenate((self.RouteDepots[:start], np.full(len(Routes), depot, dtype=np.int32), self.RouteDepots[end:]))
+
+        dem = DemandArray(all_dem)
+        Loads = [dem[route[1:-1]].sum() for route in Routes]
+        RouteLoads = np.concatenate((self.RouteLoads[:start], np.array(Loads, dtype=np.int64), self.RouteLoads[end:]))
+        Costs = np.concatenate((self.RouteCosts[:start], np.array(RouteCosts, dtype=float), self.RouteCosts[end:]))
+
+        DepotCosts = self.DepotCosts.copy()
+        DepotCosts[depot] = DepotCost
+
+        return MDVRPSolution(self.DepotIds, Tour, Offsets, RouteDepots, Costs, RouteLoads, DepotCosts)
+
+    def ToRoutesContainer(self):
+        '''
+        Returns the routes as the nested lists of "RoutingInfoContainer": one list per depot, containing one list per route
+        which starts and ends with the depot's id.
+        '''
+        RoutesContainer = [list() for depot in self.DepotIds]
+        for i in range(self.NoOfRoutes):
+            depot = self.DepotIds[self.RouteDepots[i]]
+            RoutesContainer[self.RouteDepots[i]].append([depot] + self.Route(i).tolist() + [depot])
+        return RoutesContainer
+
+    def CostsContainer(self):
+        '''
+        Returns the route costs as a list of lists, one per depot (as in "RoutingInfoContainer").
+        '''
+        CostsContainer = [list() for depot in self.DepotIds]
+        for i in range(self.NoOfRoutes):
+            CostsContainer[self.RouteDepots[i]].append(self.RouteCosts[i])
+        return CostsContainer
+
+    def TotalCostsContainer(self):
+        '''
+        Returns the list with the total cost of each depot (as in "RoutingInfoContainer").
+        '''
+        return list(self.DepotCosts)
@@ -0,0 +1,89 @@
+import numpy as np
+from MDVRP_Profiling import Stage
+from MDVRP_VoronoiFunc import DepotAllocation
+
+# The number of nearest depots each customer can be assigned to in "TransportationBasedNodeSelection"
+TransportationNeighbours = 3
+
+
+def TransportationBasedNodeSelection(Instances, Neighbours=None):
+    '''
+    This function gets as inputs the problem instances the user selects, and assigns the customers to the depots by solving a
+    transportation problem: the total distance between the customers and their depots is minimised, while the demand assigned to
+    every depot does not exceed the capacity of its fleet (its number of vehicles times the vehicle capacity), so the routing
+    stage does not have to leave customers unserved because their depot ran out of vehicles. Every customer can only be assigned
+    to one of its "Neighbours" nearest depots (found with a KD-tree), so the problem has n x Neighbours variables for n
+    customers. It is solved as a sparse linear program with the interior point method of HiGHS, followed by a crossover to a
+    vertex solution, which is much faster than the simplex method on these degenerate problems when the capacities are tight.
+    The optimal solution splits at most one customer per full depot between depots, and such a customer is assigned to the
+    depot with the largest share of it that still has room for it. If the total demand exceeds the total capacity, the excess
+    is put where it adds the least distance, i.e. the capacity limits are kept wherever they can be.
+    Inputs:
+    1) Instances: the problem instances (see "MDVRPModelInstances"), of which the customers ("allCustomers", as [id, x-coord,
+       y-coord]), the depots ("AllDepots", as [id, x-coord, y-coord]), the demands ("all_dem"), the number of vehicles of each
+       depot ("NoOfVehicles") and the vehicle capacity ("VehicleCap") are used.
+    2) Neighbours: the number of nearest depots each customer can be assigned to (by default "TransportationNeighbours").
+
+    Outputs:
+    1) ClientAllocationToDepots: A dictionary where keys are depot id's, and values are a list of the nodes that will be served from
+       the depot that corresponds to the key, as returned by "KMeansClusteringBasedNodesSelection". Depots without customers are
+       left out.
+    '''
+    from scipy.optimize import linprog
+    from scipy.sparse import coo_matrix, hstack, identity
+    from scipy.spatial import cKDTree
+
+    if Neighbours is None:
+        Neighbours = TransportationNeighbours
+
+    AllDepots = Instances["AllDepots"]
+    AllCustomers = Instances["allCustomers"]
+    CustIds = [cust[0] for cust in AllCustomers]
+    n = len(AllCustomers)
+    d = len(AllDepots)
+    k = max(1, min(Neighbours, d))
+
+    with Stage("DepotAssignment"):
+        DepotCoords = np.array([[depot[1], depot[2]] for depot in AllDepots], dtype=float)
+        CustCoords = np.array([[cust[1], cust[2]] for cust in AllCustomers], dtype=float).reshape(-1, 2)
+        Distances, Nearest = cKDTree(DepotCoords).query(CustCoords, k=k)
+        Distances = Distances.reshape(n, k)
+        Nearest = Nearest.reshape(n, k)
+
+        Demands = dict((pair[0], pair[1]) for pair in Instances["all_dem"])
+        Demand = np.array([Demands[i] for i in CustIds], dtype=float)
+        Capacity = Instances["NoOfVehicles"]*Instances["VehicleCap"]
+
+        # The variables are the shares of every customer assigned to each of its candidate depots (one per edge, customer by
+        # customer), followed by the demand of each depot above its capacity, which costs more per unit than any distance, so
+        # it is only used when the capacities can not be kept
+        Edges = np.arange(n*k)
+        Penalty = (Distances.max() if n else 0) + 1
+        Costs = np.concatenate((Distances.ravel(), np.full(d, Penalty)))
+
+        # Every customer is fully assigned ...
+        A_eq = hstack((coo_matrix((np.ones(n*k), (Edges // k, Edges)), shape=(n, n*k)), coo_matrix((n, d)))).tocsr()
+        # ... and the demand assigned to every depot, less its excess, does not exceed its capacity
+        A_ub = hstack((coo_matrix((np.repeat(Demand, k), (Nearest.ravel(), Edges)), shape=(d, n*k)), -identity(d))).tocsr()
+
+        Solution = linprog(Costs, A_ub=A_ub, b_ub=np.full(d, float(Capacity)), A_eq=A_eq, b_eq=np.ones(n), method="highs-ipm")
+        if Solution.status != 0:
+            raise ValueError("The transportation problem could not be solved: " + Solution.message)
+
+        Shares = Solution.x[:n*k].reshape(n, k)
+        Assigned = Nearest[np.arange(n), Shares.argmax(axis=1)]
+
+        # A split customer goes to the depot with the largest share of it that still has room for it, if any
+        Split = np.flatnonzero(Shares.max(axis=1) < 1 - 1e-9)
+        Whole = np.ones(n, dtype=bool)
+        Whole[Split] = False
+        Load = np.bincount(Assigned[Whole], weights=Demand[Whole], minlength=d)
+        for c in Split:
+            Candidates = Nearest[c, np.argsort(-Shares[c], kind="stable")]
+            Fitting = [j for j in Candidates if Load[j] + Demand[c] <= Capacity]
+            Assigned[c] = Fitting[0] if Fitting else Candidates[0]
+            Load[Assigned[c]] += Demand[c]
+
+        ClientAllocationToDepots = DepotAllocation(AllDepots, CustIds, Assigned)
+
+    return ClientAllocationToDepots
@@ -0,0 +1,71 @@
+import numpy as np
+from MDVRP_Profiling import Stage
+
+
+def DepotAllocation(AllDepots, CustIds, Assigned):
+    '''
+    This function returns the dictionary of depots-nodes pairs of an assignment given as an array with the position of the
+    depot (in "AllDepots") of every customer (in "CustIds"). Depots without customers are left out.
+    '''
+    ClientAllocationToDepots = dict()
+    for d, depot in enumerate(AllDepots):
+        Customers = [CustIds[c] for c in np.flatnonzero(Assigned == d)]
+        if Customers:
+            ClientAllocationToDepots[depot[0]] = Customers
+    return ClientAllocationToDepots
+
+
+def VoronoiBasedNodeSelection(Instances, Overflow=False):
+    '''
+    This function gets as inputs the problem instances the user selects, and assigns every customer to its nearest depot (i.e. to
+    the Voronoi cell of the depot), with a nearest neighbour query of a KD-tree of the depots, in O(n log d) time for n customers
+    and d depots. There is no clustering, silhouette sweep or centroid matching, so it is a fast baseline for the clustering-based
+    heuristics. If "Overflow" is True, the capacity of the fleet of each depot (its number of vehicles times the vehicle capacity)
+    is taken into account: the customers of a depot whose demand exceeds this capacity are moved to their second nearest depot,
+    as long as it has capacity left, starting with the customers for which the second nearest depot is the least further away.
+    Customers that fit nowhere stay with their nearest depot.
+    Inputs:
+    1) Instances: the problem instances (see "MDVRPModelInstances"), of which the customers ("allCustomers", as [id, x-coord,
+       y-coord]), the depots ("AllDepots", as [id, x-coord, y-coord]), and, if "Overflow" is True, the demands ("all_dem"), the
+       number of vehicles of each depot ("NoOfVehicles") and the vehicle capacity ("VehicleCap") are used.
+    2) Overflow: whether the customers that exceed the capacity of their nearest depot are moved to their second nearest depot.
+
+    Outputs:
+    1) ClientAllocationToDepots: A dictionary where keys are depot id's, and values are a list of the nodes that will be served from
+       the depot that corresponds to the key, as returned by "KMeansClusteringBasedNodesSelection". Depots without customers are
+       left out.
+    '''
+    from scipy.spatial import cKDTree
+
+    AllDepots = Instances["AllDepots"]
+    AllCustomers = Instances["allCustomers"]
+    CustIds = [cust[0] for cust in AllCustomers]
+
+    with Stage("DepotAssignment"):
+        DepotCoords = np.array([[depot[1], depot[2]] for depot in AllDepots], dtype=float)
+        CustCoords = np.array([[cust[1], cust[2]] for cust in AllCustomers], dtype=float).reshape(-1, 2)
+
+        k = 2 if Overflow and len(AllDepots) > 1 else 1
+        Distances, Nearest = cKDTree(DepotCoords).query(CustCoords, k=k)
+        Distances = Distances.reshape(len(CustCoords), k)
+        Nearest = Nearest.reshape(len(CustCoords), k)
+        Assigned = Nearest[:, 0].copy()
+
+        if k == 2:
+            Demands = dict((pair[0], pair[1]) for pair in Instances["all_dem"])
+            Demand = np.array([Demands[i] for i in CustIds], dtype=float)
+            Capacity = Instances["NoOfVehicles"]*Instances["VehicleCap"]
+            Load = np.bincount(Assigned, weights=Demand, minlength=len(AllDepots))
+
+            # Moving a customer costs the difference of the distances to its two nearest depots, so the cheapest moves go first
+            Order = np.argsort(Distances[:, 1] - Distances[:, 0], kind="stable")
+            for c in Order[Load[Nearest[Order, 0]] > Capacity]:
+                First, Second = Nearest[c]
+                if Load[First] > Capacity and Load[Second] + Demand[c] <= Capacity:
+                    Assigned[c] = Second
+                    Load[First] -= Demand[c]
+                    Load[Second] += Demand[c]
+
+        ClientAllocationToDepots = DepotAllocation(AllDepots, CustIds, Assigned)
+
+    return ClientAllocationToDepots
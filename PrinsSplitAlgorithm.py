@@ -0,0 +1,51 @@
+import numpy as np
+from MDVRP_Profiling import Stage
+from MDVRP_Costs import DistanceArray
+from MDVRP_Kernels import SplitTour
+from ClarkeAndWrightSavingsAlgorithm import NodesDemand, RoutingResult
+
+
+def NearestNeighbourTour(DistArray):
+    '''
+    This function returns a giant tour of the customers of a single VRP (positions 1, 2, ... of the distance array "DistArray",
+    where the depot is at position 0): starting from the depot, the nearest customer that has not been visited yet is always
+    visited next (the one with the lowest position, if several are equally near).
+    '''
+    n = DistArray.shape[0]
+    Visited = np.zeros(n, dtype=bool)
+    Visited[0] = True
+
+    Tour = list()
+    current = 0
+    for _ in range(n - 1):
+        current = int(np.where(Visited, np.inf, DistArray[current]).argmin())
+        Visited[current] = True
+        Tour.append(current)
+    return Tour
+
+
+def PrinsSplitAlgorithmWithVehConstraint(DepotNodePair, Cap, all_dem, Vehicles):
+    '''
+    This function takes the same inputs as "ClarkeAndWrightSavingsAlgorithmWithVehConstraint":
+    1) The list with all nodes id's, x and y coordinates of a single VRP, 
+    2) The Vehicle Capacity, 
+    3) The list with each customer's demand, 
+    4) The number of vehicles, 
+    and implements a route-first cluster-second heuristic with a vehicle number constraint. First, a giant tour that visits all
+    customers is built with the nearest neighbour heuristic (see "NearestNeighbourTour"). Then, the giant tour is split into the
+    routes of lowest total cost that visit the customers in the order of the tour without violating the vehicle capacity, with
+    the dynamic program of Prins (see "MDVRP_Kernels.SplitTour"), in O(n L) time, where L is the largest number of customers in
+    a route. As in "ClarkeAndWrightSavingsAlgorithmWithVehConstraint", if there are more routes than vehicles, the most
+    expensive routes are removed, and the same dictionary is returned (see "RoutingResult").
+    '''
+    all_ids = [node[0] for node in DepotNodePair]
+
+    with Stage("DistanceMatrix"):
+        DistArray = DistanceArray([[node[1], node[2]] for node in DepotNodePair])
+
+    Demand = NodesDemand(all_ids, all_dem)
+
+    with Stage("RouteConstruction"):
+        Routes = SplitTour(NearestNeighbourTour(DistArray), Demand, DistArray, Cap)
+
+    return RoutingResult(Routes, DistArray, all_ids, Vehicles)
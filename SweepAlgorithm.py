@@ -0,0 +1,68 @@
+import numpy as np
+from MDVRP_Profiling import Stage
+from MDVRP_Costs import DistanceArray
+from ClarkeAndWrightSavingsAlgorithm import NodesDemand, RoutingResult
+from PrinsSplitAlgorithm import NearestNeighbourTour
+
+
+def SweepOrder(DepotNodePair):
+    '''
+    This function returns the positions of the customers of a single VRP (1, 2, ... in "DepotNodePair", where the depot is at
+    position 0), sorted by their polar angle around the depot (customers with the same angle keep their order). The sweep
+    starts right after the largest angular gap between consecutive customers, so the first and the last route are not on both
+    sides of a dense group of customers.
+    '''
+    Points = np.array([[node[1], node[2]] for node in DepotNodePair], dtype=float)
+    Angles = np.arctan2(Points[1:, 1] - Points[0, 1], Points[1:, 0] - Points[0, 0])
+    Order = np.argsort(Angles, kind="stable")
+
+    if len(Order) > 1:
+        Sorted = Angles[Order]
+        Gaps = np.diff(np.concatenate((Sorted, [Sorted[0] + 2*np.pi])))
+        Order = np.roll(Order, -((Gaps.argmax() + 1) % len(Order)))
+
+    return (Order + 1).tolist()
+
+
+def SweepAlgorithmWithVehConstraint(DepotNodePair, Cap, all_dem, Vehicles):
+    '''
+    This function takes the same inputs as "ClarkeAndWrightSavingsAlgorithmWithVehConstraint":
+    1) The list with all nodes id's, x and y coordinates of a single VRP, 
+    2) The Vehicle Capacity, 
+    3) The list with each customer's demand, 
+    4) The number of vehicles, 
+    and implements the Sweep Algorithm with a vehicle number constraint. The customers are sorted by their polar angle around
+    the depot (see "SweepOrder"), and a ray rotating around the depot adds them to the current route in this order, until the
+    next customer would violate the vehicle capacity, and then a new route is started (a customer whose demand alone exceeds the
+    capacity gets a route of its own). The customers are split into routes in O(n log n) time, and each route visits its
+    customers in nearest neighbour order, which takes O(n L) time, where L is the largest number of customers in a route (the
+    order of the angles zigzags between near and far customers). This heuristic is much faster than the Clarke & Wright
+    Savings Algorithm on large instances, usually with more expensive routes. As in "ClarkeAndWrightSavingsAlgorithmWithVehConstraint", if there are more routes than
+    vehicles, the most expensive routes are removed, and the same dictionary is returned (see "RoutingResult").
+    '''
+    all_ids = [node[0] for node in DepotNodePair]
+
+    with Stage("DistanceMatrix"):
+        DistArray = DistanceArray([[node[1], node[2]] for node in DepotNodePair])
+
+    Demand = NodesDemand(all_ids, all_dem)
+
+    with Stage("RouteConstruction"):
+        Routes = list()
+        route = [0]
+        load = 0
+        for node in SweepOrder(DepotNodePair):
+            if len(route) > 1 and load + Demand[node] > Cap:
+                Routes.append(route + [0])
+                route = [0]
+                load = 0
+            route.append(node)
+            load = load + Demand[node]
+        if len(route) > 1:
+            Routes.append(route + [0])
+
+        # The customers of every route are visited in nearest neighbour order (see "NearestNeighbourTour")
+        Routes = [[0] + [route[i] for i in NearestNeighbourTour(DistArray[np.ix_(route[:-1], route[:-1])])] + [0]
+                  for route in Routes]
+
+    return RoutingResult(Routes, DistArray, all_ids, Vehicles)
@@ -1,13 +1,23 @@
-import matplotlib.pyplot as plt
 import random
 import statistics
+import numpy as np
 import pandas as pd
-from openpyxl import Workbook
 import time
-from MDVRP_KMeansFunc import *
-from ClarkeAndWrightSavingsAlgorithm import *
+import io
+import math
+from MDVRP_KMeansFunc import KMeansClusteringBasedNodesSelection
+from ClarkeAndWrightSavingsAlgorithm import ClarkeAndWrightSavingsAlgorithmWithVehConstraint
+from SweepAlgorithm import SweepAlgorithmWithVehConstraint
+from PrinsSplitAlgorithm import PrinsSplitAlgorithmWithVehConstraint
 from MDVRP_HierClustFunc import HierClusteringBasedNodeSelection
-
+from MDVRP_VoronoiFunc import VoronoiBasedNodeSelection
+from MDVRP_TransportFunc import TransportationBasedNodeSelection
+from MDVRP_Profiling import TimedStage, RecordStageTimings, PipelineStages
+from MDVRP_Solution import MDVRPSolution, DemandArray
+from MDVRP_Costs import RouteCost
+from MDVRP_Runtime import ThreadLimits, ThreadingInfo
+
+@TimedStage("InstanceBuild")
 def MDVRPModelInstances(NoOfCustomers, Seed, NoOfVehicles, NoOfDepots, Grid, VehicleCap, MaximumDem):
     '''
     This function takes as input: 1) The number of customers, 2) a Seed, 3) The number of vehicles, 4) The number of depots, 
@@ -109,10 +119,11 @@ def RoutingInfoContainer(ListOfPairs, RoutingHeuristic, NoOfVehicles, Cap, all_d
     DistMatricesContainer = []
 
     for list in ListOfPairs:        
-        RoutesContainer.append(RoutingHeuristic(list, Cap, all_dem, NoOfVehicles)["Routes"])
-        CostsContainer.append(RoutingHeuristic(list, Cap, all_dem, NoOfVehicles)["AllCosts"])
-        TotalCostsContainer.append(RoutingHeuristic(list, Cap, all_dem, NoOfVehicles)["TotalCost"])
-        DistMatricesContainer.append(RoutingHeuristic(list, Cap, all_dem, NoOfVehicles)["Distance_Matrix"])
+        Solution = RoutingHeuristic(list, Cap, all_dem, NoOfVehicles) # The routing heuristic is executed once per distinct VRP
+        RoutesContainer.append(Solution["Routes"])
+        CostsContainer.append(Solution["AllCosts"])
+        TotalCostsContainer.append(Solution["TotalCost"])
+        DistMatricesContainer.append(Solution["Distance_Matrix"])
 
     return {"RoutesContainer":RoutesContainer,
             "CostsContainer":CostsContainer,
@@ -120,25 +131,45 @@ def RoutingInfoContainer(ListOfPairs, RoutingHeuristic, NoOfVehicles, Cap, all_d
             "DistMatricesContainer":DistMatricesContainer}
 
 
-def SolutionPlot(all_xs, all_ys, all_Ids, RoutesContainer, GridSize):
+# Above this number of nodes, "SolutionPlot" does not label the nodes with their ids, which would be unreadable anyway
+PlotLabelsMaxNodes = 200
+
+
+@TimedStage("Plotting")
+def SolutionPlot(all_xs, all_ys, all_Ids, RoutesContainer, GridSize, MaxLabeledNodes=None):
     '''
-    This function creates a "matplotlib" figure with the MDVRP solution.
+    This function creates a "matplotlib" figure with the MDVRP solution. The route nodes are mapped to their coordinates
+    through one array of positions (built from a dictionary of the ids), and all routes are drawn as a single "LineCollection"
+    with one scatter of their nodes, instead of one "plot" call per route, so large instances are drawn in a few calls. The
+    nodes are labeled with their ids only if there are at most "MaxLabeledNodes" nodes (by default "PlotLabelsMaxNodes").
     '''
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+    from matplotlib.colors import to_rgba_array
+
+    if MaxLabeledNodes is None:
+        MaxLabeledNodes = PlotLabelsMaxNodes
+
+    Coords = np.column_stack((np.asarray(all_xs, dtype=float), np.asarray(all_ys, dtype=float)))
+    Position = {node: idx for idx, node in enumerate(all_Ids)}
+
+    Subroutes = [subroute for route in RoutesContainer for subroute in route]
+    Lengths = np.array([len(subroute) for subroute in Subroutes], dtype=np.int64)
+    Rows = np.array([Position[node] for subroute in Subroutes for node in subroute], dtype=np.int64)
+    Points = Coords[Rows]
+
+    # Each route gets the next color of the color cycle, as with one "plot" call per route
+    Cycle = plt.rcParams["axes.prop_cycle"].by_key()["color"]
+    Colors = to_rgba_array([Cycle[i % len(Cycle)] for i in range(len(Subroutes))])
+
     fig, ax = plt.subplots()
 
-    for route in RoutesContainer:
-        for subroute in route:
-            route_xcoords = list()
-            route_ycoords = list()
-            for node in subroute:
-                idx = all_Ids.index(node)
-                xcoord = all_xs[idx]
-                ycoord = all_ys[idx]
-                route_xcoords.append(xcoord)
-                route_ycoords.append(ycoord)
-            ax.plot(route_xcoords, route_ycoords, '-o')
-
-    for xi, yi, pidi in zip(all_xs, all_ys, all_Ids):
+    if len(Subroutes) > 0:
+        ax.add_collection(LineCollection(np.split(Points, np.cumsum(Lengths)[:-1]), colors=Colors))
+        ax.scatter(Points[:, 0], Points[:, 1], c=np.repeat(Colors, Lengths, axis=0), s=36, zorder=2)
+
+    if len(all_Ids) <= MaxLabeledNodes:
+        for xi, yi, pidi in zip(all_xs, all_ys, all_Ids):
             ax.annotate(str(pidi), xy=(xi,yi), fontsize = 13)
 
     # Show the plot.
@@ -151,40 +182,42 @@ def SolutionPlot(all_xs, all_ys, all_Ids, RoutesContainer, GridSize):
     return fig
 
 
-def SolutionMetricsFinder(CostsContainer, TotalCostsContainer, all_dem, RoutesContainer, DictOfDepotsAndNodesPairs):
+def SolutionMetricsFinder(CostsContainer, TotalCostsContainer, all_dem, RoutesContainer, DictOfDepotsAndNodesPairs, Cap=None):
     '''
-    This function gets results from the distinct VRP's solved, and calculates and returns 9 metrics related to the MDVRP solution.
+    This function gets results from the distinct VRP's solved, and calculates and returns 9 metrics related to the MDVRP solution,
+    along with the load of each route, the spread of the route costs, and (if the vehicle capacity "Cap" is given) the 
+    utilisation of the vehicles. The nested lists are converted to an "MDVRPSolution", and the metrics are calculated by
+    "SolutionMetrics".
     '''
-    AllRoutesCost = list()
-    for RouteList in CostsContainer:
-        for RouteCost in RouteList:
-            AllRoutesCost.append(RouteCost)
-
-    DemandSatisfied = 0
-    NoOfCustsVisited = 0
-    for route in RoutesContainer:
-        for subroute in route:
-            for r in subroute:
-                if subroute[-1] == r or subroute[0] == r:
-                    continue
-                else:
-                    NoOfCustsVisited = NoOfCustsVisited + 1
-                    for cust in all_dem:
-                        if r == cust[0]:
-                            DemandSatisfied = DemandSatisfied + cust[1]
-
-    TotalDemand = 0
-    NoOfCustsToBeVisited = 0
-    for k, v in DictOfDepotsAndNodesPairs.items():
-        for node in v:
-            NoOfCustsToBeVisited = NoOfCustsToBeVisited + 1
-            for i in all_dem:
-                if node == i[0]:
-                    TotalDemand = TotalDemand + i[1]
+    Solution = MDVRPSolution.FromRoutes(list(DictOfDepotsAndNodesPairs.keys()), RoutesContainer, CostsContainer, TotalCostsContainer, all_dem)
+
+    return SolutionMetrics(Solution, all_dem, DictOfDepotsAndNodesPairs, Cap)
+
+
+@TimedStage("Metrics")
+def SolutionMetrics(Solution, all_dem, DictOfDepotsAndNodesPairs, Cap=None):
+    '''
+    This function calculates the metrics of "SolutionMetricsFinder" directly from an "MDVRPSolution". The customers of all
+    routes are stored in one flat array, so all metrics are calculated with array reductions instead of scanning the demand 
+    list for every visited customer.
+    '''
+    AllRoutesCost = list(Solution.RouteCosts)
+    TotalCostsContainer = Solution.TotalCostsContainer()
+    RouteLoads = Solution.RouteLoads
+
+    dem = DemandArray(all_dem)
+
+    DemandSatisfied = int(RouteLoads.sum())
+    NoOfCustsVisited = len(Solution.Tour)
+
+    CustsToBeVisited = np.array([node for v in DictOfDepotsAndNodesPairs.values() for node in v], dtype=np.int64)
+    TotalDemand = int(dem[CustsToBeVisited].sum())
+    NoOfCustsToBeVisited = len(CustsToBeVisited)
 
     PctOfTotalDemandSatisfied = round((DemandSatisfied/TotalDemand)*100, 2)
     PctOfCustomersVisited = round((NoOfCustsVisited/NoOfCustsToBeVisited)*100, 2)
 
+    # There is one cost per route, so these few values are still calculated on the original lists, which keeps the rounding identical
     AvgRouteCost = round(sum(AllRoutesCost)/len(AllRoutesCost), 2)
     MedianRouteCost = round(statistics.median(AllRoutesCost), 2) 
 
@@ -192,17 +225,53 @@ def SolutionMetricsFinder(CostsContainer, TotalCostsContainer, all_dem, RoutesCo
     MedianDepotCost = round(statistics.median(TotalCostsContainer), 2)
     TotalCost = round(sum(TotalCostsContainer), 2)
 
-    return {"TotalCost" : TotalCost,
-            "AvgRouteCost" : AvgRouteCost,
-            "MedianRouteCost" : MedianRouteCost,
-            "AvgDepotCost" : AvgDepotCost,
-            "MedianDepotCost" : MedianDepotCost,
-            "PctOfTotalDemandSatisfied" : PctOfTotalDemandSatisfied,
-            "DemandSatisfied" : DemandSatisfied,
-            "TotalDemand" : TotalDemand, 
-            "PctOfCustomersVisited" : PctOfCustomersVisited}
+    Metrics = {"TotalCost" : TotalCost,
+               "AvgRouteCost" : AvgRouteCost,
+               "MedianRouteCost" : MedianRouteCost,
+               "AvgDepotCost" : AvgDepotCost,
+               "MedianDepotCost" : MedianDepotCost,
+               "PctOfTotalDemandSatisfied" : PctOfTotalDemandSatisfied,
+               "DemandSatisfied" : DemandSatisfied,
+               "TotalDemand" : TotalDemand, 
+               "PctOfCustomersVisited" : PctOfCustomersVisited,
+               "RouteLoads" : RouteLoads.tolist(),
+               "AvgRouteLoad" : round(float(RouteLoads.mean()), 2),
+               "RouteCostStdDev" : round(float(Solution.RouteCosts.std()), 2),
+               "RouteCostRange" : round(float(Solution.RouteCosts.max() - Solution.RouteCosts.min()), 2)}
+
+    if Cap is not None:
+        Utilisation = RouteLoads/Cap*100
+        Metrics["AvgRouteUtilisation"] = round(float(Utilisation.mean()), 2)
+        Metrics["MinRouteUtilisation"] = round(float(Utilisation.min()), 2)
+        Metrics["MaxRouteUtilisation"] = round(float(Utilisation.max()), 2)
+
+    return Metrics
+
+
+def UnservedCustomersCost(Instances, DictOfDepotsAndNodesPairs, Solution):
+    '''
+    The fleet trimming of the routing heuristic drops the most expensive routes, so a solution may leave customers unserved,
+    which makes its total cost look lower than the cost of a solution that serves everyone. This function finds the customers
+    that are not in any route, and calculates the cost of serving each of them with a dedicated round trip from the depot it
+    was assigned to. Adding this cost to the total cost gives an objective that can be fairly compared between solutions.
+    '''
+    Visited = set(Solution.Tour.tolist())
+
+    Coords = {node[0]: (node[1], node[2]) for node in Instances["allNodes"]}
+
+    UnservedCustomers = list()
+    UnservedCost = 0
+    for depot, customers in DictOfDepotsAndNodesPairs.items():
+        for cust in customers:
+            if cust not in Visited:
+                UnservedCustomers.append(cust)
+                UnservedCost = UnservedCost + 2*round(math.dist(Coords[depot], Coords[cust]), 1)
+
+    return {"UnservedCustomers": UnservedCustomers, 
+            "UnservedCost": round(UnservedCost, 2)}
 
 
+@TimedStage("InstanceBuild")
 def MDVRP_BenchmarkInstances(Instance, Seed):
 
     with open(Instance) as f:
@@ -229,7 +298,8 @@ def MDVRP_BenchmarkInstances(Instance, Seed):
     allys = list()
     allDepots = list()
 
-    for row in range(NoOfVehicles+1, NoOfCusts+NoOfVehicles+1):
+    # The first line is followed by one line per depot (max route duration and vehicle capacity), and then by the customers
+    for row in range(NoOfDepots+1, NoOfCusts+NoOfDepots+1):
         cust = df[row:row+1]
 
         cust_id = int(cust[0].astype("int"))
@@ -244,7 +314,7 @@ def MDVRP_BenchmarkInstances(Instance, Seed):
         all_dem.append(demand)
 
     counter = 1
-    for row in range(NoOfVehicles+1, NoOfCusts+NoOfVehicles+NoOfDepots+1):
+    for row in range(NoOfDepots+1, NoOfCusts+NoOfDepots+NoOfDepots+1):
         node = df[row:row+1]
         node_id = int(node[0].astype("int"))
         if node_id > NoOfCusts:
@@ -283,189 +353,155 @@ def MDVRP_BenchmarkInstances(Instance, Seed):
 
 
 
-def BatchTestingExcelWriter(NoOfMetrics, FromSeed, ToSeed, noc, nov, nod, nog, nocap, nodem):
+BatchHeuristics = ["KMeans", "Ward", "Complete", "Average"]
+
+# All the node selection heuristics of "NodeSelection": the clustering-based ones of "BatchHeuristics", the nearest depot
+# baselines (see "VoronoiBasedNodeSelection"), and the capacity-aware assignment (see "TransportationBasedNodeSelection")
+SelectionHeuristics = BatchHeuristics + ["Voronoi", "VoronoiOverflow", "Transportation"]
+
+BatchMetricsNames = ["TotalCost", "AvgRouteCost", "MedianRouteCost", "AvgDepotCost", "MedianDepotCost", 
+                     "PctOfTotalDemandSatisfied", "PctOfCustomersVisited", "ElapsedTime", "CpuElapsedTime"]
+
+# The routing heuristics that "MDVRPSolve" can apply to the VRP of every depot, by name
+RoutingHeuristics = {"ClarkeAndWright": ClarkeAndWrightSavingsAlgorithmWithVehConstraint,
+                     "Sweep": SweepAlgorithmWithVehConstraint,
+                     "PrinsSplit": PrinsSplitAlgorithmWithVehConstraint}
+
+
+def NodeSelection(Instances, Heuristic):
+    '''
+    This function gets as inputs the problem instances and the name of a node selection heuristic ("KMeans", "Ward", "Complete", 
+    "Average", "Voronoi", "VoronoiOverflow", or "Transportation"), and returns the dictionary of depots-nodes pairs created by the corresponding 
+    selection function. The clustering runs with the threading policy of "MDVRP_Runtime.ConfigureRuntime".
+    '''
+    if Heuristic == "KMeans":
+        with ThreadLimits():
+            return KMeansClusteringBasedNodesSelection(Instances)
+    elif Heuristic in ("Ward", "Complete", "Average"):
+        with ThreadLimits():
+            return HierClusteringBasedNodeSelection(Instances, Heuristic.lower())
+    elif Heuristic in ("Voronoi", "VoronoiOverflow"):
+        return VoronoiBasedNodeSelection(Instances, Overflow=Heuristic == "VoronoiOverflow")
+    elif Heuristic == "Transportation":
+        return TransportationBasedNodeSelection(Instances)
+    else:
+        raise ValueError("Unknown node selection heuristic: " + str(Heuristic))
+
+
+def MDVRPSolve(Instances, Heuristic, RoutingHeuristic=ClarkeAndWrightSavingsAlgorithmWithVehConstraint):
+    '''
+    This function solves the given problem instances: it applies the node selection heuristic with the given name (see 
+    "NodeSelection"), solves the VRP of every depot with the routing heuristic (one of "RoutingHeuristics", the Clarke & Wright
+    Savings Algorithm by default), and calculates the solution metrics. It returns
+    a dictionary with the depots-nodes pairs ("Selection"), the solution as an "MDVRPSolution" ("Solution"), and the metrics 
+    of "SolutionMetrics" ("Metrics"). The routes stay in the flat form of "MDVRPSolution" through all stages, and the nested 
+    lists of "RoutingInfoContainer" can be obtained with "Solution.ToRoutesContainer()" where they are displayed.
+    '''
+    DictOfDepotsAndNodesPairs = NodeSelection(Instances, Heuristic)
+    ListsOfPairs = DepotsAndNodesPairsLists(DictOfDepotsAndNodesPairs, Instances["allNodes"])
+
+    NoOfVehicles = Instances["NoOfVehicles"]
+    Cap = Instances["VehicleCap"]
+    all_dem = Instances["all_dem"]
+
+    Results = list()
+    for pair in ListsOfPairs:
+        Results.append(RoutingHeuristic(pair, Cap, all_dem, NoOfVehicles))
+    DepotIds = [pair[0][0] for pair in ListsOfPairs]
+    Solution = MDVRPSolution.FromRoutingResults(DepotIds, Results, all_dem)
+
+    Metrics = SolutionMetrics(Solution, all_dem, DictOfDepotsAndNodesPairs, Cap)
+
+    return {"Selection": DictOfDepotsAndNodesPairs, 
+            "Solution": Solution, 
+            "Metrics": Metrics}
+
+
+def SingleSimulationRun(Heuristic, Seed, noc, nov, nod, nog, nocap, nodem, TraceMemory=False, IncludeRoutes=False):
+    '''
+    This function runs one simulation of a batch: it creates the problem instances of the given seed, applies the given node 
+    selection heuristic followed by the Clarke & Wright Savings Algorithm, and returns the solution metrics along with the
+    heuristic, the seed, the elapsed and CPU times, the timings of each stage of the pipeline (see "MDVRP_Profiling"), and the
+    active threading setting (see "MDVRP_Runtime.ThreadingInfo"). It only takes picklable arguments, so it can be submitted to a
+    process pool. If "TraceMemory" is True, the peak memory of each stage is measured as well, and if "IncludeRoutes" is True,
+    the routes are returned too (as the nested lists of "RoutingInfoContainer").
+    '''
+    st = time.time()
+    cpu_st = time.process_time()
+    with RecordStageTimings(TraceMemory) as Timings:
+        inst = MDVRPModelInstances(noc, Seed, nov, nod, nog, nocap, nodem) 
+        Solution = MDVRPSolve(inst, Heuristic)
+
+    et = time.time()
+    cpu_et = time.process_time()
+
+    Result = {"Heuristic": Heuristic, "Seed": Seed}
+    Result.update(Solution["Metrics"])
+    Result["ElapsedTime"] = round(et - st, 3)
+    Result["CpuElapsedTime"] = round(cpu_et - cpu_st, 3)
+    Result["StageTimings"] = Timings.AsDict()
+    Result["Threads"] = ThreadingInfo()
+    if IncludeRoutes:
+        Result["Routes"] = Solution["Solution"].ToRoutesContainer()
+
+    return Result
+
+
+def BatchResultsWorkbook(Results, FromSeed):
+    '''
+    This function gets a list of results returned by "SingleSimulationRun", and writes them in an Excel workbook with the same
+    layout as "BatchTestingExcelWriter": one block of rows per heuristic (in the order of "SelectionHeuristics"), one row per metric,
+    and one column per seed. The timings of each stage are written in a second sheet. The workbook is returned as bytes, so it
+    can be kept in memory and downloaded without touching the disk.
+    '''
+    from openpyxl import Workbook
 
     workbook = Workbook()
     sheet = workbook.active
 
-    NoOfLines = NoOfMetrics
-    Counter = 0
-    Simulations = ToSeed - FromSeed
-
-    # 1st heuristic
-    for i in range(Counter+1, Counter+2): 
-        for j in range(1, Simulations+2):                                           
-            
-            st = time.time()
-            cpu_st = time.process_time()
-            inst = MDVRPModelInstances(noc, j, nov, nod, nog, nocap, nodem) 
-
-            DictOfDepotsAndNodesPairs = KMeansClusteringBasedNodesSelection(inst) # "KMeans-Clustering-Based Clarke & Wright Heuristic"
-            ListsOfPairs = DepotsAndNodesPairsLists(DictOfDepotsAndNodesPairs, inst["allNodes"])
-            xx = inst["allxs"]        
-            yy = inst["allys"]
-
-            all_ids = inst["allIds"]
-            NoOfVehicles = inst["NoOfVehicles"]
-            Cap = inst["VehicleCap"]
-            all_dem = inst["all_dem"]
-
-            Container = RoutingInfoContainer(ListsOfPairs, ClarkeAndWrightSavingsAlgorithmWithVehConstraint, NoOfVehicles, Cap, all_dem)
-
-            Metrics = SolutionMetricsFinder(Container["CostsContainer"], Container["TotalCostsContainer"], all_dem, Container["RoutesContainer"], DictOfDepotsAndNodesPairs)
-            
-            et = time.time()
-            cpu_et = time.process_time()
-
-            elapsed_time = round(et - st, 3)
-            cpu_elapsed_time = round((cpu_et - cpu_st)/100, 3)
-
-            sheet.cell(row=i, column=j).value = Metrics["TotalCost"]
-            sheet.cell(row=i+1, column=j).value = Metrics["AvgRouteCost"]
-            sheet.cell(row=i+2, column=j).value = Metrics["MedianRouteCost"]
-            sheet.cell(row=i+3, column=j).value = Metrics["AvgDepotCost"]
-            sheet.cell(row=i+4, column=j).value = Metrics["MedianDepotCost"]
-            sheet.cell(row=i+5, column=j).value = Metrics["PctOfTotalDemandSatisfied"]
-            sheet.cell(row=i+6, column=j).value = Metrics["PctOfCustomersVisited"]
-            sheet.cell(row=i+7, column=j).value = elapsed_time
-            sheet.cell(row=i+8, column=j).value = cpu_elapsed_time
-            
-            Counter = Counter + NoOfMetrics + 2
-            NoOfLines = Counter + NoOfMetrics 
-
-    # 2nd heursitic
-    Counter = 0
-    for i in range(Counter+1, Counter+2): 
-        for j in range(1, Simulations+2):                                         
-            
-            st = time.time()
-            cpu_st = time.process_time()
-            inst = MDVRPModelInstances(noc, j, nov, nod, nog, nocap, nodem) 
-
-            DictOfDepotsAndNodesPairs = HierClusteringBasedNodeSelection(inst, "ward")
-            ListsOfPairs = DepotsAndNodesPairsLists(DictOfDepotsAndNodesPairs, inst["allNodes"])
-            xx = inst["allxs"]        
-            yy = inst["allys"]
-
-            all_ids = inst["allIds"]
-            NoOfVehicles = inst["NoOfVehicles"]
-            Cap = inst["VehicleCap"]
-            all_dem = inst["all_dem"]
-
-            Container = RoutingInfoContainer(ListsOfPairs, ClarkeAndWrightSavingsAlgorithmWithVehConstraint, NoOfVehicles, Cap, all_dem)
-
-            Metrics = SolutionMetricsFinder(Container["CostsContainer"], Container["TotalCostsContainer"], all_dem, Container["RoutesContainer"], DictOfDepotsAndNodesPairs)
-            
-            et = time.time()
-            cpu_et = time.process_time()
-
-            elapsed_time = round(et - st, 3)
-            cpu_elapsed_time = round((cpu_et - cpu_st)/100, 3)
-
-            sheet.cell(row=i+10, column=j).value = Metrics["TotalCost"]
-            sheet.cell(row=i+11, column=j).value = Metrics["AvgRouteCost"]
-            sheet.cell(row=i+12, column=j).value = Metrics["MedianRouteCost"]
-            sheet.cell(row=i+13, column=j).value = Metrics["AvgDepotCost"]
-            sheet.cell(row=i+14, column=j).value = Metrics["MedianDepotCost"]
-            sheet.cell(row=i+15, column=j).value = Metrics["PctOfTotalDemandSatisfied"]
-            sheet.cell(row=i+16, column=j).value = Metrics["PctOfCustomersVisited"]
-            sheet.cell(row=i+17, column=j).value = elapsed_time
-            sheet.cell(row=i+18, column=j).value = cpu_elapsed_time
-            
-            Counter = Counter + NoOfMetrics + 2
-            NoOfLines = Counter + NoOfMetrics
-
-    # 3rd heursitic
-    Counter = 0
-    for i in range(Counter+1, Counter+2): 
-        for j in range(1, Simulations+2):                                         
-            
-            st = time.time()
-            cpu_st = time.process_time()
-            inst = MDVRPModelInstances(noc, j, nov, nod, nog, nocap, nodem) 
-
-            DictOfDepotsAndNodesPairs = HierClusteringBasedNodeSelection(inst, "complete")
-            ListsOfPairs = DepotsAndNodesPairsLists(DictOfDepotsAndNodesPairs, inst["allNodes"])
-            xx = inst["allxs"]        
-            yy = inst["allys"]
-
-            all_ids = inst["allIds"]
-            NoOfVehicles = inst["NoOfVehicles"]
-            Cap = inst["VehicleCap"]
-            all_dem = inst["all_dem"]
-
-            Container = RoutingInfoContainer(ListsOfPairs, ClarkeAndWrightSavingsAlgorithmWithVehConstraint, NoOfVehicles, Cap, all_dem)
-
-            Metrics = SolutionMetricsFinder(Container["CostsContainer"], Container["TotalCostsContainer"], all_dem, Container["RoutesContainer"], DictOfDepotsAndNodesPairs)
-            
-            et = time.time()
-            cpu_et = time.process_time()
-
-            elapsed_time = round(et - st, 3)
-            cpu_elapsed_time = round((cpu_et - cpu_st)/100, 3)
-
-            sheet.cell(row=i+20, column=j).value = Metrics["TotalCost"]
-            sheet.cell(row=i+21, column=j).value = Metrics["AvgRouteCost"]
-            sheet.cell(row=i+22, column=j).value = Metrics["MedianRouteCost"]
-            sheet.cell(row=i+23, column=j).value = Metrics["AvgDepotCost"]
-            sheet.cell(row=i+24, column=j).value = Metrics["MedianDepotCost"]
-            sheet.cell(row=i+25, column=j).value = Metrics["PctOfTotalDemandSatisfied"]
-            sheet.cell(row=i+26, column=j).value = Metrics["PctOfCustomersVisited"]
-            sheet.cell(row=i+27, column=j).value = elapsed_time
-            sheet.cell(row=i+28, column=j).value = cpu_elapsed_time
-            
-            Counter = Counter + NoOfMetrics + 2
-            NoOfLines = Counter + NoOfMetrics 
-
-    # 4th heursitic
-    Counter = 0
-    for i in range(Counter+1, Counter+2): 
-        for j in range(1, Simulations+2):                                         
-            
-            st = time.time()
-            cpu_st = time.process_time()
-            inst = MDVRPModelInstances(noc, j, nov, nod, nog, nocap, nodem) 
-
-            DictOfDepotsAndNodesPairs = HierClusteringBasedNodeSelection(inst, "average")
-            ListsOfPairs = DepotsAndNodesPairsLists(DictOfDepotsAndNodesPairs, inst["allNodes"])
-            xx = inst["allxs"]        
-            yy = inst["allys"]
-
-            all_ids = inst["allIds"]
-            NoOfVehicles = inst["NoOfVehicles"]
-            Cap = inst["VehicleCap"]
-            all_dem = inst["all_dem"]
-
-            Container = RoutingInfoContainer(ListsOfPairs, ClarkeAndWrightSavingsAlgorithmWithVehConstraint, NoOfVehicles, Cap, all_dem)
-
-            Metrics = SolutionMetricsFinder(Container["CostsContainer"], Container["TotalCostsContainer"], all_dem, Container["RoutesContainer"], DictOfDepotsAndNodesPairs)
-            
-            et = time.time()
-            cpu_et = time.process_time()
-
-            elapsed_time = round(et - st, 3)
-            cpu_elapsed_time = round((cpu_et - cpu_st)/100, 3)
-
-            sheet.cell(row=i+30, column=j).value = Metrics["TotalCost"]
-            sheet.cell(row=i+31, column=j).value = Metrics["AvgRouteCost"]
-            sheet.cell(row=i+32, column=j).value = Metrics["MedianRouteCost"]
-            sheet.cell(row=i+33, column=j).value = Metrics["AvgDepotCost"]
-            sheet.cell(row=i+34, column=j).value = Metrics["MedianDepotCost"]
-            sheet.cell(row=i+35, column=j).value = Metrics["PctOfTotalDemandSatisfied"]
-            sheet.cell(row=i+36, column=j).value = Metrics["PctOfCustomersVisited"]
-            sheet.cell(row=i+37, column=j).value = elapsed_time
-            sheet.cell(row=i+38, column=j).value = cpu_elapsed_time
-            
-            Counter = Counter + NoOfMetrics + 2
-            NoOfLines = Counter + NoOfMetrics
+    for result in Results:
+        i = SelectionHeuristics.index(result["Heuristic"])*10 + 1
+        j = result["Seed"] - FromSeed + 1
+        for k, metric in enumerate(BatchMetricsNames):
+            sheet.cell(row=i+k, column=j).value = result[metric]
+
+    # The timings of each stage are written in a second sheet, with one row per simulation
+    TimingsSheet = workbook.create_sheet("StageTimings")
+    TimingsSheet.append(["Heuristic", "Seed"] + [stage + " " + measure for stage in PipelineStages for measure in ("WallTime", "CpuTime", "Calls", "PeakMemoryMB")])
+    for result in Results:
+        row = [result["Heuristic"], result["Seed"]]
+        for stage in PipelineStages:
+            measures = result.get("StageTimings", dict()).get(stage, dict())
+            row.extend([measures.get("WallTime"), measures.get("CpuTime"), measures.get("Calls"), measures.get("PeakMemoryMB")])
+        TimingsSheet.append(row)
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+
+    return buffer.getvalue()
+
+
+def BatchTestingExcelWriter(NoOfMetrics, FromSeed, ToSeed, noc, nov, nod, nog, nocap, nodem):
+    '''
+    This function runs the simulations of the seeds "FromSeed" to "ToSeed" with every heuristic of "BatchHeuristics" (see 
+    "SingleSimulationRun"), and saves the workbook of "BatchResultsWorkbook" in the current directory, with the seed of each
+    column counted from "FromSeed". "NoOfMetrics" is kept for compatibility, since the metrics are those of "BatchMetricsNames".
+    '''
+    Results = list()
+    for Heuristic in BatchHeuristics:
+        for Seed in range(FromSeed, ToSeed + 1):
+            Results.append(SingleSimulationRun(Heuristic, Seed, noc, nov, nod, nog, nocap, nodem))
 
     ExcelFileName = "Sims-From-Seed-"+str(FromSeed)+"-to-"+str(ToSeed)+"-"+str(noc)+"-"+str(nov)+"-"+str(nod)+"-"+str(nog)+"-"+str(nocap)+"-"+str(nodem)+".xlsx"
     
-    workbook.save(filename=ExcelFileName)
+    with open(ExcelFileName, "wb") as f:
+        f.write(BatchResultsWorkbook(Results, FromSeed))
 
 
 def CostFinder(Route, Matrix):
-    Cost = 0
-    for i in Route[:-1]:
-        Cost = Cost + Matrix[Route.index(i)][Route.index(i)+1]
-    return Cost
\ No newline at end of file
+    '''
+    This function returns the cost of a route, where "Matrix" is the distance matrix of the route's nodes in the order they are
+    visited (so the cost is the sum of the distances between consecutive positions). The consecutive positions are looked up 
+    directly (see "MDVRP_Costs.RouteCost"), so a node that appears twice in the route is counted at each of its positions.
+    '''
+    return RouteCost(np.arange(len(Route)), np.asarray(Matrix))
\ No newline at end of file
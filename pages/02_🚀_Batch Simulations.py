@@ -1,9 +1,13 @@
 import streamlit as st
-from miscellanious_functions import *
-from ClarkeAndWrightSavingsAlgorithm import ClarkeAndWrightSavingsAlgorithmWithVehConstraint
-from MDVRP_KMeansFunc import KMeansClusteringBasedNodesSelection
-from MDVRP_HierClustFunc import HierClusteringBasedNodeSelection
+from miscellanious_functions import SingleSimulationRun, BatchHeuristics, SelectionHeuristics, BatchMetricsNames, BatchResultsWorkbook
+from MDVRP_Runtime import ConfigureRuntime, InitializeWorker
 import datetime
+import os
+import time
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+ConfigureRuntime()
 
 st.set_page_config(page_title = "Multi-Depot Vehicle Routing Problem Simulator", 
 page_icon="🚚", 
@@ -72,32 +76,116 @@ with st.sidebar:
     help="The maximum demand a customer can have"
     )
 
+    st.subheader("Heuristics")
+
+    heuristics = st.multiselect('Choose node selection heuristics 🧭',
+    options=SelectionHeuristics,
+    default=BatchHeuristics,
+    help="Every seed is solved with each selected heuristic. Voronoi assigns every client to its nearest depot, VoronoiOverflow moves the clients of over-capacity depots to their second nearest depot, and Transportation assigns the clients within the fleet capacity of the depots"
+    )
+
+
+@st.cache_resource
+def BatchExecutor():
+    '''
+    The process pool that runs the batch simulations. It is owned by the app and shared by all sessions, so batches run in the 
+    background while the page stays responsive. Each worker applies the runtime settings and warms up the solver when it starts.
+    '''
+    return ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=InitializeWorker)
+
+
+def BatchIsRunning():
+    Batch = st.session_state.get("Batch")
+    return Batch is not None and not Batch["Cancelled"] and not all(f.done() for f in Batch["Futures"])
+
+
+col1, col2 = st.columns(2)
+
+with col1:
+    if st.button('Start Batch Simulations', disabled=BatchIsRunning() or not heuristics):
+        # Results are stored per session, so concurrent users do not overwrite each other's simulations
+        st.session_state["Batch"] = {
+            "Futures": [BatchExecutor().submit(SingleSimulationRun, h, seed, noc, nov, nod, nog, novc, nomd) 
+                        for h in heuristics for seed in range(1, nos+1)],
+            "FromSeed": 1,
+            "StartTime": time.time(),
+            "EndTime": None,
+            "Cancelled": False}
+
+with col2:
+    if st.button('Cancel Batch Simulations', disabled=not BatchIsRunning()):
+        Batch = st.session_state["Batch"]
+        for f in Batch["Futures"]:
+            f.cancel()
+        Batch["Cancelled"] = True
+        Batch["EndTime"] = time.time()
+
+
+@st.fragment(run_every=1 if BatchIsRunning() else None)
+def BatchProgress():
+    Batch = st.session_state.get("Batch")
+    if Batch is None:
+        return
+
+    Futures = Batch["Futures"]
+    Finished = [f for f in Futures if f.done() and not f.cancelled()]
+    Results = [f.result() for f in Finished if f.exception() is None]
+    NoOfFailed = len(Finished) - len(Results)
+
+    if Batch["EndTime"] is None and all(f.done() for f in Futures):
+        Batch["EndTime"] = time.time()
+    Elapsed = (Batch["EndTime"] or time.time()) - Batch["StartTime"]
+
+    st.progress(len(Finished)/len(Futures), text=str(len(Finished)) + " of " + str(len(Futures)) + " simulations finished")
+
+    Throughput = len(Finished)/Elapsed if Elapsed > 0 else 0
+    Remaining = len(Futures) - len(Finished)
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Elapsed time", str(datetime.timedelta(seconds=round(Elapsed))))
+    with col2:
+        st.metric("Simulations / sec", round(Throughput, 2))
+    with col3:
+        if Batch["Cancelled"]:
+            st.metric("ETA", "Cancelled")
+        elif Remaining == 0:
+            st.metric("ETA", "..Done")
+        elif Throughput > 0:
+            st.metric("ETA", str(datetime.timedelta(seconds=round(Remaining/Throughput))))
+        else:
+            st.metric("ETA", "-")
+    with col4:
+        st.metric("Failed simulations", NoOfFailed, help="Simulations that raised an error, e.g. when a depot was assigned less clients than vehicles")
+
+    if Results:
+        df = pd.DataFrame(Results, columns=["Heuristic", "Seed"] + BatchMetricsNames)
+        st.subheader("Average metrics per heuristic")
+        st.dataframe(df.groupby("Heuristic", sort=False)[BatchMetricsNames].mean().round(3))
+        st.subheader("Average stage wall times per heuristic (sec)")
+        StageTimes = pd.DataFrame([{"Heuristic": r["Heuristic"], **{k: v["WallTime"] for k, v in r["StageTimings"].items()}} for r in Results])
+        st.dataframe(StageTimes.groupby("Heuristic", sort=False).mean().round(4))
+        Threads = Results[-1]["Threads"]
+        st.caption("Threads per worker: " + str(Threads["ThreadsLimit"]) + ", thread pools: " + 
+                   (", ".join(k + " " + str(v) for k, v in Threads["ThreadPools"].items()) or "none loaded"))
+        st.subheader("Simulations")
+        st.dataframe(df.sort_values(["Heuristic", "Seed"]), hide_index=True)
+
+        if all(f.done() for f in Futures):
+            # The workbook is built once the batch is done, and kept with the batch, instead of at every refresh
+            if "Workbook" not in Batch:
+                Batch["Workbook"] = BatchResultsWorkbook(Results, Batch["FromSeed"])
+            st.download_button(label='📥 Export Excel File', 
+                               data=Batch["Workbook"], 
+                               file_name="Simulations.xlsx", 
+                               mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        else:
+            st.caption("The Excel file can be exported once all simulations are finished.")
+
+    if Remaining == 0 and Batch["EndTime"] is not None and not Batch.get("Reported"):
+        # Rerunning the whole app once, so the buttons get enabled again and the fragment stops polling
+        Batch["Reported"] = True
+        st.rerun()
+
 
-if st.button('Start Batch Simulations'):
-    dir_path = os.getcwd() # Get the current working directory
-
-    # Loop through all the files in the current directory
-    for file_name in os.listdir(dir_path):
-        if file_name.endswith(".xlsx"):  # Check if the file is an xlsx file
-            file_path = os.path.join(dir_path, file_name)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            
-    with st.spinner('Wait for it...'):
-        start_time = time.time()
-        BatchTestingExcelWriter(7, 1, nos, noc, nov, nod, nog, novc, nomd) 
-        st.write("..Done")
-        end_time = time.time()
-        st.write("Elapsed time:", str(datetime.timedelta(seconds=end_time-start_time)))
-
-        dir_path = os.getcwd()
-        for file_name in os.listdir(dir_path):
-            if file_name.endswith(".xlsx"):
-                file_path = os.path.join(dir_path, file_name)
-                with open(file_path, 'rb') as file:
-                    file_contents = file.read()
-                    if st.download_button(label='📥 Export Excel File', data=file, file_name="Simulations.xlsx", mime="text/xlsx", key=2):
-                        break
-        
-        
-        
+BatchProgress()
@@ -0,0 +1,115 @@
+'''
+Parity test of "MDVRP_Kernels": every kernel, and the full solve with every routing heuristic, must give identical routes and
+costs with the compiled kernels (Numba) and with the plain Python fallback (see "SetNumbaEnabled"). Without Numba, both runs
+take the fallback and the test is skipped. It runs with pytest, or directly:
+
+    python -m pytest test_MDVRP_Kernels.py
+    python test_MDVRP_Kernels.py
+'''
+import numpy as np
+import pytest
+import MDVRP_Kernels
+from MDVRP_Costs import DistanceArray
+from MDVRP_Decomposition import DecomposedSolve
+from miscellanious_functions import MDVRPModelInstances, MDVRPSolve, RoutingHeuristics
+from PrinsSplitAlgorithm import NearestNeighbourTour
+
+pytestmark = pytest.mark.skipif(not MDVRP_Kernels.NumbaAvailable, reason="Numba is not installed")
+
+# The generated instances of the test: (number of customers, seed, number of depots)
+ParityInstances = [(60, 1, 2), (150, 7, 3), (400, 11, 5)]
+
+
+def BothPaths(Function, *Arguments):
+    '''
+    This function calls the given function with the compiled kernels and with the plain Python fallback, and returns both
+    results (compiled first). The previous setting is restored afterwards.
+    '''
+    Previous = MDVRP_Kernels.UseNumba
+    try:
+        MDVRP_Kernels.SetNumbaEnabled(True)
+        Compiled = Function(*Arguments)
+        MDVRP_Kernels.SetNumbaEnabled(False)
+        Fallback = Function(*Arguments)
+    finally:
+        MDVRP_Kernels.UseNumba = Previous
+    return Compiled, Fallback
+
+
+def DepotProblem(NoOfCustomers, Seed):
+    '''
+    This function returns the distance array, the demands (indexed by position, the depot at position 0) and the vehicle
+    capacity of a random single depot problem.
+    '''
+    rng = np.random.default_rng(Seed)
+    Points = rng.uniform(0, 100, size=(NoOfCustomers + 1, 2))
+    Demand = np.concatenate(([0], rng.integers(1, 10, size=NoOfCustomers)))
+    return DistanceArray(Points), Demand.tolist(), 40
+
+
+def Savings(D):
+    first, second, savings = MDVRP_Kernels.SavingsPairs(D)
+    order = MDVRP_Kernels.SavingsOrder(savings)
+    return first[order], second[order], savings[order]
+
+
+def test_SavingsOrder():
+    for Seed in range(5):
+        D = DepotProblem(80, Seed)[0]
+        Compiled, Fallback = BothPaths(Savings, D)
+        for a, b in zip(Compiled, Fallback):
+            assert np.array_equal(a, b)
+
+
+def test_MergeRoutes():
+    for Seed in range(5):
+        D, Demand, Cap = DepotProblem(80, Seed)
+        first, second, savings = Savings(D)
+        Compiled, Fallback = BothPaths(MDVRP_Kernels.MergeRoutes, first, second, Demand, Cap)
+        assert Compiled == Fallback
+
+        # Starting from routes that were built separately (as the border repair of "MDVRP_Decomposition" does)
+        Routes = [[0] + list(range(i, min(i + 3, len(Demand)))) + [0] for i in range(1, len(Demand), 3)]
+        Compiled, Fallback = BothPaths(MDVRP_Kernels.MergeRoutes, first, second, Demand, 2*Cap, Routes)
+        assert Compiled == Fallback
+
+
+def test_RouteCostsValues():
+    for Seed in range(5):
+        D, Demand, Cap = DepotProblem(80, Seed)
+        Routes = MDVRP_Kernels.MergeRoutes(*Savings(D)[:2], Demand, Cap)
+        Compiled, Fallback = BothPaths(MDVRP_Kernels.RouteCostsValues, Routes, D)
+        assert np.array_equal(Compiled, Fallback)
+
+
+def test_SplitTour():
+    for Seed in range(5):
+        D, Demand, Cap = DepotProblem(80, Seed)
+        Compiled, Fallback = BothPaths(MDVRP_Kernels.SplitTour, NearestNeighbourTour(D), Demand, D, Cap)
+        assert Compiled == Fallback
+
+
+def AssertSameSolution(Compiled, Fallback):
+    assert Compiled["Selection"] == Fallback["Selection"]
+    for Attribute in ("Tour", "Offsets", "RouteDepots", "RouteCosts", "RouteLoads", "DepotCosts"):
+        assert np.array_equal(getattr(Compiled["Solution"], Attribute), getattr(Fallback["Solution"], Attribute)), Attribute
+    assert Compiled["Metrics"] == Fallback["Metrics"]
+
+
+def test_MDVRPSolve():
+    for NoOfCustomers, Seed, NoOfDepots in ParityInstances:
+        Instances = MDVRPModelInstances(NoOfCustomers, Seed, 10, NoOfDepots, 100, 100, 20)
+        for Routing, RoutingHeuristic in RoutingHeuristics.items():
+            Compiled, Fallback = BothPaths(MDVRPSolve, Instances, "KMeans", RoutingHeuristic)
+            AssertSameSolution(Compiled, Fallback)
+
+
+def test_DecomposedSolve():
+    Instances = MDVRPModelInstances(400, 3, 20, 3, 100, 100, 20)
+    Compiled, Fallback = BothPaths(DecomposedSolve, Instances, "KMeans", "ClarkeAndWright", 100)
+    AssertSameSolution(Compiled, Fallback)
+    assert Compiled["BorderMerges"] == Fallback["BorderMerges"]
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))